@@ -0,0 +1,103 @@
+"""
+Concat backend benchmark and profile writer for concat.BackendSelector.
+
+Writes a synthetic fragmented-MP4 track (fmp4.py) per case, times every
+backend that's available on this machine (best of --repeat runs, page
+cache warm), then fits each backend's cost model
+
+    seconds = fixed_s + per_segment_s * segments + per_mb_s * megabytes
+
+The fitted profile is what the selector uses to pick a backend for a job.
+Run it on the target device class and ship the result as
+resources/concat_profile.json (or put it in the cache dir).
+
+Usage:
+    python benchmarks/bench_concat.py
+    python benchmarks/bench_concat.py --segments 10 100 400 --segment-size 65536 262144
+    python benchmarks/bench_concat.py --write-profile src/soundloader/resources/concat_profile.json
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE))
+sys.path.insert(0, str(HERE.parent / "src"))
+
+import fmp4  # noqa: E402
+from soundloader import concat  # noqa: E402
+
+
+def write_track(work_dir, segments, segment_size):
+    """Writes init.mp4 + chunk{i}.m4s and returns their paths."""
+    work_dir.mkdir(parents=True, exist_ok=True)
+    init, media = fmp4.track(segments, segment_size)
+    paths = [work_dir / "init.mp4"]
+    paths[0].write_bytes(init)
+    for i, data in enumerate(media, 1):
+        path = work_dir / f"chunk{i}.m4s"
+        path.write_bytes(data)
+        paths.append(path)
+    return paths
+
+
+async def time_backend(backend, paths, output_path, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await backend.concatenate_audio_files(paths, output_path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+async def run(segment_counts, segment_sizes, repeat):
+    backends = [b() for b in concat.BACKENDS if b.available()]
+    samples = {b.name: [] for b in backends}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        for segments in segment_counts:
+            for segment_size in segment_sizes:
+                paths = write_track(tmp / f"{segments}-{segment_size}", segments, segment_size)
+                total_bytes = sum(p.stat().st_size for p in paths)
+                for backend in backends:
+                    seconds = await time_backend(backend, paths, tmp / "out.m4a", repeat)
+                    samples[backend.name].append((len(paths), total_bytes, seconds))
+                    print(f"{backend.name:>8} {len(paths):>6} {total_bytes / 1e6:>9.2f} {seconds * 1000:>10.2f}")
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segments", type=int, nargs="+", default=[10, 50, 200],
+                        help="media segments per track")
+    parser.add_argument("--segment-size", type=int, nargs="+", default=[32 * 1024, 160 * 1024],
+                        help="bytes per media segment")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per case (best is kept)")
+    parser.add_argument("--write-profile", help="write the fitted profile to this path")
+    args = parser.parse_args()
+
+    print(f"{'backend':>8} {'files':>6} {'MB':>9} {'ms':>10}")
+    samples = asyncio.run(run(args.segments, args.segment_size, args.repeat))
+    profile = {name: concat.fit_profile(points) for name, points in samples.items()}
+
+    print()
+    for name, model in profile.items():
+        print(f"{name}: {model['fixed_s'] * 1000:.3f} ms + {model['per_segment_s'] * 1e6:.1f} us/segment"
+              f" + {model['per_mb_s'] * 1000:.3f} ms/MB")
+
+    if args.write_profile:
+        with open(args.write_profile, "w", encoding="utf-8") as f:
+            json.dump({"machine": platform.platform(), "backends": profile}, f, indent=2)
+            f.write("\n")
+        print(f"wrote {args.write_profile}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Memory benchmark for the library index.
+
+Builds libraries of 10k and 100k synthetic tracks and reports the bytes
+allocated per track for the old dict entries and for library.Track records.
+The old entries also held a decoded toga.Image per track; that can't be
+measured without a GUI backend, so the dict numbers here are a lower bound.
+
+Usage: python benchmarks/bench_library_memory.py [count ...]
+"""
+
+import gc
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from soundloader.library import Library, Track  # noqa: E402
+
+STORAGE_DIR = "/var/mobile/Containers/Data/Application/2F6D1C1E-5B7A-4E53-9C1A-2D0C8E6A1B3F/Documents"
+ARTISTS = [f"Artist Name {i}" for i in range(500)]
+
+
+def synthetic_rows(count):
+    """Yields (full_path, filename, title, artist, duration) tuples with freshly built strings."""
+    for i in range(count):
+        title = f"Some Track Title Number {i} (Original Mix)"
+        filename = title.replace(" ", "_") + ".m4a"
+        # build the artist string per row, like a tag reader would
+        artist = "".join(ARTISTS[i % len(ARTISTS)])
+        yield f"{STORAGE_DIR}/{filename}", filename, title, artist, 180.0 + i % 300
+
+
+def build_dicts(count):
+    return [
+        {
+            'filename': filename,
+            'full_path': full_path,
+            'title': title,
+            'artist': artist,
+            'duration': duration,
+            'thumbnail': None,
+        }
+        for full_path, filename, title, artist, duration in synthetic_rows(count)
+    ]
+
+
+def build_library(count):
+    return Library(
+        Track(full_path, filename, title, artist, duration, has_art=True)
+        for full_path, filename, title, artist, duration in synthetic_rows(count)
+    )
+
+
+def measure(builder, count):
+    gc.collect()
+    tracemalloc.start()
+    result = builder(count)
+    current, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current / count
+
+
+def time_ops(entries, search, sort):
+    start = time.perf_counter()
+    search(entries)
+    mid = time.perf_counter()
+    sort(entries)
+    end = time.perf_counter()
+    return (mid - start) * 1000, (end - mid) * 1000
+
+
+def main(counts):
+    print(f"{'entries':>8} {'layout':>8} {'bytes/track':>12} {'filter ms':>10} {'sort ms':>8}")
+    for count in counts:
+        dicts, dict_bytes = measure(build_dicts, count)
+        filter_ms, sort_ms = time_ops(
+            dicts,
+            lambda d: [f for f in d if "mix" in f['filename'].lower()],
+            lambda d: sorted(d, key=lambda f: (f['artist'] or "").lower()),
+        )
+        print(f"{count:>8} {'dict':>8} {dict_bytes:>12.0f} {filter_ms:>10.1f} {sort_ms:>8.1f}")
+        del dicts
+
+        library, track_bytes = measure(build_library, count)
+        filter_ms, sort_ms = time_ops(
+            library,
+            lambda lib: lib.filter("mix"),
+            lambda lib: lib.sorted('artist'),
+        )
+        print(f"{count:>8} {'Track':>8} {track_bytes:>12.0f} {filter_ms:>10.1f} {sort_ms:>8.1f}")
+        del library
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10_000, 100_000])
@@ -0,0 +1,113 @@
+"""
+Library scan benchmark: mp4meta.read_metadata() against TinyTag.get().
+
+Writes a folder of tagged synthetic fragmented tracks (fmp4.py, with a
+cover), then times reading all of them the way the library scan does
+(load_image=False), best of --repeat rounds with the page cache warm.
+TinyTag's duration for these files is printed too: it doesn't look at the
+moof headers, so it can't tell how long a fragmented track is.
+
+With --workers it also times the app's parallel scan, read_metadata() in
+batches on a cpu.CPUExecutor of each given size (processes where the
+platform has them), to see the scan scale with the cores.
+
+Usage:
+    python benchmarks/bench_metadata.py
+    python benchmarks/bench_metadata.py --tracks 500 --segments 90 --segment-size 60000
+    python benchmarks/bench_metadata.py --tracks 2000 --workers 1 2 4 8
+"""
+
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE))
+sys.path.insert(0, str(HERE.parent / "src"))
+
+import fmp4  # noqa: E402
+from soundloader import cpu, mp4meta  # noqa: E402
+
+
+def write_library(folder, tracks, segments, segment_size):
+    from mutagen.mp4 import MP4, MP4Cover
+
+    init, media = fmp4.track(segments, segment_size)
+    # the app saves tracks with no duration in the moov
+    data = fmp4.init_segment(0) + b"".join(media)
+    paths = []
+    for i in range(tracks):
+        path = folder / f"track{i}.m4a"
+        path.write_bytes(data)
+        tags = MP4(path)
+        tags["\xa9nam"] = [f"Track {i}"]
+        tags["\xa9ART"] = ["Artist"]
+        tags["covr"] = [MP4Cover(b"\xff\xd8" + bytes(100_000), MP4Cover.FORMAT_JPEG)]
+        tags.save()
+        paths.append(path)
+    return paths
+
+
+def best_time(read, paths, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in paths:
+            read(path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def best_parallel_time(paths, workers, repeat):
+    executor = cpu.CPUExecutor(max_workers=workers)
+    paths = [str(path) for path in paths]
+
+    async def scan():
+        # once to start the workers, then timed
+        await executor.map(mp4meta.read_metadata, paths[:workers])
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await executor.map(mp4meta.read_metadata, paths)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    try:
+        return asyncio.run(scan()), executor.use_processes
+    finally:
+        executor.shutdown()
+
+
+def main():
+    from tinytag import TinyTag
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tracks", type=int, default=200)
+    parser.add_argument("--segments", type=int, default=90)
+    parser.add_argument("--segment-size", type=int, default=60000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workers", type=int, nargs="*", default=[], help="CPU worker counts for the parallel scan")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = write_library(Path(tmp), args.tracks, args.segments, args.segment_size)
+        ours = best_time(lambda path: mp4meta.read_metadata(path), paths, args.repeat)
+        theirs = best_time(lambda path: TinyTag.get(path), paths, args.repeat)
+        print(f"{args.tracks} tracks of {args.segments} segments")
+        print(f"  mp4meta  {args.tracks / ours:9.0f} files/s  "
+              f"duration {mp4meta.read_metadata(paths[0])['duration']:.2f} s")
+        print(f"  tinytag  {args.tracks / theirs:9.0f} files/s  duration {TinyTag.get(paths[0]).duration:.2f} s")
+        print(f"  speedup  {theirs / ours:.1f}x")
+        for workers in args.workers:
+            elapsed, processes = best_parallel_time(paths, workers, args.repeat)
+            kind = "processes" if processes else "threads"
+            print(f"  cpu tier {args.tracks / elapsed:9.0f} files/s  {workers} {kind}")
+
+
+if __name__ == "__main__":
+    main()
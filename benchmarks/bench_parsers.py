@@ -0,0 +1,204 @@
+"""
+Micro-benchmarks and regression gate for the per-track parsing hot paths.
+
+Times parse_m3u_file, extract_info, extract_player_url, extract_stream_url,
+extract_client_id and sanitize_filename over the corpus in parser_corpus.py.
+Each result is the best per-call time over --repeat rounds, divided by the
+best time of a fixed calibration workload run in the same rounds. The gate
+compares these relative numbers, so a baseline recorded on a laptop still
+means something on CI.
+
+Usage:
+    python benchmarks/bench_parsers.py                     # print timings
+    python benchmarks/bench_parsers.py --check             # exit 1 if a parser regressed
+    python benchmarks/bench_parsers.py --update-baseline   # record new baseline
+    python benchmarks/bench_parsers.py --check --threshold 1.5 --only extract_info
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE))
+sys.path.insert(0, str(HERE.parent / "src"))
+
+import parser_corpus  # noqa: E402
+
+BASELINE_PATH = HERE / "baselines" / "bench_parsers.json"
+# a parser fails the gate when it's this many times slower than its baseline
+DEFAULT_THRESHOLD = 1.25
+# times a flagged case is re-measured before it counts as a regression
+CONFIRM_RUNS = 2
+
+
+def calibration():
+    """A fixed mix of string scanning and interpreter work to normalise timings against."""
+    text = "abcdefghij" * 50_000 + "needle"
+    found = 0
+    for _ in range(20):
+        found += text.find("needle")
+    total = 0
+    for i in range(100_000):
+        total += i % 7
+    return found + total
+
+
+def _calls_per_round(fn, min_time):
+    # pick a call count so a round takes about min_time
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - start >= min_time:
+            return number
+        number *= 2
+
+
+def _round(fn, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return (time.perf_counter() - start) / number
+
+
+def best_times(fn, repeat, min_time=0.05):
+    """
+    Best per-call time in seconds of fn and of the calibration workload,
+    over repeat interleaved rounds, so both see the same machine load.
+    """
+    number = _calls_per_round(fn, min_time)
+    calibration_number = _calls_per_round(calibration, min_time)
+    best = best_calibration = float("inf")
+    for _ in range(repeat):
+        best = min(best, _round(fn, number))
+        best_calibration = min(best_calibration, _round(calibration, calibration_number))
+    return best, best_calibration
+
+
+def build_cases(work_dir):
+    from soundloader import pipeline
+
+    page = parser_corpus.track_page()
+    bundle = parser_corpus.js_bundle()
+    titles = parser_corpus.titles()
+    playlist_path = os.path.join(work_dir, "playlist.m3u8")
+    with open(playlist_path, "w", encoding="utf-8") as f:
+        f.write(parser_corpus.playlist())
+
+    return {
+        "parse_m3u_file": lambda: pipeline.parse_m3u_file(playlist_path),
+        "extract_info": lambda: pipeline.extract_info(page),
+        "extract_player_url": lambda: pipeline.extract_player_url(page),
+        "extract_stream_url": lambda: pipeline.extract_stream_url(page),
+        "extract_client_id": lambda: pipeline.extract_client_id(bundle),
+        "sanitize_filename": lambda: [pipeline.sanitize_filename(t) for t in titles],
+    }
+
+
+def run(repeat, only=None):
+    from soundloader import log
+
+    # the parsers log at debug; keep formatting out of the measurement
+    log.configure(level="WARNING")
+    results = {"cases": {}}
+    with tempfile.TemporaryDirectory(prefix="bench_parsers_") as work_dir:
+        for name, fn in build_cases(work_dir).items():
+            if only and name not in only:
+                continue
+            seconds, calibration_seconds = best_times(fn, repeat)
+            results["cases"][name] = {"seconds": seconds, "calibration_s": calibration_seconds,
+                                      "relative": seconds / calibration_seconds}
+    return results
+
+
+def run_fresh(repeat, only):
+    """Runs the given cases in a new interpreter and returns its results."""
+    output = subprocess.run([sys.executable, __file__, "--raw", "--repeat", str(repeat), "--only", *only],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def compare(results, baseline, threshold):
+    """Returns (lines, regressions) comparing results with the baseline."""
+    # the baseline column is the baseline's relative time on this machine's calibration
+    lines = [f"{'case':<22} {'µs/call':>10} {'baseline':>10} {'ratio':>7}"]
+    regressions = []
+    for name, case in results["cases"].items():
+        base = baseline.get("cases", {}).get(name)
+        if base is None:
+            lines.append(f"{name:<22} {case['seconds'] * 1e6:>10.1f} {'-':>10} {'new':>7}")
+            continue
+        ratio = case["relative"] / base["relative"]
+        flag = "  REGRESSION" if ratio > threshold else ""
+        lines.append(f"{name:<22} {case['seconds'] * 1e6:>10.1f} "
+                     f"{base['relative'] * case['calibration_s'] * 1e6:>10.1f} {ratio:>7.2f}{flag}")
+        if ratio > threshold:
+            regressions.append(name)
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=7, help="rounds per case (best is kept)")
+    parser.add_argument("--only", nargs="+", help="run only these cases")
+    parser.add_argument("--check", action="store_true", help="compare with the baseline and fail on regressions")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"allowed slowdown factor (default {DEFAULT_THRESHOLD})")
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    # internal: print the raw results as JSON (used by run_fresh)
+    parser.add_argument("--raw", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    results = run(args.repeat, args.only)
+    if args.raw:
+        print(json.dumps(results))
+        return 0
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    lines, regressions = compare(results, baseline, args.threshold)
+    # a noisy round (or a slow interpreter layout) shouldn't fail the gate:
+    # re-measure flagged cases in a fresh interpreter and keep their best
+    for _ in range(CONFIRM_RUNS):
+        if not regressions:
+            break
+        retry = run_fresh(args.repeat * 2, regressions)
+        for name, case in retry["cases"].items():
+            if case["relative"] < results["cases"][name]["relative"]:
+                results["cases"][name] = case
+        lines, regressions = compare(results, baseline, args.threshold)
+    print("\n".join(lines))
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        # keep cases that weren't re-run this time
+        cases = dict(baseline.get("cases", {}))
+        cases.update(results["cases"])
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "cases": cases}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+
+    if args.check:
+        if not baseline:
+            print(f"no baseline at {args.baseline}; run with --update-baseline first")
+            return 2
+        if regressions:
+            print(f"FAILED: {', '.join(regressions)} slower than {args.threshold:.2f}x baseline")
+            return 1
+        print(f"OK: no parser slower than {args.threshold:.2f}x baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+End-to-end throughput of the download pipeline against the local HLS stand-in.
+
+For every combination of segment count and concurrency, a fresh interpreter
+resolves, downloads, concatenates and tags --tracks tracks through
+soundloader.pipeline (so peak RSS is per configuration), with all HTTP
+routed to benchmarks/hls_standin.py. Reports tracks/min, MB/s, p50/p99
+time-to-file, p50 time-to-preview (resolve done) and peak RSS.
+
+Usage:
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --segments 10 100 --concurrency 1 4 16 --latency 0.03 --jitter 0.01
+    python benchmarks/bench_pipeline.py --bandwidth 2000000 --error-rate 0.01 --json results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE))
+sys.path.insert(0, str(HERE.parent / "src"))
+
+import hls_standin  # noqa: E402
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def run_tracks(base_url, tracks, concurrency, work_dir):
+    from soundloader import net, pipeline
+
+    net.use_transport(hls_standin.rewrite_transport(base_url))
+    dest_dir = Path(work_dir) / "out"
+    temp_root = Path(work_dir) / "temp"
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    semaphore = asyncio.Semaphore(concurrency)
+    times, previews, sizes, failures = [], [], [], []
+
+    async def one(n):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                job = await pipeline.resolve_track(f"https://soundcloud.com/bench/track-{n}")
+                previews.append(time.perf_counter() - start)
+                path = await pipeline.download_track(job, temp_root / job.job_id, dest_dir)
+                times.append(time.perf_counter() - start)
+                sizes.append(os.path.getsize(path))
+            except Exception as e:
+                failures.append(f"track-{n}: {e}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(n) for n in range(1, tracks + 1)))
+    wall = time.perf_counter() - start
+    await net.aclose_client()
+    return wall, times, previews, sizes, failures
+
+
+def run_single(args):
+    """Child process: runs one configuration and prints its result as JSON."""
+    from soundloader import log
+
+    log.configure(level="WARNING")
+    with tempfile.TemporaryDirectory(prefix="bench_pipeline_") as work_dir:
+        wall, times, previews, sizes, failures = asyncio.run(
+            run_tracks(args.base_url, args.tracks, args.single_concurrency, work_dir))
+    total_mb = sum(sizes) / (1024 * 1024)
+    print(json.dumps({
+        "tracks": args.tracks,
+        "ok": len(times),
+        "failed": len(failures),
+        "failures": failures[:5],
+        "wall_s": wall,
+        "tracks_per_min": len(times) / wall * 60 if wall else 0.0,
+        "mb_per_s": total_mb / wall if wall else 0.0,
+        "p50_s": percentile(times, 50),
+        "p99_s": percentile(times, 99),
+        "mean_s": statistics.mean(times) if times else 0.0,
+        "preview_p50_s": percentile(previews, 50),
+        "peak_rss_mb": peak_rss_mb(),
+    }))
+
+
+def run_config(base_url, tracks, concurrency):
+    result = subprocess.run(
+        [sys.executable, __file__, "--single", "--base-url", base_url, "--tracks", str(tracks),
+         "--single-concurrency", str(concurrency)],
+        capture_output=True, text=True, check=False)
+    if result.returncode != 0:
+        raise RuntimeError(f"benchmark child failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    hls_standin.add_config_arguments(parser, segments=False)
+    parser.add_argument("--segments", type=int, nargs="+", default=[10, 50], help="segment counts to try")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4], help="tracks in flight")
+    parser.add_argument("--tracks", type=int, default=8, help="tracks per configuration")
+    parser.add_argument("--json", help="also write the results to this file")
+    # internal: run one configuration in this process
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    parser.add_argument("--single-concurrency", type=int, default=1, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single(args)
+        return
+
+    print(f"{'segments':>8} {'conc':>5} {'ok':>5} {'tracks/min':>11} {'MB/s':>8} "
+          f"{'preview':>8} {'p50 s':>8} {'p99 s':>8} {'peak RSS MB':>12}")
+    results = []
+    for segments in args.segments:
+        config = hls_standin.config_from_args(args)
+        config.segments = segments
+        config.seed = args.seed + segments
+        server = hls_standin.StandInServer(config).run_in_thread()
+        try:
+            for concurrency in args.concurrency:
+                r = run_config(server.base_url, args.tracks, concurrency)
+                r.update(segments=segments, concurrency=concurrency)
+                results.append(r)
+                print(f"{segments:>8} {concurrency:>5} {r['ok']:>2}/{r['tracks']:<2} {r['tracks_per_min']:>11.1f} "
+                      f"{r['mb_per_s']:>8.2f} {r['preview_p50_s']:>8.3f} {r['p50_s']:>8.3f} {r['p99_s']:>8.3f} {r['peak_rss_mb']:>12.1f}")
+                for failure in r["failures"]:
+                    print(f"{'':>14} failed {failure}")
+        finally:
+            server.stop_thread()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
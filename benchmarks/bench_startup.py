@@ -0,0 +1,104 @@
+"""
+Startup benchmark.
+
+Imports the app module in fresh interpreters and reports:
+  * wall time for the import (median of several runs),
+  * an `-X importtime` breakdown of the slowest top-level imports,
+  * which of the heavy optional modules were pulled in at startup.
+
+Usage: python benchmarks/bench_startup.py [--module soundloader.app] [--runs 5] [--top 15]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+
+# modules that should only load once the first request/tag read happens
+HEAVY_MODULES = ["aiohttp", "httpx", "requests", "urllib3", "mutagen", "tinytag"]
+
+
+def run_python(args, env):
+    return subprocess.run([sys.executable] + args, env=env, capture_output=True, text=True)
+
+
+def make_env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(SRC_DIR), env.get("PYTHONPATH")]))
+    # compile once up front so we time imports, not bytecode generation
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+
+def time_import(module, runs, env):
+    """Returns wall-clock seconds for `import module` in fresh interpreters."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = run_python(["-c", f"import {module}"], env)
+        samples.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            raise SystemExit(f"import {module} failed:\n{result.stderr}")
+    return samples
+
+
+def import_report(module, env):
+    """
+    Runs `python -X importtime -c "import module"` and parses its output.
+
+    :return: A list of (self_us, cumulative_us, depth, name) tuples.
+    """
+    result = run_python(["-X", "importtime", "-c", f"import {module}"], env)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        # nested imports are indented by two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return rows
+
+
+def loaded_modules(module, env):
+    code = f"import sys, {module}; print('\\n'.join(sys.modules))"
+    result = run_python(["-c", code], env)
+    return set(result.stdout.split())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="soundloader.app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    env = make_env()
+    # warm the bytecode cache
+    run_python(["-c", f"import {args.module}"], env)
+
+    samples = time_import(args.module, args.runs, env)
+    baseline = time_import("sys", args.runs, env)
+    print(f"import {args.module}: median {statistics.median(samples) * 1000:.1f} ms "
+          f"(interpreter alone {statistics.median(baseline) * 1000:.1f} ms, {args.runs} runs)")
+
+    rows = import_report(args.module, env)
+    total = sum(r[0] for r in rows)
+    print(f"\n-X importtime: {len(rows)} modules, {total / 1000:.1f} ms self time")
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    top_level = sorted((r for r in rows if r[2] <= 1), key=lambda r: r[1], reverse=True)
+    for self_us, cumulative_us, _depth, name in top_level[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>8.1f}  {name}")
+
+    modules = loaded_modules(args.module, env)
+    eager = [m for m in HEAVY_MODULES if m in modules]
+    print(f"\nheavy modules loaded at startup: {', '.join(eager) if eager else 'none'}")
+
+
+if __name__ == "__main__":
+    main()
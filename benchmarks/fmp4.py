@@ -0,0 +1,104 @@
+"""
+Synthetic fragmented MP4 (AAC audio) for the stand-in server and benchmarks.
+
+init_segment() builds an ftyp + moov with one AAC track, media_segment()
+builds a moof + mdat fragment filled with pseudo-random payload. Concatenated
+they form a file that mutagen (and the app's own readers) can parse and tag,
+which is all the pipeline needs; the audio itself is noise.
+"""
+
+import random
+import struct
+
+TIMESCALE = 44100
+# AAC frames carry 1024 samples
+SAMPLE_DURATION = 1024
+TRACK_ID = 1
+
+_IDENTITY_MATRIX = struct.pack(">9I", 0x00010000, 0, 0, 0, 0x00010000, 0, 0, 0, 0x40000000)
+
+
+def box(kind, *payload):
+    data = b"".join(payload)
+    return struct.pack(">I4s", 8 + len(data), kind) + data
+
+
+def full_box(kind, version, flags, *payload):
+    return box(kind, struct.pack(">I", (version << 24) | flags), *payload)
+
+
+def _descriptor(tag, payload):
+    # MPEG-4 descriptors use a variable length size; 4 bytes always fits
+    size = len(payload)
+    length = bytes([0x80 | ((size >> 21) & 0x7F), 0x80 | ((size >> 14) & 0x7F),
+                    0x80 | ((size >> 7) & 0x7F), size & 0x7F])
+    return bytes([tag]) + length + payload
+
+
+def _esds(bitrate):
+    # AudioSpecificConfig: AAC LC, 44.1 kHz, stereo
+    decoder_specific = _descriptor(0x05, b"\x12\x10")
+    decoder_config = _descriptor(0x04, struct.pack(">BB3sII", 0x40, 0x15, b"\x00\x00\x00", bitrate, bitrate)
+                                 + decoder_specific)
+    sl_config = _descriptor(0x06, b"\x02")
+    return full_box(b"esds", 0, 0, _descriptor(0x03, struct.pack(">HB", 1, 0) + decoder_config + sl_config))
+
+
+def init_segment(duration_seconds=0, bitrate=128000):
+    """Returns the initialisation segment (ftyp + moov) for a stereo AAC track."""
+    duration = int(duration_seconds * TIMESCALE)
+    ftyp = box(b"ftyp", b"M4A ", struct.pack(">I", 0), b"M4A ", b"isomiso6mp41")
+    mvhd = full_box(b"mvhd", 0, 0, struct.pack(">IIII", 0, 0, TIMESCALE, duration),
+                    struct.pack(">IH10x", 0x00010000, 0x0100), _IDENTITY_MATRIX, bytes(24),
+                    struct.pack(">I", TRACK_ID + 1))
+    tkhd = full_box(b"tkhd", 0, 7, struct.pack(">IIIII", 0, 0, TRACK_ID, 0, duration), bytes(8),
+                    struct.pack(">hhHH", 0, 0, 0x0100, 0), _IDENTITY_MATRIX, struct.pack(">II", 0, 0))
+    mdhd = full_box(b"mdhd", 0, 0, struct.pack(">IIIIHH", 0, 0, TIMESCALE, duration, 0x55C4, 0))
+    hdlr = full_box(b"hdlr", 0, 0, struct.pack(">I4s12x", 0, b"soun"), b"SoundHandler\x00")
+    mp4a = box(b"mp4a", bytes(6), struct.pack(">H", 1), bytes(8),
+               struct.pack(">HHHHI", 2, 16, 0, 0, TIMESCALE << 16), _esds(bitrate))
+    stbl = box(b"stbl",
+               full_box(b"stsd", 0, 0, struct.pack(">I", 1), mp4a),
+               full_box(b"stts", 0, 0, struct.pack(">I", 0)),
+               full_box(b"stsc", 0, 0, struct.pack(">I", 0)),
+               full_box(b"stsz", 0, 0, struct.pack(">II", 0, 0)),
+               full_box(b"stco", 0, 0, struct.pack(">I", 0)))
+    dinf = box(b"dinf", full_box(b"dref", 0, 0, struct.pack(">I", 1), full_box(b"url ", 0, 1)))
+    minf = box(b"minf", full_box(b"smhd", 0, 0, struct.pack(">hH", 0, 0)), dinf, stbl)
+    trak = box(b"trak", tkhd, box(b"mdia", mdhd, hdlr, minf))
+    mvex = box(b"mvex", full_box(b"trex", 0, 0, struct.pack(">IIIII", TRACK_ID, 1, SAMPLE_DURATION, 0, 0)))
+    return ftyp + box(b"moov", mvhd, trak, mvex)
+
+
+def media_segment(sequence, payload_size, sample_size=372, seed=None):
+    """
+    Returns one fragment (moof + mdat) of roughly payload_size bytes of audio data.
+
+    :param sequence: Fragment sequence number (1-based); also sets the decode time.
+    :param payload_size: Bytes in the mdat payload.
+    :param sample_size: Bytes per AAC frame (372 is about 128 kbit/s).
+    :param seed: Seed for the payload bytes (defaults to the sequence number).
+    """
+    rng = random.Random(sequence if seed is None else seed)
+    payload = rng.randbytes(payload_size)
+    sizes = [sample_size] * (payload_size // sample_size)
+    if payload_size % sample_size:
+        sizes.append(payload_size % sample_size)
+
+    def build_moof(data_offset):
+        trun = full_box(b"trun", 0, 0x000001 | 0x000200, struct.pack(">Ii", len(sizes), data_offset),
+                        struct.pack(f">{len(sizes)}I", *sizes))
+        tfhd = full_box(b"tfhd", 0, 0x020000 | 0x000008, struct.pack(">II", TRACK_ID, SAMPLE_DURATION))
+        tfdt = full_box(b"tfdt", 1, 0, struct.pack(">Q", (sequence - 1) * len(sizes) * SAMPLE_DURATION))
+        return box(b"moof", full_box(b"mfhd", 0, 0, struct.pack(">I", sequence)), box(b"traf", tfhd, tfdt, trun))
+
+    # the data offset counts from the start of the moof to the first payload byte
+    moof_size = len(build_moof(0))
+    return build_moof(moof_size + 8) + box(b"mdat", payload)
+
+
+def track(segment_count, segment_size, sample_size=372):
+    """Returns (init segment, [media segments]) for a whole track."""
+    segments = [media_segment(i + 1, segment_size, sample_size) for i in range(segment_count)]
+    frames = sum(-(-segment_size // sample_size) for _ in range(segment_count))
+    return init_segment(frames * SAMPLE_DURATION / TIMESCALE), segments
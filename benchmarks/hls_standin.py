@@ -0,0 +1,258 @@
+"""
+Local stand-in for the track page, client_id asset, stream API, HLS
+playlist, segment CDN and artwork host.
+
+Every track is served at /bench/track-<n>; its page, stream JSON and
+playlist point at the real host names, and RewriteTransport sends all of
+them to this server instead, so the pipeline runs unmodified. Latency,
+jitter, bandwidth and error injection are configurable per server.
+
+Run it standalone to poke at it with curl:
+    python benchmarks/hls_standin.py --segments 20 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import random
+import threading
+
+from aiohttp import web
+
+import fmp4
+
+CLIENT_ID = "BenchClientId0123456789abcdef"
+SEGMENT_HOST = "https://cf-hls-media.sndcdn.com"
+# chunk size used when throttling a response to the configured bandwidth
+THROTTLE_CHUNK = 16 * 1024
+# a minimal JPEG (SOI ... EOI); the pipeline never decodes the artwork
+ARTWORK = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00" + bytes(2048) + b"\xff\xd9"
+
+TRACK_PAGE = """<!DOCTYPE html>
+<html><head>
+<meta property="twitter:player" content="https://w.soundcloud.com/player/?url=https%3A%2F%2Fapi.soundcloud.com%2Ftracks%2F{track_id}&amp;auto_play=false">
+<meta property="twitter:title" content="Bench Track {n}">
+<meta property="twitter:image" content="https://i1.sndcdn.com/artworks-{track_id}-large.jpg">
+</head><body>
+<h1 itemprop="name"><a itemprop="url" href="/bench/track-{n}">Bench Track {n}</a>
+by <a href="/bench">Bench Artist</a></h1>
+<meta itemprop="duration" content="PT00H01M00S">
+<script>window.__sc_hydration = [{{"transcodings": [{{"url": "https://api-v2.soundcloud.com/media/soundcloud:tracks:{track_id}/stream/hls", "format": {{"protocol": "hls"}}}}]}}];</script>
+</body></html>
+"""
+
+
+class StandInConfig:
+    """
+    Knobs of the stand-in server.
+
+    :param segments: Media segments per track (plus the init segment).
+    :param segment_size: Payload bytes per media segment.
+    :param latency: Seconds added before every response.
+    :param jitter: Up to this many seconds added to or removed from the latency.
+    :param bandwidth: Bytes per second per response (0 = unthrottled).
+    :param error_rate: Probability that a segment request fails with a 503.
+    :param seed: Seed for jitter and error injection, so runs are repeatable.
+    """
+
+    def __init__(self, segments=20, segment_size=64 * 1024, latency=0.0, jitter=0.0,
+                 bandwidth=0, error_rate=0.0, seed=1):
+        self.segments = segments
+        self.segment_size = segment_size
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.seed = seed
+
+
+class StandInServer:
+    """
+    aiohttp application serving the fake hosts. Use start()/stop() inside a
+    running loop, or run_in_thread() to serve from a background thread.
+    """
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or StandInConfig()
+        self.host = host
+        self.port = port
+        self.rng = random.Random(self.config.seed)
+        # every track shares the same media, so serving costs no CPU per request
+        self.init, self.media = fmp4.track(self.config.segments, self.config.segment_size)
+        self.requests = 0
+        self.errors_injected = 0
+        self._runner = None
+        self._thread = None
+        self._loop = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def track_url(self, n):
+        """Public URL of track n, as the user would paste it."""
+        return f"https://soundcloud.com/bench/track-{n}"
+
+    def make_app(self):
+        app = web.Application(middlewares=[self._delay_middleware])
+        app.router.add_get("/bench/track-{n:\\d+}", self.track_page)
+        app.router.add_get("/assets/{name}", self.client_id_asset)
+        app.router.add_get("/media/soundcloud:tracks:{track_id:\\d+}/stream/hls", self.stream_json)
+        app.router.add_get("/playlist/{track_id:\\d+}/playlist.m3u8", self.playlist)
+        app.router.add_get("/hls/{track_id:\\d+}/init.mp4", self.init_segment)
+        app.router.add_get("/hls/{track_id:\\d+}/{index:\\d+}.m4s", self.media_segment)
+        app.router.add_get("/artworks-{rest}", self.artwork)
+        return app
+
+    # ------------------- HANDLERS -------------------
+    @web.middleware
+    async def _delay_middleware(self, request, handler):
+        self.requests += 1
+        config = self.config
+        delay = config.latency + (self.rng.uniform(-config.jitter, config.jitter) if config.jitter else 0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return await handler(request)
+
+    async def track_page(self, request):
+        n = int(request.match_info["n"])
+        return web.Response(text=TRACK_PAGE.format(n=n, track_id=100000 + n), content_type="text/html")
+
+    async def client_id_asset(self, request):
+        body = ('(self.webpackChunk=self.webpackChunk||[]).push([[0],{1:function(e){e.exports='
+                f'{{apiUrl:"https://api-v2.soundcloud.com/?client_id={CLIENT_ID}",version:"1"}}}}}}]);')
+        return web.Response(text=body, content_type="application/javascript")
+
+    async def stream_json(self, request):
+        track_id = request.match_info["track_id"]
+        if request.query.get("client_id") != CLIENT_ID:
+            raise web.HTTPUnauthorized()
+        url = f"{SEGMENT_HOST}/playlist/{track_id}/playlist.m3u8?Policy=bench"
+        return web.json_response({"url": url})
+
+    async def playlist(self, request):
+        track_id = request.match_info["track_id"]
+        lines = ["#EXTM3U", "#EXT-X-VERSION:6", "#EXT-X-TARGETDURATION:10", "#EXT-X-PLAYLIST-TYPE:VOD",
+                 f'#EXT-X-MAP:URI="{SEGMENT_HOST}/hls/{track_id}/init.mp4"']
+        for i in range(self.config.segments):
+            lines.append("#EXTINF:10.0,")
+            lines.append(f"{SEGMENT_HOST}/hls/{track_id}/{i + 1}.m4s")
+        lines.append("#EXT-X-ENDLIST")
+        return web.Response(text="\n".join(lines) + "\n", content_type="application/vnd.apple.mpegurl")
+
+    async def init_segment(self, request):
+        return await self._send(request, self.init, "video/mp4")
+
+    async def media_segment(self, request):
+        index = int(request.match_info["index"])
+        if not 1 <= index <= len(self.media):
+            raise web.HTTPNotFound()
+        if self.config.error_rate and self.rng.random() < self.config.error_rate:
+            self.errors_injected += 1
+            raise web.HTTPServiceUnavailable()
+        return await self._send(request, self.media[index - 1], "video/iso.segment")
+
+    async def artwork(self, request):
+        return await self._send(request, ARTWORK, "image/jpeg")
+
+    async def _send(self, request, data, content_type):
+        if not self.config.bandwidth:
+            return web.Response(body=data, content_type=content_type)
+        # throttle by pacing fixed size chunks
+        response = web.StreamResponse(headers={"Content-Type": content_type})
+        response.content_length = len(data)
+        await response.prepare(request)
+        view = memoryview(data)
+        for start in range(0, len(data), THROTTLE_CHUNK):
+            chunk = view[start:start + THROTTLE_CHUNK]
+            await response.write(chunk)
+            await asyncio.sleep(len(chunk) / self.config.bandwidth)
+        await response.write_eof()
+        return response
+
+    # ------------------- LIFECYCLE -------------------
+    async def start(self):
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # pick up the real port when port=0 asked for a free one
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def run_in_thread(self):
+        """Starts the server on a background thread with its own loop. Returns once it's listening."""
+        ready = threading.Event()
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            ready.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.stop())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=serve, name="hls-standin", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop_thread(self):
+        if self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+
+
+def rewrite_transport(base_url, **kwargs):
+    """
+    Returns an httpx transport that sends every request to base_url, keeping
+    the path and query. Install it with soundloader.net.use_transport().
+    """
+    import httpx
+
+    target = httpx.URL(base_url)
+
+    class RewriteTransport(httpx.AsyncHTTPTransport):
+        async def handle_async_request(self, request):
+            request.url = request.url.copy_with(scheme=target.scheme, host=target.host, port=target.port)
+            return await super().handle_async_request(request)
+
+    return RewriteTransport(**kwargs)
+
+
+def add_config_arguments(parser, segments=True):
+    if segments:
+        parser.add_argument("--segments", type=int, default=20, help="media segments per track")
+    parser.add_argument("--segment-size", type=int, default=64 * 1024, help="bytes per media segment")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds of random latency")
+    parser.add_argument("--bandwidth", type=float, default=0, help="bytes/s per response (0 = unthrottled)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of a 503 per segment")
+    parser.add_argument("--seed", type=int, default=1)
+
+
+def config_from_args(args):
+    return StandInConfig(segments=getattr(args, "segments", 20), segment_size=args.segment_size, latency=args.latency,
+                         jitter=args.jitter, bandwidth=args.bandwidth, error_rate=args.error_rate,
+                         seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_config_arguments(parser)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = StandInServer(config_from_args(args), port=args.port)
+    web.run_app(server.make_app(), host=server.host, port=server.port, access_log=None,
+                print=lambda *_: print(f"stand-in listening on {server.base_url}, "
+                                       f"e.g. curl {server.base_url}/bench/track-1"))
+
+
+if __name__ == "__main__":
+    main()
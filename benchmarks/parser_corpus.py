@@ -0,0 +1,106 @@
+"""
+Corpus for the parser micro-benchmarks.
+
+We can't ship captured pages, so these builders generate inputs with the
+shape and size of the real ones, and with the markers where the real ones
+put them. A track page is ~550 KB: the meta tags are in the head, the h1
+comes after a big inline style block, and the hydration JSON (stream URLs)
+sits near the end. The app JS bundle is ~1.6 MB with the client_id
+two-thirds of the way in. An HLS playlist for a one hour track has 360
+signed segment URLs. Everything is seeded, so the corpus is identical on
+every run.
+"""
+
+import random
+import string
+
+SEED = 20251019
+TRACK_ID = "1893456721"
+CLIENT_ID = "nIjtjiYnjkOhMyh5xrbqEA1XxhAdZbRk"
+
+
+def _filler(rng, size, alphabet=string.ascii_letters + string.digits + " <>/=\"':;,.{}-_"):
+    return "".join(rng.choices(alphabet, k=size))
+
+
+def _css(rng, size):
+    rules = []
+    total = 0
+    while total < size:
+        rule = f".sc-{rng.randrange(10 ** 6):06x}{{margin:{rng.randrange(40)}px;color:#{rng.randrange(16 ** 6):06x}}}"
+        rules.append(rule)
+        total += len(rule)
+    return "".join(rules)
+
+
+def _hydration(rng, size):
+    entries = []
+    total = 0
+    while total < size:
+        entry = ('{"id":%d,"kind":"user","permalink":"user-%d","avatar_url":"https://i1.sndcdn.com/avatars-%s-large.jpg",'
+                 '"followers_count":%d,"description":"%s"}'
+                 % (rng.randrange(10 ** 9), rng.randrange(10 ** 6), _filler(rng, 16, string.ascii_letters),
+                    rng.randrange(10 ** 5), _filler(rng, 120, string.ascii_letters + " ")))
+        entries.append(entry)
+        total += len(entry)
+    return ",".join(entries)
+
+
+def track_page(size=550_000, seed=SEED):
+    """Returns the HTML of a track page of about size characters."""
+    rng = random.Random(seed)
+    head = (
+        '<!DOCTYPE html><html lang="en"><head><meta charset="utf-8">'
+        f'<meta property="twitter:player" content="https://w.soundcloud.com/player/?url=https%3A%2F%2Fapi.soundcloud.com%2Ftracks%2F{TRACK_ID}&amp;auto_play=false&amp;show_artwork=true&amp;visual=true&amp;origin=twitter">'
+        '<meta property="twitter:title" content="Nightdrive (Extended Mix) [Free DL] ~ feat. Ünïcødé Artist">'
+        f'<meta property="twitter:image" content="https://i1.sndcdn.com/artworks-{_filler(rng, 16, string.ascii_letters)}-t500x500.jpg">'
+    )
+    style = "<style>" + _css(rng, int(size * 0.45)) + "</style></head><body>"
+    h1 = ('<noscript><article><header><h1 itemprop="name"><a itemprop="url" href="/artist/nightdrive">'
+          'Nightdrive (Extended Mix)</a> by <a href="/artist">Some Artist</a></h1>'
+          '<meta itemprop="duration" content="PT01H02M11S"/></header></article></noscript>')
+    hydration = ('<script>window.__sc_hydration = [' + _hydration(rng, int(size * 0.5)) +
+                 ',{"hydratable":"sound","data":{"media":{"transcodings":['
+                 f'{{"url":"https://api-v2.soundcloud.com/media/soundcloud:tracks:{TRACK_ID}/stream/hls",'
+                 '"preset":"aac_160k","format":{"protocol":"hls","mime_type":"audio/mp4; codecs=\\"mp4a.40.2\\""}},'
+                 f'{{"url":"https://api-v2.soundcloud.com/media/soundcloud:tracks:{TRACK_ID}/stream/progressive",'
+                 '"format":{"protocol":"progressive","mime_type":"audio/mpeg"}}]}}}];</script>')
+    page = head + style + h1 + hydration
+    return page + "<footer>" + _filler(rng, max(0, size - len(page) - 30)) + "</footer></body></html>"
+
+
+def js_bundle(size=1_600_000, seed=SEED):
+    """Returns an app JS bundle of about size characters with one client_id in it."""
+    rng = random.Random(seed + 1)
+    marker = int(size * 2 / 3)
+    body = _filler(rng, marker, string.ascii_letters + string.digits + "(){}[];,.=+-*/!?:'& \n")
+    client = f'var n={{apiUrl:"https://api-v2.soundcloud.com/?client_id={CLIENT_ID}",appVersion:"1759307428"}};'
+    return body + client + _filler(rng, max(0, size - marker - len(client)),
+                                   string.ascii_letters + string.digits + "(){}[];,.=+-*/!?:'& \n")
+
+
+def playlist(segments=360, seed=SEED):
+    """Returns an HLS media playlist with an init segment and signed segment URLs."""
+    rng = random.Random(seed + 2)
+    base = f"https://cf-hls-media.sndcdn.com/media/{TRACK_ID}/{_filler(rng, 12, string.ascii_letters)}"
+
+    def signed(path):
+        return (f"{base}/{path}?Policy={_filler(rng, 160, string.ascii_letters + string.digits)}"
+                f"&Signature={_filler(rng, 170, string.ascii_letters + string.digits + '~-')}"
+                f"&Key-Pair-Id=APKAI6TU7MMXM5DG6EPQ")
+
+    lines = ["#EXTM3U", "#EXT-X-VERSION:6", "#EXT-X-PLAYLIST-TYPE:VOD", "#EXT-X-TARGETDURATION:10",
+             "#EXT-X-MEDIA-SEQUENCE:0", f'#EXT-X-MAP:URI="{signed("init.mp4")}"']
+    for i in range(segments):
+        lines.append("#EXTINF:9.984,")
+        lines.append(signed(f"{i}.m4s"))
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+def titles(count=200, seed=SEED):
+    """Returns track titles like the ones sanitize_filename sees (symbols, accents, emoji)."""
+    rng = random.Random(seed + 3)
+    words = ["Nightdrive", "Remix", "feat.", "Ünïcødé", "(Extended)", "[Free DL]", "Ħëłłø", "🔥", "&", "w/",
+             "Mix #2", "Vol. 3", "Ça va?", "東京", "<Live>", "a/b", "100%", "Edit!", "...", "Bass\\Line"]
+    return [" ".join(rng.choices(words, k=rng.randrange(3, 12))) for _ in range(count)]
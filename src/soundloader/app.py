@@ -5,26 +5,24 @@ A Cloud-to-MP3 Downloader for IOS
 import toga
 from pathlib import Path
 import asyncio
-import aiohttp
-from aiohttp import ClientConnectorError
-import httpx
 import shutil
-import re
 import sys
 import os
-import requests
-import urllib3
-from urllib3.exceptions import InsecureRequestWarning
-from io import BytesIO
 from toga.style import Pack
 from toga.style.pack import COLUMN, ROW, LEFT, CENTER, RIGHT
 from toga.validators import MinLength, StartsWith, Contains
-from mutagen.mp4 import MP4, MP4Cover
-from tinytag import TinyTag
 import io
-from toga.sources import ListSource, Row
+import uuid
+from soundloader import cache, concat, cpu, expand, fingerprint, loopback, mp4meta, net, pipeline, preflight, ratelimit, scheduler, scratch, speculate, tracing, watcher
+from soundloader.fileio import get_io_executor
+from soundloader.log import get_logger
+from soundloader.library import Library, Track
+from soundloader.timing import StageTimer
+
+logger = get_logger(__name__)
 
 # ios imports
+NATIVE_AUDIO_SUPPORT = False
 if sys.platform == 'ios':
     from rubicon.objc import ObjCClass
     NSURL = ObjCClass("NSURL")
@@ -35,31 +33,14 @@ if sys.platform == 'ios':
     AVAudioSessionCategoryPlayback = 'AVAudioSessionCategoryPlayback'
     NATIVE_AUDIO_SUPPORT = True
     
-# global constants
-TWITTER_PLAYER = "twitter:player"
-TWITTER_TITLE = "twitter:title"
-STREAM_URL_BEGIN = "https://api-v2.soundcloud.com/media/soundcloud:tracks:"
-STREAM_URL_END = "/stream/hls"
-BASE_URL_THUMBNAIL = "i1.sndcdn.com/a"
-STREAM_ID_BEGIN = "media/soundcloud:tracks:"
-STREAM_ID_END = "/stream"
-FLAG_CLIENT_ID = "client_id:u?"
-TEST_STREAM_ID = "151531814"
-
-# global variables
-player_url = ""
-client_id = ""
-stream_url = ""
-full_stream_url = ""
-playlist_url = ""
-chunk_urls = [""]
-track_filename = ""
-thumbnail_filename = ""
-thumbnail_url = ""
-track_title = ""
-track_artist = ""
 _audio_thumbnail_image = None
 
+# bytes of a download that have to be in before it can be played (init + first segments)
+EARLY_PLAYBACK_BYTES = 512 * 1024
+# job traces kept in the cache dir (the newest ones), and for how long at most
+TRACES_KEPT = 50
+TRACE_MAX_AGE = 7 * 24 * 60 * 60
+
 
 # TODO load a file from self.app.paths.app using toga.Image.
 def get_thumbnail_placeholder():
@@ -71,21 +52,34 @@ def get_thumbnail_placeholder():
             # You might need to adjust the path based on your project structure.
             _audio_thumbnail_image = toga.Image("resources/placeholder_trans_grey.png")
         except Exception as e:
-            print(f"Error loading thumbnail image: {e}")
+            logger.error("Error loading thumbnail image: %s", e)
             # Fallback if image loading fails
             _audio_thumbnail_image = None # Or provide a default blank image
 
     return _audio_thumbnail_image
 
 
-def get_m4a_metadata(file_path):
+def get_m4a_metadata(file_path, load_image=True):
     """
-    Extracts metadata, duration, and thumbnail from an M4A file.
+    Extracts metadata, duration, and thumbnail from an M4A file, with
+    mp4meta.read_metadata() and TinyTag for whatever it can't read.
 
     :param file_path: A string path to the M4A file.
+    :param load_image: Decode the artwork into a toga.Image. When False only
+        'has_art' is filled in, which is all the library list needs.
     :return: A dictionary containing the extracted metadata.
     """
+    # imported on first use to keep it off the startup path
+    from tinytag import TinyTag
+
     try:
+        # the box reader is quicker and knows the duration of fragmented files
+        metadata = mp4meta.read_metadata(file_path, load_image=load_image)
+        if metadata is not None:
+            image_data = metadata.pop('image')
+            metadata['thumbnail'] = toga.Image(stream=io.BytesIO(image_data)) if image_data else None
+            return metadata
+
         # Convert the string path to a Path object for TinyTag
         file_path_obj = Path(file_path)
 
@@ -108,10 +102,11 @@ def get_m4a_metadata(file_path):
         # TinyTag's 'get_image()' method (or tag.images.any in newer versions)
         # returns the raw image data (bytes) for the first image found.
         image_data = tag.get_image()
+        metadata['has_art'] = bool(image_data)
 
         # Convert image data (bytes) to a Toga Image object
         toga_image = None
-        if image_data:
+        if image_data and load_image:
             # Toga can load an image from a bytes stream
             toga_image = toga.Image(stream=io.BytesIO(image_data))
 
@@ -120,10 +115,10 @@ def get_m4a_metadata(file_path):
         return metadata
 
     except FileNotFoundError:
-        print(f"Error: File not found at {file_path}")
+        logger.error("Error: File not found at %s", file_path)
         return None
     except Exception as e:
-        print(f"An error occurred: {e}")
+        logger.error("An error occurred: %s", e)
         return None
 
 
@@ -131,332 +126,342 @@ def get_m4a_metadata(file_path):
 def get_dest_path():
     # check OS
     if sys.platform == 'ios':
-        print("Running on IOS")
+        logger.debug("Running on IOS")
         return os.path.join(os.path.expanduser('~'), 'Documents') + "/"
     elif sys.platform == 'win32':
-        print("Running on Windows.")
+        logger.debug("Running on Windows.")
         return "¯\\_(ツ)_/¯"
     elif sys.platform == 'android':
-        print("Running on Android.")
+        logger.debug("Running on Android.")
         return "/storage/emulated/0/Documents/"
     elif sys.platform == 'darwin':
-        print("Running on macOS.")
+        logger.debug("Running on macOS.")
         return str(Path.home() / "Downloads") + "/"
     else:
-        print(f"Running on a different platform: {sys.platform}\nReturning default path_out (windows)")
+        logger.warning("Running on a different platform: %s\nReturning default path_out (windows)", sys.platform)
         return "¯\\_(ツ)_/¯"
 
 
-# remove prohibited characters from filename
-def sanitize_filename(filename):
-    """Removes or replaces sensitive characters from a filename.
-
-    Args:
-        filename (str): The filename to sanitize.
-
-    Returns:
-        str: The sanitized filename.
-    """
-
-    # 1. Remove or replace characters that are invalid across platforms
-    filename = re.sub(r'[<>:"/\\|?*\x00-\x1F]', '_', filename)
-
-    # 2. Remove or replace characters that might cause issues with specific OS
-    filename = filename.replace(' ', '_')  # replace spaces
-    filename = filename.strip('. ')  # Remove leading/trailing spaces and dots
-
-    # 3. Remove potentially problematic characters
-    filename = re.sub(r'[,;!@#\$%^&()+]', '', filename)
-
-    # 4. Normalize Unicode characters
-    filename = filename.encode('ascii', 'ignore').decode('ascii')
-
-    return filename
-
-
-# delete directory and all its files and subfolders
-def delete_directory_recursively(directory_path):
-    print(f"delete_directory_recursively: directory_path={directory_path}")
-
-    # check if dir exists
-    if not os.path.exists(directory_path):
-        print(f"Error: Directory '{directory_path}' does not exist.")
-        return
-
-    try:
-        # The core function for recursive deletion
-        shutil.rmtree(directory_path)
-        print(f"Directory '{directory_path}' and all contents deleted successfully.")
-    except PermissionError:
-        print(f"Error: Permission denied. Cannot delete directory '{directory_path}'.")
-    except Exception as e:
-        # Catch any other unexpected I/O errors
-        print(f"An unexpected error occurred while deleting '{directory_path}': {e}")
-
-
-# (2A) download playlist
-async def download_m3u_file(url, save_path, filename) -> str:
-    """
-    Asynchronously downloads a file from a URL and saves it to the app's data folder.
-    """
-    save_path += filename
-    try:
-        response = await asyncio.to_thread(requests.get, url, stream=True, verify=False)
-        response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
-
-        # 2. Save the file content in chunks
-        with open(save_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-
-        print(f"✅ Download complete. File saved to: {save_path}")
-
-        return save_path
-
-    except requests.exceptions.RequestException as e:
-        error_message = f"Download failed: {e}"
-        print(f"❌ {error_message}")
-        return ""
-    except Exception as e:
-        error_message = f"An unexpected error occurred: {e}"
-        print(f"❌ {error_message}")
-        return ""
-
-
-# (2B) parse m3u for chunk_urls
-def parse_m3u_file(file_path) -> []:
-    """
-    Parses an M3U file at the given path and returns a list of all URLs.
-
-    :param file_path: The full path to the M3U file in the iOS sandbox.
-    :return: A list of strings, where each string is a media URL.
-    """
-    if not os.path.exists(file_path):
-        print(f"Error: File not found at path: {file_path}")
-        return []
-
-    urls = []
-    try:
-        # 'r' mode opens the file for reading in text mode.
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                # Remove leading/trailing whitespace and newline characters
-                clean_line = line.strip()
-
-                # add init.mp4 url
-                if "EXT-X-MAP" in clean_line:
-                    start = clean_line.find("https")
-                    end = clean_line.rfind('"')
-                    init_chunk_url = clean_line[start:end]
-                    urls.append(init_chunk_url)
-                    print(f"found and added init_chunk_url={init_chunk_url}")
-
-                # Ignore comments/metadata lines (which start with '#')
-                if clean_line and not clean_line.startswith('#'):
-                    urls.append(clean_line)
-
-    except Exception as e:
-        # Handle potential file access or encoding errors
-        print(f"Error reading or parsing M3U file: {e}")
-        return []
-
-    return urls
-
-
-# (2C) download chunk
-async def download_chunk(url: str, dir_path: Path, chunk_index: int) -> str:
-    print(f"start download_chunk:\nurl={url}\ndir_path={dir_path}\nchunk_index={chunk_index}")
-    try:
-        # Use httpx.AsyncClient for asynchronous requests
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            # Use stream=True for large files
-            async with client.stream("GET", url) as response:
-                response.raise_for_status()  # Raise exception for bad status codes
-
-                # Extract filename from the URL or Content-Disposition header
-                # For simplicity, we use the last part of the URL path
-                filename = "chunk" + str(chunk_index) + ".m4s"
-                # the initialization segment is special and gets its own name and .mp4 extension
-                if chunk_index == 0:
-                    filename = "init.mp4"
-                final_path = dir_path / filename
-
-                # Write content to a local file in chunks
-                with open(final_path, "wb") as file:
-                    async for chunk in response.aiter_bytes():
-                        file.write(chunk)
-
-                return str(final_path)
-
-    except httpx.RequestError as e:
-        print(f"failed to download {url.split('/')[-1]}.\nrequest error: {e}")
-        return ""
-    except Exception as e:
-        f"failed to download {url.split('/')[-1]}. unexpected error: {e}"
-        return ""
-
-
-# (2C) download thumbnail
-async def download_art(url: str, save_path: Path) -> str:
-    try:
-        # Use httpx.AsyncClient for asynchronous requests
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            # Use stream=True for large files
-            async with client.stream("GET", url) as response:
-                response.raise_for_status()  # Raise exception for bad status codes
-
-                # set thumbnail filename
-                global thumbnail_filename
-                final_path = save_path / thumbnail_filename
-
-                # write content to a local file in chunks
-                with open(final_path, "wb") as file:
-                    async for chunk in response.aiter_bytes():
-                        file.write(chunk)
-
-                return str(final_path)
-    except httpx.RequestError as e:
-        return f"ERROR: Failed to download {url.split('/')[-1]}. Request error: {e}"
-    except Exception as e:
-        return f"ERROR: Failed to download {url.split('/')[-1]}. Unexpected error: {e}"
-
-
 class SoundLoader(toga.App):
     def startup(self):
-        # register fonts
-        toga.Font.register("FiraSans", "resources/FiraSans-Regular.ttf")
-        toga.Font.register("FiraSansExtraLight", "resources/FiraSans-ExtraLight.ttf")
-        toga.Font.register("FiraSansBold", "resources/FiraSans-Bold.ttf")
+        # only the UI shell is built here; everything else runs as background stages
+        self.startup_timer = StageTimer("startup")
+
+        # register fonts (needed before the first label is laid out)
+        with self.startup_timer.stage("fonts"):
+            toga.Font.register("FiraSans", "resources/FiraSans-Regular.ttf")
+            toga.Font.register("FiraSansExtraLight", "resources/FiraSans-ExtraLight.ttf")
+            toga.Font.register("FiraSansBold", "resources/FiraSans-Bold.ttf")
 
-        # scan files
         #self.storage_dir: Path = self.paths.data
         self.storage_dir = Path(get_dest_path())
         if not self.storage_dir.exists():
             self.storage_dir.mkdir(parents=True)
-        print(f"scanning files in app dir: {str(self.storage_dir)}")
-        
+
+        # files list
+        self.all_files = Library()
+        self.filtered_files = []
+        # payload fingerprints of the files, to catch duplicate downloads;
+        # files whose fingerprint isn't known yet are queued for hashing
+        self.fingerprints = fingerprint.configure(Path(self.paths.data) / 'fingerprints.json')
+        self.fingerprint_queue = asyncio.Queue()
+        self.fingerprint_task = None
+
+        # player and related fields
+        self.player = None
+        self.current_playing_path = None # Path of the file currently playing/paused
+        self.button_map = {} # Maps file path (str) to the Toga Button widget (for icon updates)
+
+        # the track being loaded/downloaded and its trace
+        self.job = None
+        self.job_tracer = None
+        # resolves pasted urls before Load is tapped
+        self.speculator = speculate.Speculator()
+        # segments and tracks downloaded before are taken from here
+        cache.configure(Path(self.paths.cache) / 'media')
+        # request rate and bandwidth limits (see ratelimit.py); read before every download
+        self.network_settings = ratelimit.SettingsFile(Path(self.paths.config) / 'network.json')
+        # serves the download in progress to the player (started on first use)
+        self.loopback = loopback.LoopbackServer()
+        self.stream_url = None
+
+        # storage watcher (started once the library is loaded)
+        self.refresh_handle = None
+        self.storage_watcher = None
+
+        # init ui
+        with self.startup_timer.stage("ui_shell"):
+            self.show_init_layout()
+        self.startup_timer.mark("interactive")
+
+        # readiness events for the background stages
+        self.sample_ready = asyncio.Event()
+        self.audio_session_ready = asyncio.Event()
+        self.library_ready = asyncio.Event()
+        self.startup_task = self.loop.create_task(self.run_startup_stages())
+
+    async def run_startup_stages(self):
+        """Runs the side work of startup concurrently, after the window is up."""
+        await asyncio.gather(
+            self.seed_sample_file(),
+            self.activate_audio_session(),
+            self.load_library(),
+            self.load_concat_profile(),
+            self.collect_garbage(),
+            cpu.get_cpu_executor().start(),
+            get_io_executor().run(self.network_settings.reload),
+            return_exceptions=True,
+        )
+        logger.info("%s", self.startup_timer.report())
+
+    async def seed_sample_file(self):
+        """Copies the bundled sample track into the storage directory on first launch."""
         initial_file_name = "sample-1.m4a"
         destination_path = self.storage_dir / initial_file_name
-        
-        if not destination_path.exists():
-            try:
-                # 1. Determine the path inside the app bundle (read-only source)
+
+        try:
+            with self.startup_timer.stage("sample_file"):
+                if destination_path.exists():
+                    logger.debug("Initial file '%s' already exists in documents, skipping copy.", initial_file_name)
+                    return
+
+                # Determine the path inside the app bundle (read-only source)
                 # This path assumes the file is placed in a 'resources' folder at the project root.
                 source_path = self.paths.app / 'resources' / initial_file_name
-                
-                # 2. Robust copying using read/write if source exists
                 if source_path.exists():
-                    # Read all bytes from the source
-                    file_content = source_path.read_bytes()
-                    # Write all bytes to the destination (Data/Documents folder)
-                    destination_path.write_bytes(file_content)
-                    print(f"Copied initial file: {initial_file_name} to {destination_path}")
+                    # copy off the event loop
+                    await get_io_executor().run(shutil.copyfile, source_path, destination_path)
+                    logger.info("Copied initial file: %s to %s", initial_file_name, destination_path)
                 else:
                     # Fallback for different bundling strategies
                     # If using Briefcase/BeeWare, you might need to adjust 'resources' path based on your setup.
-                    print(f"Warning: Initial resource file '{initial_file_name}' not found in app bundle: {source_path}")
+                    logger.warning("Warning: Initial resource file '%s' not found in app bundle: %s",
+                                   initial_file_name, source_path)
+        except Exception as e:
+            logger.error("Error copying initial file: %s", e)
+        finally:
+            self.sample_ready.set()
+
+    async def load_concat_profile(self):
+        """Lets the concat backend selector use the profile measured by benchmarks/bench_concat.py."""
+        for path in (Path(self.paths.cache) / 'concat_profile.json',
+                     self.paths.app / 'resources' / 'concat_profile.json'):
+            if path.exists():
+                await get_io_executor().run(concat.set_profile_path, str(path))
+                logger.debug("concat profile: %s", path)
+                return
 
-            except Exception as e:
-                print(f"Error copying initial file: {e}")
-        else:
-            print(f"Initial file '{initial_file_name}' already exists in documents, skipping copy.")
+    async def collect_garbage(self):
+        """
+        Deletes what crashed downloads left in the temp dir and old job
+        traces, and trims the media cache to its budget.
+        """
+        try:
+            with self.startup_timer.stage("scratch_sweep"):
+                collector = scratch.get_collector()
+                await collector.sweep(self.get_temp_path())
+                await collector.prune(self.get_trace_path(), keep=TRACES_KEPT, max_age=TRACE_MAX_AGE)
+                media_cache = cache.get_cache()
+                if media_cache is not None:
+                    await media_cache.open()
+        except Exception as e:
+            logger.error("Error cleaning up the temp dir: %s", e)
 
-        # files list
-        self.all_files = []
-        self.filtered_files = self.all_files
+    async def activate_audio_session(self):
+        """Configures and activates the AVAudioSession for playback (iOS only)."""
+        try:
+            if not NATIVE_AUDIO_SUPPORT:
+                return
+            with self.startup_timer.stage("audio_session"):
+                # activation can block for a while, so keep it off the main thread
+                await asyncio.to_thread(self.configure_audio_session)
+        finally:
+            self.audio_session_ready.set()
 
-        # init ui
-        self.show_init_layout()
-                
-        # create player, audio session, and related fields
-        self.player = None
-        self.current_playing_path = None # Path of the file currently playing/paused
-        self.button_map = {} # Maps file path (str) to the Toga Button widget (for icon updates)
-        
-        if NATIVE_AUDIO_SUPPORT:
+    def configure_audio_session(self):
+        try:
+            session = AVAudioSession.sharedInstance()
+
+            # 1. Set the audio category to Playback (ensures audio comes out of speakers/headphones)
+            # We ignore the error pointer for simplicity in Python code.
+            session.setCategory(AVAudioSessionCategoryPlayback, error=None)
+
+            # 2. Activate the session
+            session.setActive(True, error=None)
+            logger.info("AVAudioSession set to Playback and activated.")
+
+        except Exception as e:
+            # This should log an error if configuration fails but prevent app crash
+            logger.error("Error configuring AVAudioSession: %s", e)
+
+    async def load_library(self):
+        """Scans the storage directory in a worker thread, then starts the watcher."""
+        try:
+            # include the sample file in the first scan
+            await self.sample_ready.wait()
+
+            logger.debug("scanning files in app dir: %s", self.storage_dir)
+            with self.startup_timer.stage("library_scan"):
+                await asyncio.to_thread(self.fingerprints.load)
+                tracks = await self.scan_storage_parallel()
+            with self.startup_timer.stage("library_render"):
+                self.initial_scan(tracks)
+            self.fingerprints.retain(track.full_path for track in tracks)
+            self.fingerprint_task = self.loop.create_task(self.fingerprint_files())
+
+            # keep the list in sync with files added/removed outside the app
+            self.storage_watcher = watcher.StorageWatcher(self.storage_dir, self.on_storage_change, loop=self.loop)
             try:
-                session = AVAudioSession.sharedInstance()
-                
-                # 1. Set the audio category to Playback (ensures audio comes out of speakers/headphones)
-                # We ignore the error pointer for simplicity in Python code.
-                session.setCategory(AVAudioSessionCategoryPlayback, error=None)
-                
-                # 2. Activate the session
-                session.setActive(True, error=None)
-                print("AVAudioSession set to Playback and activated.")
-                    
+                self.storage_watcher.start()
             except Exception as e:
-                # This should log an error if configuration fails but prevent app crash
-                print(f"Error configuring AVAudioSession: {e}")
-                
-        
-        # run initial scan
-        self.initial_scan()
+                logger.error("Error starting storage watcher: %s", e)
+            else:
+                # pick up anything that changed between the scan and the watcher's snapshot
+                self.reconcile_with_watcher()
+        finally:
+            self.library_ready.set()
 
     # get path to temp directory
     def get_temp_path(self):
         return Path(self.paths.cache) / 'temp'
 
-    # create temp directory for temp files
-    def create_temp_dir(self):
-        docs_path = str(self.get_temp_path())
-        if os.path.isdir(docs_path):
-            # delete temp directory if it already exists
-            delete_directory_recursively(docs_path)
-        try:
-            os.mkdir(docs_path)
-            print(f"Directory '{docs_path}' created successfully.")
-        except FileExistsError:
-            print(f"Directory '{docs_path}' already exists.")
-        except FileNotFoundError:
-            print(f"Parent directory for '{docs_path}' does not exist.")
+    # get path to the job traces directory
+    def get_trace_path(self):
+        return Path(self.paths.cache) / 'traces'
+
+    def scan_storage(self):
+        """Reads every .m4a file in the storage directory. Safe to run off the event loop."""
+        return [self.read_file_entry(file_path) for file_path in self.list_storage()]
+
+    def list_storage(self):
+        return [file_path for file_path in self.storage_dir.rglob('*.m4a') if file_path.is_file()]
+
+    async def scan_storage_parallel(self):
+        """Like scan_storage, with the tags parsed on the CPU workers in batches."""
+        paths = await asyncio.to_thread(self.list_storage)
+        results = await cpu.get_cpu_executor().map(mp4meta.read_metadata, [str(p) for p in paths],
+                                                   return_exceptions=True)
+        return await asyncio.to_thread(self.tracks_from_metadata, paths, results)
+
+    def tracks_from_metadata(self, paths, results):
+        """Builds Tracks from read_metadata() results; files it couldn't read go through TinyTag."""
+        tracks = []
+        for file_path, metadata in zip(paths, results):
+            if isinstance(metadata, dict):
+                tracks.append(Track.from_metadata(file_path, metadata, self.fingerprints.cached(file_path)))
+            else:
+                tracks.append(self.read_file_entry(file_path))
+        return tracks
 
-    def initial_scan(self):
-        """Scans the directory and populates the master list."""
+    def initial_scan(self, tracks=None):
+        """Populates the master list from scanned tracks (scanning now if none are given)."""
+        if tracks is None:
+            tracks = self.scan_storage()
 
         # collect all .m4a files into the master list
-        self.all_files = []
-        for file_path in self.storage_dir.rglob('*.m4a'):
-            if file_path.is_file():
-
-                # get metadata
-                metadata = get_m4a_metadata(str(file_path))
+        self.all_files.clear()
+        for track in tracks:
+            self.all_files.upsert(track)
 
-                if metadata:
-                    print(f"Title: {metadata['title']}")
-                    print(f"Artist: {metadata['artist']}")
-                    print(f"Duration: {metadata['duration']:.2f} seconds")
+        logger.info("Total files found: %s", len(self.all_files))
 
-                    if metadata['thumbnail']:
-                          print("Thumbnail loaded successfully.")
+        # after initial scan, apply the current filter (which might be empty)
+        self.filter_files(self.search_input)
 
-                self.all_files.append({
-                    'filename': file_path.name,
-                    'full_path': str(file_path),
-                    'title': metadata['title'],
-                    'artist': metadata['artist'],
-                    'duration': metadata['duration'],
-                    'thumbnail': metadata['thumbnail']
-                })
+    def read_file_entry(self, file_path):
+        """Reads the metadata of an .m4a file into a library Track."""
+
+        # get metadata (artwork isn't decoded, the list only shows a placeholder)
+        metadata = get_m4a_metadata(str(file_path), load_image=False)
+
+        if metadata:
+            logger.debug("Title: %s", metadata['title'])
+            logger.debug("Artist: %s", metadata['artist'])
+            logger.debug("Duration: %s seconds", metadata['duration'])
+
+        # only a stored fingerprint here (one stat); new files are hashed later by fingerprint_files
+        return Track.from_metadata(file_path, metadata, self.fingerprints.cached(file_path))
+
+    def upsert_file(self, file_path):
+        """Adds a file to the master list, or re-reads it if it's already listed."""
+        track = self.read_file_entry(file_path)
+        self.all_files.upsert(track)
+        if track.fingerprint is None:
+            self.fingerprint_queue.put_nowait(track.full_path)
+
+    def remove_file(self, file_path):
+        """Drops a file from the master list."""
+        self.all_files.remove(file_path)
+        self.fingerprints.forget(file_path)
+        self.button_map.pop(str(file_path), None)
+
+    async def fingerprint_files(self):
+        """Hashes the payload of every listed file whose fingerprint isn't stored yet, then keeps
+        doing so for the files that are added or changed."""
+        for track in self.all_files:
+            if track.fingerprint is None:
+                self.fingerprint_queue.put_nowait(track.full_path)
+        while True:
+            # hash whatever has queued up in one batch over the CPU workers
+            paths = [await self.fingerprint_queue.get()]
+            while not self.fingerprint_queue.empty():
+                paths.append(self.fingerprint_queue.get_nowait())
+            paths = list(dict.fromkeys(paths))
+            try:
+                entries = await cpu.get_cpu_executor().map(fingerprint.file_fingerprint, paths, return_exceptions=True)
+                for full_path, entry in zip(paths, entries):
+                    track = self.all_files.get(full_path)
+                    if track is not None and not isinstance(entry, Exception):
+                        track.fingerprint = self.fingerprints.store(full_path, entry)
+                if self.fingerprint_queue.empty():
+                    await get_io_executor().run(self.fingerprints.save)
+                    duplicates = self.all_files.duplicates()
+                    if duplicates:
+                        logger.info("library has %s tracks with more than one copy", len(duplicates))
+            except Exception as e:
+                # keep the loop alive for the next batch
+                logger.error("Error fingerprinting %s files: %s", len(paths), e)
+
+    def reconcile_with_watcher(self):
+        """Applies the difference between the master list and the watcher's snapshot."""
+        known = self.storage_watcher.known_paths()
+        stale = [track.full_path for track in self.all_files if track.full_path not in known]
+        for full_path in stale:
+            self.remove_file(full_path)
+        missing = [path for path in known if path not in self.all_files]
+        for path in missing:
+            self.upsert_file(Path(path))
+        if stale or missing:
+            self.schedule_refresh()
+
+    def on_storage_change(self, kind, file_path):
+        """Applies a single add/remove/modify event from the storage watcher."""
+        logger.info("storage change: %s %s", kind, file_path)
+        if kind == watcher.REMOVED:
+            self.remove_file(file_path)
+        else:
+            self.upsert_file(file_path)
+        self.schedule_refresh()
 
-        print(f"Total files found: {len(self.all_files)}")
-        first_item = self.all_files[0]
-        print(f"Keys in first data item: {list(first_item.keys())}")
-        print(f"Filename value: {first_item.get('filename')}")
-        print(f"Full path value: {first_item.get('full_path')}")
+    def schedule_refresh(self, delay=0.25):
+        """Redraws the file list once a burst of changes has settled."""
+        if self.refresh_handle is not None:
+            self.refresh_handle.cancel()
+        self.refresh_handle = self.loop.call_later(delay, self.run_refresh)
 
-        # after initial scan, apply the current filter (which might be empty)
+    def run_refresh(self):
+        self.refresh_handle = None
         self.filter_files(self.search_input)
         
     # You'll need to add a duration key to your file data dictionaries
     # in initial_scan for this to work (or hardcode it for testing).
-    def create_file_row(self, file_data):
+    def create_file_row(self, track):
         """Creates a detailed file row: [Thumbnail] [Title/Subtitle] [Play Button]"""
         
-        filename = file_data['filename']
-        title = file_data['title']
-        duration = file_data.get('duration', "Unknown duration")
-        full_path = file_data['full_path']
+        filename = track.filename
+        title = track.title
+        duration = track.duration if track.duration is not None else "Unknown duration"
+        full_path = track.full_path
         
         # thumbnail
         thumbnail_image = get_thumbnail_placeholder()
@@ -527,24 +532,19 @@ class SoundLoader(toga.App):
         
         search_term = text_input.value.lower()
         
-        if not search_term or "https:" in search_term:
-            filtered_data = self.all_files
-        else:
-            filtered_data = [
-                file_info
-                for file_info in self.all_files
-                if search_term in file_info['filename'].lower()
-            ]
+        if "https:" in search_term:
+            search_term = ""
+        self.filtered_files = self.all_files.filter(search_term)
 
         # clear the old contents
         self.file_list_box.clear()
 
         # populate the box with new, filtered rows
-        for file_data in filtered_data:
-            row = self.create_file_row(file_data)
+        for track in self.filtered_files:
+            row = self.create_file_row(track)
             self.file_list_box.add(row)
 
-        print(f"List refreshed. Showing {len(filtered_data)} files.")
+        logger.debug("List refreshed. Showing %s files.", len(self.filtered_files))
         
         # The ScrollContainer/Box pattern does not require the .notify() call
         # because you are directly manipulating the widget hierarchy.
@@ -732,6 +732,9 @@ class SoundLoader(toga.App):
         self.main_window.content = self.main_box
 
     def show_loading_layout(self):
+        # a new track: stop serving the previous download
+        self.drop_stream()
+
         # set load_button to loading
         self.load_button.text = "Loading…"
         
@@ -752,21 +755,27 @@ class SoundLoader(toga.App):
         self.progress.style.visibility = 'visible'
         self.progress.start()
 
-    def show_preview_layout(self, filename, thumbnail_url):
+    @tracing.traced()
+    async def show_preview_layout(self, job):
+        import httpx
 
         # stop progress animation
         self.progress.stop()
         self.progress.visibility = 'hidden'
 
+        filename = job.filename
+        thumbnail_url = job.thumbnail_url
         try:
-            # try load thumbnail into image_view
-            response = requests.get(thumbnail_url, verify=False)
-            response.raise_for_status()  # Raise an exception for bad status codes
-            image_bytes = BytesIO(response.content)
-            toga_image = toga.Image(src=image_bytes.read())
+            # try load thumbnail into image_view (usually already fetched while resolving)
+            image_bytes = job.artwork
+            if image_bytes is None:
+                with scheduler.priority_scope(scheduler.ARTWORK):
+                    image_bytes = job.artwork = await net.fetch_bytes(thumbnail_url)
+            toga_image = toga.Image(src=image_bytes)
             self.image_view.image = toga_image
-        except requests.exceptions.RequestException as e:
-            print(f"Error loading thumbnail_url into image_view:\nthumbnail_url={thumbnail_url}\nRequestException={e}")
+        except httpx.HTTPError as e:
+            logger.error("Error loading thumbnail_url into image_view: thumbnail_url=%s RequestException=%s",
+                         thumbnail_url, e)
         finally:
             # set load_button to clear
             self.load_button.text = "Clear"
@@ -802,8 +811,9 @@ class SoundLoader(toga.App):
         self.progress.start()
 
     async def show_finished_layout(self):
-        # set download_button to finished
-        self.download_button.text = "Finished!"
+        # set download_button to finished (unless it's the play button of the stream)
+        if self.stream_url is None or self.current_playing_path != self.stream_url:
+            self.download_button.text = "Finished!"
         
         # stop progress bar
         self.progress.stop()
@@ -818,7 +828,8 @@ class SoundLoader(toga.App):
     # listen for textual changes to url_input
     def input_change(self, widget):
         if self.search_input.value == "":
-            print("url_input cleared")
+            logger.debug("url_input cleared")
+            self.speculator.cancel()
 
             # reset main button
             self.load_button.text = "Paste"
@@ -837,25 +848,38 @@ class SoundLoader(toga.App):
         elif "https://" in self.search_input.value and self.search_input.value.count("/") >= 3:
             # set load_button to load
             self.load_button.text = "Load"
+
+            # start resolving right away, so Load can show the preview immediately
+            # (sets and profiles are listed when Load is tapped)
+            if expand.classify_url(self.search_input.value) in ("track", "short"):
+                self.speculator.start(self.search_input.value)
+            else:
+                self.speculator.cancel()
         else:
             # set load_button to clear
             self.load_button.text = "Clear"
+            self.speculator.cancel()
             self.filter_files(self.search_input)
 
     def toggle_playback(self, path, button):
         """
         Toggles M4A audio playback (Play/Pause/Stop) using AVFoundation.
         
-        :param path: The absolute file path (string) to the M4A file.
+        :param path: The absolute file path (string) to the M4A file, or an http URL.
         :param button: The Toga Button widget that was pressed.
         """
         if not NATIVE_AUDIO_SUPPORT:
-            print("ERROR: Native AVFoundation audio support is unavailable on this platform.")
+            logger.error("ERROR: Native AVFoundation audio support is unavailable on this platform.")
             self.main_window.info_dialog("Audio Error", "Native AVPlayer is not accessible.")
             return
+        if not self.audio_session_ready.is_set():
+            # the Playback category isn't active yet; start once it is
+            self.loop.create_task(self.toggle_playback_when_ready(path, button))
+            return
 
         try:
-            audio_path = str(Path(path).absolute())
+            is_url = "://" in str(path)
+            audio_path = str(path) if is_url else str(Path(path).absolute())
             
             # --- Case 1: Same file is currently playing or paused ---
             if self.current_playing_path == audio_path and self.player:
@@ -865,12 +889,12 @@ class SoundLoader(toga.App):
                     # PAUSE
                     self.player.pause()
                     button.text = '▶' # Change icon to Play
-                    print(f"AVFoundation: Paused playback for: {audio_path}")
+                    logger.debug("AVFoundation: Paused playback for: %s", audio_path)
                 else:
                     # RESUME
                     self.player.play()
                     button.text = '⏸' # Change icon to Pause
-                    print(f"AVFoundation: Resumed playback for: {audio_path}")
+                    logger.debug("AVFoundation: Resumed playback for: %s", audio_path)
                 
             # --- Case 2: New file selected OR no file playing ---
             else:
@@ -878,6 +902,8 @@ class SoundLoader(toga.App):
                 if self.current_playing_path and self.button_map.get(self.current_playing_path):
                     old_button = self.button_map[self.current_playing_path]
                     old_button.text = '▶'
+                if self.current_playing_path and self.current_playing_path == self.stream_url:
+                    self.drop_stream()
                 
                 # 2. Stop old player
                 if self.player:
@@ -885,7 +911,7 @@ class SoundLoader(toga.App):
                     self.player = None
 
                 # 3. Start new playback
-                url = NSURL.fileURLWithPath(audio_path)
+                url = NSURL.URLWithString(audio_path) if is_url else NSURL.fileURLWithPath(audio_path)
                 player_item = AVPlayerItem.playerItemWithURL(url)
                 self.player = AVPlayer.playerWithPlayerItem(player_item)
                 
@@ -894,18 +920,22 @@ class SoundLoader(toga.App):
                 # 4. Update state and current button icon
                 self.current_playing_path = audio_path
                 button.text = '⏸' # Change icon to Pause
-                print(f"AVFoundation: Started new playback for: {audio_path}")
+                logger.debug("AVFoundation: Started new playback for: %s", audio_path)
 
         except Exception as e:
-            print(f"AVFoundation Playback Error: {e}")
+            logger.error("AVFoundation Playback Error: %s", e)
             self.main_window.error_dialog(
                 "Playback Failure",
                 f"Failed to play '{Path(path).name}'. Error: {e}"
             )
 
+    async def toggle_playback_when_ready(self, path, button):
+        await self.audio_session_ready.wait()
+        self.toggle_playback(path, button)
+
     # paste copied text into url_input
     async def paste_action(self):
-        print("paste_action")
+        logger.debug("paste_action")
 
         if sys.platform == 'ios':
             # Get the general pasteboard instance
@@ -918,47 +948,29 @@ class SoundLoader(toga.App):
             if not str(pasted_text) is None:
                 self.search_input.value = pasted_text
             else:
-                print("no text copied!")
+                logger.warning("no text copied!")
                 await self.show_message_handler("Invalid Input", "Please copy a valid URL…\nEx. https://on.sound…")
         else:
-            print("paste_action not implemented for OS")
+            logger.warning("paste_action not implemented for OS")
 
     # clear text from url_input
     def clear_action(self):
-        print("clear_action")
+        logger.debug("clear_action")
         self.search_input.value = ""
         # reset window content
         #self.show_clear_layout()
 
     async def handle_file_pick(self, window, file_paths):
-        print(f"number of picked files: {len(file_paths)}")
+        logger.debug("number of picked files: %s", len(file_paths))
+        # the initial scan replaces the list, picked files included
+        await self.library_ready.wait()
 
         # 1. Collect all .m4a files into the master list
-        # self.all_files = []
         for file_path in file_paths:
             if file_path.is_file():
-            
-                # get metadata
-                metadata = get_m4a_metadata(str(file_path))
-
-                if metadata:
-                    print(f"Title: {metadata['title']}")
-                    print(f"Artist: {metadata['artist']}")
-                    print(f"Duration: {metadata['duration']:.2f} seconds")
+                self.upsert_file(file_path)
 
-                    if metadata['thumbnail']:
-                          print("Thumbnail loaded successfully.")
-            
-                self.all_files.append({
-                    'filename': file_path.name,
-                    'full_path': str(file_path),
-                    'title': metadata['title'],
-                    'artist': metadata['artist'],
-                    'duration': metadata['duration'],
-                    'thumbnail': metadata['thumbnail']
-                })
-
-        print(f"total files: {len(self.all_files)}")
+        logger.debug("total files: %s", len(self.all_files))
 
         # 2. After a new scan, apply the current filter (which might be empty)
         self.filter_files(self.search_input)
@@ -979,76 +991,11 @@ class SoundLoader(toga.App):
             )
 
         except Exception as e:
-            print(f"Error during file selection: {e}")
-
-    # (1A) get html from url as string
-    async def get_html_from(self, url: str) -> str:
-        """
-        Asynchronously fetches the HTML content of a given URL.
-
-        Args:
-            url: The URL of the webpage to fetch.
-
-        Returns:
-            The HTML content as a string, or None if an error occurs.
-        """
-
-        # ⚠️ Suppress the warning that appears when disabling SSL verification
-        urllib3.disable_warnings(InsecureRequestWarning)
-
-        try:
-            # Create an aiohttp ClientSession. It's recommended to use a context manager
-            # (the 'async with' block) for the session to ensure resources are properly released.
-            async with aiohttp.ClientSession() as session:
-                # Send an asynchronous GET request to the URL.
-                # The 'async with' block for the response ensures the connection is closed.
-                # Raise an exception for bad status codes (4xx or 5xx)
-                async with session.get(url, ssl=False) as response:
-                    response.raise_for_status()
-
-                    # Read the response content as text (HTML in this case).
-                    html = await response.text()
-                    print(f"received html response from: url={url}")
-                    return html
-
-        except ClientConnectorError as e:
-            # Handle connection-related errors (e.g., DNS failure, connection refused)
-            print(f"Connection Error for {url}: {e}")
-            return ""
-        except aiohttp.ClientResponseError as e:
-            # Handle HTTP errors (e.g., 404 Not Found, 500 Server Error)
-            print(f"HTTP Error for {url}: {e.status} {e.message}")
-            return ""
-        except Exception as e:
-            # Handle any other unexpected exceptions
-            print(f"An unexpected error occurred for {url}: {e}")
-            return ""
-
-    # (1B) parse html for player_url
-    def extract_player_url(self, html) -> str:
-        print(f"extract_player_url: len(html)={len(html)}")
-
-        # check for test stream id
-        if TEST_STREAM_ID in html:
-            # TODO extract stream id
-            print(f"found test stream id: TEST_STREAM_ID={TEST_STREAM_ID}")
-        else:
-            print(f"missing test stream id: TEST_STREAM_ID={TEST_STREAM_ID}")
-
-        if TWITTER_PLAYER in html:
-            print("found TWITTER_PLAYER in html")
-
-            # extract player_url
-            searchIndex = html.find(TWITTER_PLAYER) + len(TWITTER_PLAYER)
-            startIndex = html.find("content", searchIndex) + 9
-            endIndex = html.find('"', startIndex)
-            return html[startIndex:endIndex]
-        print(f"missing TWITTER_PLAYER in html:\nhtml={html}")
-        return ""
+            logger.error("Error during file selection: %s", e)
 
     # (1C) load player_url in webview
     def load_in_webview(self, player_url):
-        print(f"start load_in_webview: player_url={player_url}")
+        logger.debug("start load_in_webview: player_url=%s", player_url)
         self.webview.url = player_url
 
     # (1D) extract player_url from loaded webpage html
@@ -1057,13 +1004,7 @@ class SoundLoader(toga.App):
         A handler that is invoked when the WebView finishes loading the page.
         This is useful for updating other parts of the UI, like a status bar.
         """
-        print(f"webview finished loading!")
-
-        # get global var
-        global player_url
-        global stream_url
-        global thumbnail_url
-        global track_filename
+        logger.debug("webview finished loading!")
 
         # get html via js
         html = ""
@@ -1071,175 +1012,18 @@ class SoundLoader(toga.App):
         try:
             html = await widget.evaluate_javascript(js)
         except Exception as e:
-            print(f"An error occurred while running JavaScript: {e}")
+            logger.error("An error occurred while running JavaScript: %s", e)
         finally:
             if len(html) < 300:
-                print(f"received html from JS: len(html)={len(html)}")
+                logger.debug("received html from JS: len(html)=%s", len(html))
 
             else:
                 # TODO show error message
                 return
 
-    # (1E) extract filename, thumbnail_url, metadata
-    def extract_info(self, html) -> tuple[str, str, str, str]:
-        print(f"extract_info: len(html)={len(html)}")
-
-        # check for test stream id
-        if TEST_STREAM_ID in html:
-            # TODO extract stream id
-            print(f"found test stream id: TEST_STREAM_ID={TEST_STREAM_ID}")
-        else:
-            print(f"missing test stream id: TEST_STREAM_ID={TEST_STREAM_ID}")
-
-        # extract filename
-        filename = "soundloader_download"
-        if TWITTER_TITLE in html:
-            searchIndex = html.find(TWITTER_TITLE)
-            startIndex = html.find("content", searchIndex) + 9
-            endIndex = html.find('"', startIndex)
-            filename = html[startIndex:endIndex]
-            print(f"found TWITTER_TITLE in html: filename={filename}")
-        else:
-            print(f"missing TWITTER_TITLE in html: filename={filename}")
-
-        # extract thumbnail url
-        t_url = ""
-        if BASE_URL_THUMBNAIL in html:
-            startIndex = html.find(BASE_URL_THUMBNAIL)
-            endIndex = html.find('"', startIndex)
-            t_url = "https://" + html[startIndex:endIndex]
-            print(f"found BASE_URL_THUMBNAIL in html: t_url={t_url}")
-        else:
-            print(f"missing BASE_URL_THUMBNAIL in html: t_url={t_url}")
-
-        # get meta
-        meta = ""
-        if "<h1" in html and "<meta" in html:
-            start = html.find("<h1")
-            end = html.find("<meta", start)
-            meta = html[start:end]
-        else:
-            print("html missing meta!")
-
-        # get track title and artist
-        tt = filename  # default title
-        ta = ""
-        if "<a" in meta:
-            search = meta.find("<a")
-            start = meta.find(">", search)
-            end = meta.find("</a", start)
-            tt = meta[start:end]
-            print(f"found track title: tt={tt}")
-            search = meta.rfind("<a")
-            start = meta.find(">", search)
-            end = meta.find("</a", start)
-            ta = meta[start:end]
-            print(f"found track artist: ta={ta}")
-        return filename, t_url, tt, ta
-
-    # (1F) get client_id
-    async def get_client_id_from(self, js_url) -> str:
-        try:
-            # execute js request
-            response = await self.loop.run_in_executor(
-                None,
-                lambda: requests.get(js_url, timeout=10, verify=False)
-            )
-
-            # check for success
-            response.raise_for_status()
-
-            # get js as string
-            js_content = response.text
-            print(f"received javascript: js_content{js_content}")
-
-            # check for test stream id
-            if TEST_STREAM_ID in js_content:
-                # TODO extract stream id
-                print(f"found test stream id: TEST_STREAM_ID={TEST_STREAM_ID}")
-            else:
-                print(f"missing test stream id: TEST_STREAM_ID={TEST_STREAM_ID}")
-
-            # extract client_id
-            if 'client_id=' in js_content:
-                start = js_content.find('client_id=') + 10
-                end = js_content.find('"', start)
-                c_id = js_content[start:end]
-                print(f"found client_id! c_id={c_id}")
-                return c_id
-            return ""
-
-        except requests.exceptions.RequestException as e:
-            print(f"Error: {e}")
-            # TODO show error message
-            return ""
-
-        except Exception as e:
-            # TODO show error message
-            print(f"Unexpected Error: {e}")
-            return ""
-
-    # (1G) request json w/ response handler
-    async def get_json_as_string(self, url: str) -> str:
-        print(f"start get_json_as_string: url={url}")
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url)
-
-                # raise an exception for bad status codes (4xx or 5xx)
-                response.raise_for_status()
-
-                # get the response content as a string
-                json_string = response.text
-                print(f"received json_string={json_string}")
-
-                # check for test stream id
-                if TEST_STREAM_ID in json_string:
-                    # TODO extract stream id
-                    print(f"found test stream id: TEST_STREAM_ID={TEST_STREAM_ID}")
-                else:
-                    print(f"missing test stream id: TEST_STREAM_ID={TEST_STREAM_ID}")
-
-                return json_string
-
-        except httpx.HTTPStatusError as e:
-            # Handle HTTP errors (e.g., 404 Not Found, 500 Server Error)
-            return f"HTTP Error: {e.response.status_code} - {e.response.reason_phrase}"
-        except httpx.RequestError as e:
-            # Handle general request errors (e.g., connection timeout, DNS error)
-            return f"Request Error: An error occurred while requesting {e.request.url} - {e.__class__.__name__}"
-        except Exception as e:
-            # Handle other unexpected errors
-            return f"An unexpected error occurred: {e}"
-
-    async def fetch_playlist_url(self, url) -> str:
-        """
-        Background task to await the fetch and update the UI.
-        """
-        global playlist_url
-        json_str = await self.get_json_as_string(url)
-        print(f"finished request json_str={json_str}")
-
-        # get playlist_url from json
-        if "https://" in json_str:
-            start = json_str.find("https://")
-            end = json_str.find('"', start)
-            playlist_url = json_str[start:end]
-            print(f"found playlist_url={playlist_url}")
-        else:
-            print(f"missing playlist_url in json_str={json_str}")
-        return playlist_url
-
     # on load click
     async def start_load_audio(self, widget):
-        print("load button clicked (start_load_audio)")
-        global player_url
-        global stream_url
-        global track_filename
-        global thumbnail_filename
-        global thumbnail_url
-        global track_title
-        global track_artist
+        logger.info("load button clicked (start_load_audio)")
 
         # hide keyboard
         self.app.main_window.content = self.app.main_window.content
@@ -1270,277 +1054,182 @@ class SoundLoader(toga.App):
             # show loading ui
             self.show_loading_layout()
 
-            # await player_url
             input_url = self.search_input.value
-            html = await self.get_html_from(input_url)
-            print(f"finished get_html_from: html={html}")
-
-            # extract player url
-            player_url = self.extract_player_url(html)
-            print(f"found player_url={player_url}")
-
-            # extract last stream url
-            if STREAM_ID_BEGIN in html and STREAM_ID_END in html:
-                start = html.find(STREAM_ID_BEGIN) + len(STREAM_ID_BEGIN)
-                end = html.find(STREAM_ID_END)
-                stream_url = STREAM_URL_BEGIN + html[start:end] + STREAM_URL_END
-                print(f"stream_url={stream_url}")
-            else:
-                await self.show_message_handler("Unknown Error", "Please try again later…")
-                print(f"missing stream id in: player_url={player_url}")
-                return
 
-            # check for progressive stream
-            if "stream/progressive" in html:
-                print("found stream/progressive !")
-            else:
-                print("missing stream/progressive !")
-
-            # extract thumbnail, filename and metadata
-            res = self.extract_info(html)
-            track_filename = res[0]
-            thumbnail_url = res[1]
-            track_title = res[2]
-            track_artist = res[3]
-            print(f"audio info:\ntrack_filename={track_filename}"
-                  f"\nthumbnail_url={thumbnail_url}\ntrack_title={track_title}\ntrack_artist={track_artist}")
-
-            # sanitize filename
-            track_filename = sanitize_filename(track_filename)
-
-            # set thumbnail resolution
-            if "-large" in thumbnail_url:
-                print("changed resolution of thumbnail_url to t500x500")
-                thumbnail_url.replace("-large", "-t500x500")
-            else:
-                print(f"kept resolution of thumbnail_url")
-
-            # set thumbnail filename
-            if thumbnail_url.endswith(".jpg"):
-                # handle jpg
-                thumbnail_filename = track_filename + ".jpg"
-            elif thumbnail_url.endswith(".webp"):
-                # convert webp to jpg
-                thumbnail_filename = track_filename + ".jpg"
-                thumbnail_url = thumbnail_url.replace("vi_webp", "vi")
-                thumbnail_url = thumbnail_url.replace(".webp", ".jpg")
-            elif thumbnail_url.endswith(".png"):
-                # handle png
-                thumbnail_filename = track_filename + ".png"
-            else:
-                # handle unexpected file extension
-                thumbnail_filename = track_filename + thumbnail_url[thumbnail_url.rfind('.')]
-                print(f"unexpected file extension: thumbnail_url={thumbnail_url}")
-            print(f"thumbnail_filename={thumbnail_filename}")
-
-            # get client id
-            global client_id
-            client_id = await self.get_client_id_from("https://a-v2.sndcdn.com/assets/0-2e3ca6a5.js")
-            print(f"client_id={client_id}")
-
-            # build full stream url
-            global full_stream_url
-            full_stream_url = stream_url + "?client_id=" + client_id  # + "&app_version=1759307428&app_locale=en"
-            print(f"full_stream_url={full_stream_url}")
-
-            # get playlist url
-            global playlist_url
-            playlist_url = await self.fetch_playlist_url(full_stream_url)
-            print(f"playlist_url={playlist_url}")
+            # pick up rate limits edited since the last download
+            await get_io_executor().run(self.network_settings.reload)
+
+            # sets and profiles: download every track
+            kind = expand.classify_url(input_url)
+            if kind == "short":
+                try:
+                    kind = expand.classify_url(await expand.final_url(input_url))
+                except Exception as e:
+                    logger.warning("could not follow short link %s: %s", input_url, e)
+            if kind in ("set", "user"):
+                self.speculator.cancel()
+                await self.download_collection(input_url)
+                return
 
-            # update ui
-            self.show_preview_layout(track_filename, thumbnail_url)
+            # trace this job from load through download
+            self.job_tracer = tracing.start_job(uuid.uuid4().hex[:12], input_url)
 
-    # ------------------- DOWNLOAD -------------------
-    async def start_download_audio(self, widget):
-        print("download button clicked (start_download_audio)")
+            # resolve page -> stream -> playlist url, thumbnail and tags
+            # (usually already done by the speculative resolve started on paste)
+            try:
+                self.job = await self.speculator.take(input_url)
+                if self.job is None:
+                    self.job = await pipeline.resolve_track(input_url)
+            except pipeline.PipelineError as e:
+                logger.warning("could not resolve %s: %s", input_url, e)
+                await self.show_message_handler("Unknown Error", "Please try again later…")
+                return
 
-        # hide keyboard
-        self.app.main_window.content = self.app.main_window.content
+            # update ui
+            await self.show_preview_layout(self.job)
 
-        # create temp dir
-        self.create_temp_dir()
+            # fetch the first segments while the user looks at the preview
+            self.speculator.prefetch_segments(self.job)
 
-        # update ui
+    async def download_collection(self, url):
+        """Downloads every track of a set or profile, adding each file to the list as it's saved."""
         await self.show_downloading_layout()
 
-        # start downloading audio
-        dl_a_task = asyncio.create_task(
-            self.download_audio(f"{self.search_input.value}",
-                                get_dest_path(),
-                                f"{self.filename_input.value}"))
-        await dl_a_task
-        print(f"finished download_audio task")
-
-        # get path to saved file
-        file_path_dest = get_dest_path() + f"{self.filename_input.value}" + ".m4a"
-        print(f"file_path_dest={file_path_dest}")
-
-    # (2) asynchronously download audio
-    async def download_audio(self, og_url, dest_path, filename):
-        print(f"start download_audio: og_url={og_url} dest_path={dest_path}, filename={filename}")
-
-        global chunk_urls
-        global thumbnail_filename
-        global thumbnail_url
-        global playlist_url
-        global track_filename
-
-        # download playlist
-        print(f"downloading from playlist url: playlist_url={playlist_url}")
-        playlist_path = await download_m3u_file(playlist_url, str(self.get_temp_path()), filename)
-        print(f"finished playlist download: playlist_path={playlist_path}")
-
-        # parse playlist for chunk_urls
-        chunk_urls = parse_m3u_file(playlist_path)
-        print(f"finished parsing m3u: len(chunk_urls)={chunk_urls}")
-
-        # make an array of download tasks for each chunk url
-        download_tasks = [
-            download_chunk(url, self.get_temp_path(), chunk_index=i)
-            for i, url in enumerate(chunk_urls)
-        ]
-
-        # use asyncio.gather to run all tasks concurrently
-        results = await asyncio.gather(*download_tasks)
-        print(f"finished downloading chunks: len(chunk_urls)={len(chunk_urls)}")
-
-        # download thumbnail
-        await download_art(thumbnail_url, self.get_temp_path())
-        print(f"finished downloading thumbnail to: str(paths.data)={str(self.get_temp_path())}")
-
-        # check for initialization chunk
-        file_ext = ".m4s"
-        init_chunk_filepath = str(self.get_temp_path()) + "/init.mp4"
-        if (os.path.isfile(init_chunk_filepath)):
-            print(f"found init chunk at: init_chunk_filepath={init_chunk_filepath}")
-        else:
-            await self.show_message_handler("Unknown Error", "Please try again later…")
-            print(f"missing init chunk at: init_chunk_filepath={init_chunk_filepath}")
-            return
+        def on_track(job, path, error):
+            if path is not None:
+                self.upsert_file(Path(path))
+                self.filter_files(self.search_input)
+            more = "" if collection.listing_done else "+"
+            self.load_button.text = f"{collection.finished}/{collection.listed}{more}"
 
-        # get chunk paths and destination path
-        chunk_paths = [init_chunk_filepath]
-        for index, url in enumerate(chunk_urls):
-            if index != 0:
-                chunkpath = str(self.get_temp_path()) + "/chunk" + str(index) + file_ext
-                chunk_paths.append(chunkpath)
-        dest_filepath = get_dest_path() + track_filename + ".m4a"
-
-        # start concatenating
-        success = await self.concatenate_m4_segments(chunk_paths, dest_filepath)
-        if success:
-            print(
-                f"SUCCESS concat chunk files: str(len(chunk_paths))={str(len(chunk_paths))} dest_filepath={dest_filepath}")
+        collection = expand.CollectionDownload(url, self.get_temp_path(), get_dest_path(), on_track=on_track)
+        try:
+            await collection.run()
+        except preflight.InsufficientSpaceError as e:
+            logger.warning("collection %s won't fit: %s", url, e)
+            await self.show_message_handler(
+                "Not Enough Space", f"Saved {len(collection.paths)} tracks; the rest won't fit on this device.")
+        except Exception as e:
+            logger.warning("could not download collection %s: %s", url, e)
+            await self.show_message_handler("Unknown Error", "Please try again later…")
         else:
-            print(
-                f"ERROR concat chunk files: str(len(chunk_paths))={str(len(chunk_paths))} dest_filepath={dest_filepath}")
-
-        # get thumbnail filepath
-        global thumbnail_filename
-        thumbnail_filepath = str(self.get_temp_path()) + "/" + thumbnail_filename
-        print(f"thumbnail_filepath={thumbnail_filepath}")
-
-        # set file tags
-        await self.add_tags_to_mp4(dest_filepath, thumbnail_filepath)
-        print("finished setting tags")
-
-        # delete temp files
-        delete_directory_recursively(self.get_temp_path())
+            if collection.failed:
+                await self.show_message_handler(
+                    "Some Tracks Failed", f"{len(collection.failed)} of {collection.listed} tracks could not be downloaded.")
 
         # update ui
         await self.show_finished_layout()
-        print("finished showing finished layout!")
+        self.load_button.text = "Clear"
 
-    async def concatenate_m4_segments(self, file_list, output_path) -> bool:
-        """
-        Concatenates a list of .m4s or .mp4 segments into a single fragmented MP4 audio (m4a) file.
-
-        :param file_list: A list of full file paths, starting with the init segment.
-        :param output_path: The full path for the final concatenated MP4 file.
-        :return: True on success, False otherwise.
-        """
-        if not file_list:
-            print("Error: File list is empty.")
-            return False
+    # ------------------- DOWNLOAD -------------------
+    async def start_download_audio(self, widget):
+        logger.info("download button clicked (start_download_audio)")
 
-        try:
-            with open(output_path, 'wb') as outfile:
-                for filepath in file_list:
-                    with open(filepath, 'rb') as infile:
-                        # Read the segment content
-                        content = infile.read()
-                        # Write it to the final output file
-                        outfile.write(content)
-
-            print(f"Successfully concatenated files to: {output_path}")
-            return True
-
-        except FileNotFoundError as e:
-            print(f"Error: One of the files was not found: {e}")
-            return False
-        except Exception as e:
-            print(f"An unexpected error occurred: {e}")
-            return False
+        # while downloading the button plays (and pauses) what has arrived so far
+        if self.download_button.text in ("Play", "⏸", "▶"):
+            await self.play_stream()
+            return
 
-    async def add_tags_to_mp4(self, audio_file_path, image_file_path):
-        """
-        Adds album art to an MP4 audio file using the Mutagen library.
+        # hide keyboard
+        self.app.main_window.content = self.app.main_window.content
 
-        :param audio_file_path: Full path to the MP4/M4A audio file.
-        :param image_file_path: Full path to the JPEG or PNG image file.
-        """
-        print("add_tags_to_mp4 audio_file_path={audio_file_path} image_file_path={image_file_path}")
+        # continue the trace started by start_load_audio
+        if self.job_tracer is None:
+            self.job_tracer = tracing.start_job(uuid.uuid4().hex[:12], self.search_input.value)
+        tracing.activate(self.job_tracer)
 
-        global track_title
-        global track_artist
+        # update ui
+        await self.show_downloading_layout()
 
+        # download into a temp dir of its own, assembling into a part file that
+        # can be played while it grows, then tag it into the storage dir
+        job = self.job
+        partial = loopback.GrowingFile(self.get_temp_path() / f"{job.job_id}.m4a.part")
+        offer_task = self.loop.create_task(self.offer_early_playback(partial))
         try:
-            # 1. Load the MP4 file
-            audio = MP4(audio_file_path)
-
-            # 2. Determine the image format (MPEG/JPEG or PNG)
-            mime_type = ''
-            if image_file_path.lower().endswith(('.jpg', '.jpeg')):
-                mime_type = 'image/jpeg'
-                image_format = MP4Cover.FORMAT_JPEG
-            elif image_file_path.lower().endswith('.png'):
-                mime_type = 'image/png'
-                image_format = MP4Cover.FORMAT_PNG
-            else:
-                print(f"Unsupported image format for: {image_file_path}")
-                return
+            file_path_dest = await pipeline.download_track(
+                job, self.get_temp_path() / job.job_id, get_dest_path(), self.filename_input.value or None,
+                partial=partial)
+            logger.info("finished download_track: file_path_dest=%s", file_path_dest)
 
-            # 3. Read the image data
-            with open(image_file_path, 'rb') as f:
-                image_data = f.read()
+            # add file to UI
+            await self.handle_file_pick(self.main_window, [Path(file_path_dest)])
+        except preflight.InsufficientSpaceError as e:
+            logger.warning("no space for %s: %s", job.input_url, e)
+            await self.show_message_handler("Not Enough Space", "Free up some space and try again…")
+        except pipeline.DuplicateTrackError as e:
+            logger.info("not downloading %s: %s", job.input_url, e)
+            await self.show_message_handler("Already Downloaded", f"This track is saved as {Path(e.existing).name}.")
+        except pipeline.PipelineError as e:
+            logger.warning("download failed for %s: %s", job.input_url, e)
+            await self.show_message_handler("Unknown Error", "Please try again later…")
+        finally:
+            offer_task.cancel()
 
-            # 4. Create the MP4Cover object
-            cover = MP4Cover(image_data, image_format)
+            # the job is done; loading the same url again starts from scratch
+            self.speculator.cancel()
 
-            # 5. Add the cover art to the tags
-            # The key for cover art in MP4 tags is 'covr'
-            audio['covr'] = [cover]
+            # export the job's trace and fold it into the aggregate timings
+            await self.finish_job_trace()
 
-            # You can add other tags here if needed (e.g., '©nam' for Title)
-            audio['©nam'] = [track_title]
-            audio['©ART'] = [track_artist]
-            # audio['alb'] = [album_title]
-            # audio['aArt'] = [album_artist]
-            # audio['©day'] = [track_year]
-            # audio['©gen'] = [track_genre]
+        # update ui
+        await self.show_finished_layout()
 
-            # save metadata to tags
-            audio.save()
-            print(f"Successfully set tags on: {audio_file_path}")
-            
-            # add file to UI
-            await self.handle_file_pick(self.main_window, [Path(audio_file_path)])
+    async def offer_early_playback(self, partial):
+        """Turns the download button into a play button once the start of the track is in."""
+        if not NATIVE_AUDIO_SUPPORT:
+            return
+        try:
+            await partial.wait_for(EARLY_PLAYBACK_BYTES)
+        except Exception:
+            return
+        if not partial.done:
+            self.download_button.text = "Play"
+            self.download_button.enabled = True
 
-        except FileNotFoundError:
-            print("Error: Audio or image file not found.")
+    async def play_stream(self):
+        """Plays the download in progress through the loopback server."""
+        if self.stream_url is None:
+            if self.job is None or self.job.partial is None:
+                return
+            if self.job.dest_filepath:
+                # finished in the meantime: play the file itself
+                self.toggle_playback(self.job.dest_filepath, self.download_button)
+                return
+            await self.loopback.start()
+            self.stream_url = self.loopback.publish(self.job.partial)
+            self.button_map[self.stream_url] = self.download_button
+        self.toggle_playback(self.stream_url, self.download_button)
+
+    def drop_stream(self):
+        """Stops playing and serving the download in progress (if it is)."""
+        if self.stream_url is None:
+            return
+        if self.current_playing_path == self.stream_url:
+            if self.player:
+                self.player.pause()
+                self.player = None
+            self.current_playing_path = None
+        self.button_map.pop(self.stream_url, None)
+        self.loopback.unpublish(self.stream_url)
+        self.stream_url = None
+
+    async def finish_job_trace(self):
+        """Writes the current job's Chrome trace to the cache dir and updates the aggregate histograms."""
+        tracer, self.job_tracer = self.job_tracer, None
+        if tracer is None:
+            return
+        tracing.AGGREGATE.add(tracer)
+        try:
+            trace_dir = self.get_trace_path()
+            await get_io_executor().run(trace_dir.mkdir, parents=True, exist_ok=True)
+            trace_path = await get_io_executor().run(tracer.export, trace_dir / f"{tracer.job_id}.json")
+            logger.info("wrote job trace: %s", trace_path)
+            # keep only the newest traces
+            await scratch.get_collector().prune(trace_dir, keep=TRACES_KEPT, max_age=TRACE_MAX_AGE)
         except Exception as e:
-            print(f"An error occurred: {e}")
+            logger.error("Error writing job trace: %s", e)
+        logger.info("%s", tracing.AGGREGATE.report())
 
     async def show_message_handler(self, title, message):
         # create the InfoDialog instance
@@ -0,0 +1,394 @@
+"""
+Content-addressed cache of downloaded segments and finished tracks.
+
+Files are stored once per content under objects/<sha256[:2]>/<sha256>;
+index.json maps keys to them:
+
+    segment:<stream id>:<segment uri path>   raw HLS segments
+    track:<stream id>                        assembled, untagged tracks
+    artwork:<artwork uri path>               cover art
+
+Keys use the URI path only: the signed query parameters of the CDN URLs
+change on every resolve, the path doesn't. A track downloaded again (a
+re-queued URL, or another short link to the same track) comes out of the
+cache without any segment or artwork requests.
+
+The cache keeps under max_bytes by evicting the least recently used keys,
+on every store and when it opens.
+Every read is checked against the content hash; a damaged object is
+dropped and counts as a miss.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+from soundloader.fileio import get_io_executor
+from soundloader.log import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+HASH_BUFFER = 1024 * 1024
+
+_cache = None
+
+
+def segment_key(stream_id, url):
+    return f"segment:{stream_id}:{urlsplit(url).path}"
+
+
+def track_key(stream_id):
+    return f"track:{stream_id}"
+
+
+def artwork_key(url):
+    parts = urlsplit(url)
+    return f"artwork:{parts.netloc}{parts.path}"
+
+
+def hash_file(path):
+    """Returns the sha256 hex digest of a file (blocking)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(HASH_BUFFER)
+            if not block:
+                return digest.hexdigest()
+            digest.update(block)
+
+
+def copy_verified(source, dest, sha256):
+    """Copies source to dest while hashing it. Returns the size, or None if the hash doesn't match (blocking)."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(source, 'rb') as infile, open(dest, 'wb') as outfile:
+        while True:
+            block = infile.read(HASH_BUFFER)
+            if not block:
+                break
+            digest.update(block)
+            outfile.write(block)
+            size += len(block)
+    if digest.hexdigest() != sha256:
+        os.remove(dest)
+        return None
+    return size
+
+
+class MediaCache:
+    """
+    A content-addressed file cache with a byte budget and LRU eviction.
+
+    :param root: Directory of the cache (created on open()).
+    :param max_bytes: Budget for the stored objects.
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = str(root)
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(self.root, "index.json")
+        # key -> {"sha": hex digest, "size": bytes, "used": last access (epoch seconds)}
+        self.entries = {}
+        # sha -> keys that refer to it, and the bytes of the stored objects
+        self._keys = {}
+        self._total = 0
+        # objects to delete on the next _remove_garbage()
+        self._garbage = []
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._opened = False
+        self._open_lock = asyncio.Lock()
+        # parallel downloads flush at the end of each track
+        self._flush_lock = asyncio.Lock()
+
+    @property
+    def total_bytes(self):
+        return self._total
+
+    def _object_sizes(self):
+        return {entry["sha"]: entry["size"] for entry in self.entries.values()}
+
+    def _link(self, key, entry):
+        keys = self._keys.setdefault(entry["sha"], set())
+        if not keys:
+            self._total += entry["size"]
+        keys.add(key)
+
+    def _unlink(self, key, entry):
+        # True if no key refers to the object any more
+        keys = self._keys.get(entry["sha"])
+        if keys is None:
+            return False
+        keys.discard(key)
+        if keys:
+            return False
+        del self._keys[entry["sha"]]
+        self._total -= entry["size"]
+        return True
+
+    def _object_path(self, sha):
+        return os.path.join(self.root, "objects", sha[:2], sha)
+
+    # ------------------- INDEX -------------------
+    async def open(self):
+        """
+        Loads the index, dropping entries whose object is gone and objects
+        nothing refers to, then evicts down to max_bytes (the budget may have
+        shrunk since the last run).
+        """
+        async with self._open_lock:
+            if not self._opened:
+                self.entries = await get_io_executor().run(self._load)
+                self._keys, self._total = {}, 0
+                for key, entry in self.entries.items():
+                    self._link(key, entry)
+                self._opened = True
+                self._evict()
+                await self._remove_garbage()
+                await self.flush()
+
+    def _load(self):
+        os.makedirs(os.path.join(self.root, "objects"), exist_ok=True)
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = {}
+        entries = {key: e for key, e in entries.items() if os.path.exists(self._object_path(e["sha"]))}
+        referenced = {e["sha"] for e in entries.values()}
+        objects_dir = os.path.join(self.root, "objects")
+        for prefix in os.listdir(objects_dir):
+            for name in os.listdir(os.path.join(objects_dir, prefix)):
+                if name not in referenced:
+                    # written but never indexed (crash before flush) or a leftover temp file
+                    _remove_quietly(os.path.join(objects_dir, prefix, name))
+        return entries
+
+    async def _remove_garbage(self):
+        # deletes the objects dropped since the last call, in one go off the loop
+        if self._garbage:
+            # (unless a key was stored with the same content since)
+            paths = [self._object_path(sha) for sha in set(self._garbage) if sha not in self._keys]
+            self._garbage = []
+            await get_io_executor().run(_remove_all, paths)
+
+    async def flush(self):
+        """Writes the index if it changed."""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            try:
+                await get_io_executor().run(self._save, dict(self.entries))
+            except BaseException:
+                self._dirty = True
+                raise
+
+    def _save(self, entries):
+        fd, temp_path = tempfile.mkstemp(prefix="index.", suffix=".tmp", dir=self.root)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entries, f)
+            os.replace(temp_path, self.index_path)
+        except BaseException:
+            _remove_quietly(temp_path)
+            raise
+
+    # ------------------- READ -------------------
+    async def get_file(self, key, dest_path):
+        """
+        Copies the cached file for key to dest_path.
+
+        :return: The number of bytes copied, or None on a miss (or a damaged object).
+        """
+        await self.open()
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        size = await get_io_executor().run(self._copy_out, entry["sha"], str(dest_path))
+        if size is None:
+            logger.warning("cache object for %s failed its integrity check, dropping it", key)
+            self._drop_object(entry["sha"])
+            await self._remove_garbage()
+            self.misses += 1
+            return None
+        entry["used"] = time.time()
+        self._dirty = True
+        self.hits += 1
+        return size
+
+    def digest(self, key):
+        """Returns the sha256 of the content cached for key, or None."""
+        entry = self.entries.get(key)
+        return entry["sha"] if entry is not None else None
+
+    def _copy_out(self, sha, dest_path):
+        try:
+            return copy_verified(self._object_path(sha), dest_path, sha)
+        except FileNotFoundError:
+            return None
+
+    async def get_bytes(self, key):
+        """Returns the cached content for key, or None."""
+        await self.open()
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        data = await get_io_executor().run(self._read_verified, entry["sha"])
+        if data is None:
+            logger.warning("cache object for %s failed its integrity check, dropping it", key)
+            self._drop_object(entry["sha"])
+            await self._remove_garbage()
+            self.misses += 1
+            return None
+        entry["used"] = time.time()
+        self._dirty = True
+        self.hits += 1
+        return data
+
+    def _read_verified(self, sha):
+        try:
+            with open(self._object_path(sha), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        return data if hashlib.sha256(data).hexdigest() == sha else None
+
+    # ------------------- WRITE -------------------
+    async def put_file(self, key, path, link=False, sha256=None):
+        """
+        Stores the file at path under key.
+
+        :param link: Hard-link the file into the cache instead of copying it
+            (only for files nobody modifies afterwards; falls back to a copy).
+        :param sha256: The file's sha256 hex digest, if the caller hashed it
+            while writing it (saves reading it again).
+        """
+        await self.open()
+        sha, size = await get_io_executor().run(self._store_file, str(path), link, sha256)
+        self._add(key, sha, size)
+        await self._remove_garbage()
+
+    def _store_file(self, path, link, sha256=None):
+        sha = sha256 or hash_file(path)
+        object_path = self._object_path(sha)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            temp_path = f"{object_path}.{os.getpid()}.{id(path)}.tmp"
+            try:
+                if not link:
+                    raise OSError("copy requested")
+                os.link(path, temp_path)
+            except OSError:
+                shutil.copyfile(path, temp_path)
+            os.replace(temp_path, object_path)
+        return sha, os.path.getsize(object_path)
+
+    async def put_bytes(self, key, data):
+        """Stores data under key."""
+        await self.open()
+        sha = hashlib.sha256(data).hexdigest()
+        await get_io_executor().run(self._store_bytes, sha, data)
+        self._add(key, sha, len(data))
+        await self._remove_garbage()
+
+    def _store_bytes(self, sha, data):
+        object_path = self._object_path(sha)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            temp_path = f"{object_path}.{os.getpid()}.{id(data)}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, object_path)
+
+    # the object changes below only update the index; the files they drop are
+    # deleted by the caller's _remove_garbage()
+    def _add(self, key, sha, size):
+        old = self.entries.get(key)
+        entry = self.entries[key] = {"sha": sha, "size": size, "used": time.time()}
+        if old is not None and old["sha"] != sha:
+            self._release(key, old)
+        self._link(key, entry)
+        self._dirty = True
+        self._evict(keep=key)
+
+    # ------------------- EVICTION -------------------
+    async def discard(self, key):
+        """Removes key from the cache."""
+        await self.discard_prefix(key, exact=True)
+
+    async def discard_prefix(self, prefix, exact=False):
+        """Removes every key starting with prefix (e.g. the segments of a cached track)."""
+        keys = [prefix] if exact else [k for k in self.entries if k.startswith(prefix)]
+        for key in keys:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self._dirty = True
+                self._release(key, entry)
+        await self._remove_garbage()
+
+    def _release(self, key, entry):
+        # delete the object once no key refers to it
+        if self._unlink(key, entry):
+            self._garbage.append(entry["sha"])
+
+    def _drop_object(self, sha):
+        for key in self._keys.get(sha, set()).copy():
+            self._release(key, self.entries.pop(key))
+        self._garbage.append(sha)
+        self._dirty = True
+
+    def _evict(self, keep=None):
+        if self._total <= self.max_bytes:
+            return
+        sizes = self._object_sizes()
+        total = self._total
+        # an object is as recent as its most recently used key
+        last_used = {}
+        for entry in self.entries.values():
+            last_used[entry["sha"]] = max(last_used.get(entry["sha"], 0), entry["used"])
+        keep_sha = self.entries[keep]["sha"] if keep in self.entries else None
+        for sha in sorted(last_used, key=last_used.get):
+            if total <= self.max_bytes:
+                break
+            if sha == keep_sha:
+                continue
+            logger.debug("cache evicting %s (%s bytes)", sha[:12], sizes[sha])
+            self._drop_object(sha)
+            total -= sizes[sha]
+        if total > self.max_bytes and keep_sha is not None:
+            # larger than the whole budget on its own
+            self._drop_object(keep_sha)
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _remove_all(paths):
+    for path in paths:
+        _remove_quietly(path)
+
+
+def get_cache():
+    """Returns the media cache, or None if it isn't configured."""
+    return _cache
+
+
+def configure(root, max_bytes=DEFAULT_MAX_BYTES):
+    """Sets up the media cache under root (None turns it off)."""
+    global _cache
+    _cache = MediaCache(root, max_bytes) if root is not None else None
+    return _cache
@@ -0,0 +1,243 @@
+"""
+Pluggable backends for joining downloaded segments into one file.
+
+Every backend has the AudioConcatenator API:
+
+    future = backend.concatenate_audio_files(file_paths, output_path)
+    output_path = await future
+
+  * StreamingConcatenator: pure Python, copies the segments through the I/O
+    executor in large chunks. Runs everywhere. It's streaming: the pipeline
+    can also feed it segments one at a time while they download (see
+    pipeline.SegmentAssembler), so it usually has nothing left to do at the end.
+  * NativeConcatenator: MediaConcatenator (AVFoundation) through
+    soundloader.ios.ios_audio_concatenator. Only on iOS.
+
+BackendSelector picks the fastest available backend for a job from a cost
+profile measured by benchmarks/bench_concat.py:
+
+    seconds = fixed_s + per_segment_s * segments + per_mb_s * megabytes
+
+Native backends finish on their own threads. FutureBridge hands their
+result back to the event loop with call_soon_threadsafe; setting an asyncio
+future from another thread directly isn't safe.
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import sys
+
+from soundloader.fileio import get_io_executor
+from soundloader.log import get_logger
+
+logger = get_logger(__name__)
+
+# copy buffer of the pure-Python backend
+COPY_BUFFER = 1024 * 1024
+# rough size of one HLS segment (about 10 s of 128 kbps AAC), for estimates before the download
+TYPICAL_SEGMENT_BYTES = 160 * 1024
+
+# used when no measured profile is installed (bench_concat.py on a Linux x86-64 laptop)
+DEFAULT_PROFILE = {
+    "python": {"fixed_s": 0.00054, "per_segment_s": 0.000022, "per_mb_s": 0.00052},
+}
+
+
+class FutureBridge:
+    """
+    An asyncio future that may be completed from any thread.
+
+    :param loop: Loop the future belongs to (default: the running loop).
+    """
+
+    def __init__(self, loop=None):
+        self.loop = loop or asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+
+    def set_result(self, result):
+        self._call(self._set_result, result)
+
+    def set_exception(self, error):
+        self._call(self._set_exception, error)
+
+    def _call(self, fn, value):
+        if self.loop.is_closed():
+            logger.warning("concat result arrived after its loop closed: %r", value)
+            return
+        self.loop.call_soon_threadsafe(fn, value)
+
+    def _set_result(self, result):
+        # the caller may have given up (cancelled) in the meantime
+        if not self.future.done():
+            self.future.set_result(result)
+
+    def _set_exception(self, error):
+        if not self.future.done():
+            self.future.set_exception(error)
+
+
+class ConcatBackend:
+    """Base class of the concat backends. Subclasses set name and implement concatenate_audio_files."""
+
+    name = ""
+    # can take segments one at a time while they download
+    streaming = False
+
+    @classmethod
+    def available(cls):
+        return True
+
+    def concatenate_audio_files(self, file_paths, output_path):
+        """
+        Concatenates file_paths into output_path.
+
+        :param file_paths: Source files, in order.
+        :param output_path: Destination file (overwritten).
+        :return: An asyncio Future that resolves to output_path.
+        """
+        raise NotImplementedError
+
+
+def copy_files(file_paths, output_path, buffer_size=COPY_BUFFER):
+    """Writes the files one after another into output_path (blocking). Returns the bytes written."""
+    written = 0
+    with open(output_path, 'wb') as outfile:
+        for path in file_paths:
+            with open(path, 'rb') as infile:
+                shutil.copyfileobj(infile, outfile, buffer_size)
+                written += infile.tell()
+    return written
+
+
+class StreamingConcatenator(ConcatBackend):
+    """Pure-Python backend: streams the files through the I/O executor."""
+
+    name = "python"
+    streaming = True
+
+    def concatenate_audio_files(self, file_paths, output_path):
+        async def run():
+            await get_io_executor().run(copy_files, [str(p) for p in file_paths], str(output_path))
+            return output_path
+        return asyncio.ensure_future(run())
+
+
+class NativeConcatenator(ConcatBackend):
+    """MediaConcatenator (AVFoundation), on iOS only."""
+
+    name = "native"
+
+    def __init__(self):
+        from soundloader.ios.ios_audio_concatenator import AudioConcatenator
+        self._native = AudioConcatenator()
+
+    @classmethod
+    def available(cls):
+        if sys.platform != 'ios':
+            return False
+        try:
+            from soundloader.ios import ios_audio_concatenator  # noqa: F401
+        except Exception as e:
+            # no rubicon, or MediaConcatenator isn't compiled into this build
+            logger.debug("native concat unavailable: %s", e)
+            return False
+        return True
+
+    def concatenate_audio_files(self, file_paths, output_path):
+        return self._native.concatenate_audio_files(file_paths, output_path)
+
+
+BACKENDS = [StreamingConcatenator, NativeConcatenator]
+
+
+def load_profile(path):
+    """Reads a profile written by bench_concat.py. Returns DEFAULT_PROFILE if there is none."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)["backends"]
+    except (OSError, ValueError, KeyError) as e:
+        logger.debug("no concat profile at %s (%s), using the default", path, e)
+        return DEFAULT_PROFILE
+
+
+def fit_profile(samples):
+    """
+    Least-squares fit of the cost model to benchmark samples.
+
+    :param samples: [(segments, total_bytes, seconds), ...] of one backend.
+    :return: {"fixed_s", "per_segment_s", "per_mb_s"} (never negative).
+    """
+    rows = [(1.0, float(segments), total_bytes / 1e6, seconds) for segments, total_bytes, seconds in samples]
+    # normal equations (X^T X) b = X^T y, solved by Gaussian elimination
+    a = [[sum(r[i] * r[j] for r in rows) for j in range(3)] + [sum(r[i] * r[3] for r in rows)] for i in range(3)]
+    for col in range(3):
+        pivot = max(range(col, 3), key=lambda r: abs(a[r][col]))
+        if abs(a[pivot][col]) < 1e-12:
+            # not enough distinct samples for this term
+            continue
+        a[col], a[pivot] = a[pivot], a[col]
+        for r in range(3):
+            if r != col:
+                factor = a[r][col] / a[col][col]
+                a[r] = [x - factor * y for x, y in zip(a[r], a[col])]
+    coef = [a[i][3] / a[i][i] if abs(a[i][i]) >= 1e-12 else 0.0 for i in range(3)]
+    return {"fixed_s": max(0.0, coef[0]), "per_segment_s": max(0.0, coef[1]), "per_mb_s": max(0.0, coef[2])}
+
+
+class BackendSelector:
+    """
+    Picks the fastest available backend for a job, by its measured cost model.
+    Backends without a measurement are never picked over measured ones.
+
+    :param profile: {backend name: cost model} (see fit_profile).
+    :param backends: Backend classes to choose from.
+    """
+
+    def __init__(self, profile=None, backends=None):
+        self.profile = profile if profile is not None else DEFAULT_PROFILE
+        self.backends = [b for b in (backends or BACKENDS) if b.available()]
+        self._instances = {}
+
+    def predict(self, name, segments, total_bytes):
+        """Predicted seconds for backend name, or None if it hasn't been measured."""
+        model = self.profile.get(name)
+        if model is None:
+            return None
+        return model["fixed_s"] + model["per_segment_s"] * segments + model["per_mb_s"] * total_bytes / 1e6
+
+    def select(self, segments, total_bytes=None):
+        """
+        Returns a backend instance for segments files of total_bytes together.
+
+        :param total_bytes: Defaults to an estimate from the segment count.
+        """
+        if total_bytes is None:
+            total_bytes = segments * TYPICAL_SEGMENT_BYTES
+        best, best_seconds = StreamingConcatenator, None
+        for backend in self.backends:
+            seconds = self.predict(backend.name, segments, total_bytes)
+            if seconds is not None and (best_seconds is None or seconds < best_seconds):
+                best, best_seconds = backend, seconds
+        logger.debug("concat backend for %s segments / %s bytes: %s", segments, total_bytes, best.name)
+        if best not in self._instances:
+            self._instances[best] = best()
+        return self._instances[best]
+
+
+_selector = None
+
+
+def get_selector():
+    """Returns the shared selector (see set_profile_path)."""
+    global _selector
+    if _selector is None:
+        _selector = BackendSelector()
+    return _selector
+
+
+def set_profile_path(path):
+    """Makes the shared selector use the profile at path (if it exists)."""
+    global _selector
+    _selector = BackendSelector(load_profile(path) if os.path.exists(path) else None)
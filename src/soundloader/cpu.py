@@ -0,0 +1,178 @@
+"""
+CPU work tier.
+
+The I/O executor's threads suit work that waits on the disk, or that lets
+go of the GIL (hashlib on large buffers). Parsing tags, rewriting them with
+mutagen and the box walks of mp4meta are pure Python, though. On a thread
+they hold the GIL, and the event loop (with every download's network
+reads) waits for them. CPUExecutor runs that kind of work in a process
+pool instead, one worker per core.
+
+Work crosses into the workers pickled, so only module-level functions with
+plain arguments go through here, and context variables (the active trace)
+don't follow it. map() sends many small items in batches: a library scan
+of thousands of files costs a few dozen round trips, not thousands.
+
+Where processes can't be started (iOS, a sandbox without fork, a pool
+whose workers died) the same API runs on a thread pool.
+"""
+
+import asyncio
+import functools
+import importlib
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from soundloader.log import get_logger
+
+logger = get_logger(__name__)
+
+# items per task sent to a worker by map()
+DEFAULT_BATCH_SIZE = 32
+# platforms that can't start worker processes
+NO_PROCESS_PLATFORMS = ('ios', 'emscripten', 'wasi')
+# modules a worker imports when it starts, so the first task it runs doesn't
+# pay for them (the pipeline pulls in httpx; tagging needs mutagen)
+DEFAULT_PRELOAD = ('soundloader.pipeline', 'mutagen.mp4')
+
+_cpu_executor = None
+
+
+def default_workers():
+    """Cores this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return os.cpu_count() or 1
+
+
+def processes_supported():
+    return sys.platform not in NO_PROCESS_PLATFORMS
+
+
+def _context():
+    # the app has threads running (I/O pool, watcher), so don't fork it: forkserver
+    # forks workers from a clean single-threaded server, spawn starts them fresh
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _preload(modules):
+    # worker initializer; a module that's missing is imported (and fails) later, where it's used
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+
+def _run_batch(fn, items, return_exceptions):
+    results = []
+    for item in items:
+        try:
+            results.append(fn(item))
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            results.append(e)
+    return results
+
+
+class CPUExecutor:
+    """
+    Runs CPU-bound functions on a process pool, or a thread pool where
+    processes aren't available.
+
+    :param max_workers: Workers (default: one per core).
+    :param use_processes: Force processes (True) or threads (False). None
+        uses processes wherever the platform can start them.
+    :param batch_size: Most items per task in map().
+    :param preload: Modules every worker process imports as it starts.
+    """
+
+    def __init__(self, max_workers=None, use_processes=None, batch_size=DEFAULT_BATCH_SIZE,
+                 preload=DEFAULT_PRELOAD):
+        self.max_workers = max_workers or default_workers()
+        self.use_processes = processes_supported() if use_processes is None else use_processes
+        self.batch_size = batch_size
+        self.preload = tuple(preload)
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None and self.use_processes:
+            try:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=_context(),
+                                                 initializer=_preload, initargs=(self.preload,))
+            except (OSError, ValueError, NotImplementedError) as e:
+                self._fall_back(e)
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="soundloader-cpu")
+        return self._pool
+
+    def _fall_back(self, error):
+        logger.warning("no worker processes (%s), running CPU work on threads", error)
+        pool, self._pool = self._pool, None
+        self.use_processes = False
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, fn, *args):
+        """Runs fn(*args) on a worker and returns its result."""
+        loop = asyncio.get_running_loop()
+        call = functools.partial(fn, *args)
+        try:
+            # processes are started on the first submits; that's where spawning fails
+            future = loop.run_in_executor(self._get_pool(), call)
+        except (OSError, BrokenProcessPool, NotImplementedError) as e:
+            if not self.use_processes:
+                raise
+            self._fall_back(e)
+            future = loop.run_in_executor(self._get_pool(), call)
+        try:
+            return await future
+        except BrokenProcessPool as e:
+            # a worker died (killed, or it couldn't start); this call runs again on a thread
+            if self.use_processes:
+                self._fall_back(e)
+            return await loop.run_in_executor(self._get_pool(), call)
+
+    async def start(self):
+        """
+        Starts the workers ahead of the first real task (a process takes a
+        while to start and to import the preload modules, and the first
+        tagging shouldn't wait for that).
+        """
+        if self._pool is None:
+            await asyncio.gather(*(self.run(os.getpid) for _ in range(self.max_workers)))
+
+    async def map(self, fn, items, return_exceptions=False):
+        """
+        Runs fn on every item, in batches spread over the workers.
+
+        :param return_exceptions: Put an item's exception in its place in the
+            results instead of failing the whole call.
+        :return: The results, in the order of items.
+        """
+        items = list(items)
+        if not items:
+            return []
+        # small jobs still get split over every worker
+        size = max(1, min(self.batch_size, -(-len(items) // self.max_workers)))
+        batches = [items[i:i + size] for i in range(0, len(items), size)]
+        results = await asyncio.gather(*(self.run(_run_batch, fn, batch, return_exceptions) for batch in batches))
+        return [result for batch in results for result in batch]
+
+    def shutdown(self, wait=True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+
+def get_cpu_executor():
+    """Returns the process-wide CPUExecutor, creating it on first use (the workers start on first use too)."""
+    global _cpu_executor
+    if _cpu_executor is None:
+        _cpu_executor = CPUExecutor()
+    return _cpu_executor
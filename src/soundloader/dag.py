@@ -0,0 +1,129 @@
+"""
+A tiny async dependency graph.
+
+Each node is a function of its dependencies' results. run() starts every
+node as its own task right away; a node waits only for the nodes it depends
+on, so independent fetches overlap and the whole graph takes about as long
+as its critical path.
+
+    graph = Graph("resolve")
+    graph.add("page", lambda: fetch_page(url))
+    graph.add("client_id", fetch_client_id)
+    graph.add("playlist", fetch_playlist, deps=("page", "client_id"))
+    results = await graph.run()
+"""
+
+import asyncio
+import inspect
+import time
+
+from soundloader import tracing
+from soundloader.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class Node:
+    __slots__ = ('name', 'fn', 'deps', 'optional', 'start', 'end')
+
+    def __init__(self, name, fn, deps, optional):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.optional = optional
+        # perf_counter timestamps, set while the graph runs
+        self.start = None
+        self.end = None
+
+
+class Graph:
+    """
+    A set of named async (or plain) functions and the order they depend on each other.
+
+    :param name: Prefix for the trace spans of the nodes.
+    """
+
+    def __init__(self, name="dag"):
+        self.name = name
+        self.nodes = {}
+        self.origin = None
+
+    def add(self, name, fn, deps=(), optional=False):
+        """
+        Adds a node. fn is called with the results of deps, in order.
+
+        :param optional: If the node fails its result is None instead of
+            failing the graph (nodes that depend on it still run and get None).
+        """
+        for dep in deps:
+            if dep not in self.nodes:
+                raise ValueError(f"{name} depends on unknown node {dep}")
+        if name in self.nodes:
+            raise ValueError(f"duplicate node {name}")
+        self.nodes[name] = Node(name, fn, deps, optional)
+        return self
+
+    async def run(self):
+        """
+        Runs every node as soon as its dependencies are done.
+
+        :return: {node name: result}.
+        :raises: The first error of a required node. The other nodes are cancelled.
+        """
+        self.origin = time.perf_counter()
+        tasks = {}
+        for node in self.nodes.values():
+            tasks[node.name] = asyncio.ensure_future(self._run_node(node, tasks))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return {name: task.result() for name, task in tasks.items()}
+
+    async def _run_node(self, node, tasks):
+        args = [await tasks[dep] for dep in node.deps]
+        node.start = time.perf_counter()
+        try:
+            with tracing.span(f"{self.name}.{node.name}"):
+                result = node.fn(*args)
+                if inspect.isawaitable(result):
+                    result = await result
+            return result
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if not node.optional:
+                raise
+            logger.warning("%s: optional step %s failed: %s", self.name, node.name, e)
+            return None
+        finally:
+            node.end = time.perf_counter()
+
+    def critical_path(self):
+        """Returns (node names, seconds) of the chain that finished last, after run()."""
+        done = [n for n in self.nodes.values() if n.end is not None]
+        if not done:
+            return [], 0.0
+        path = []
+        node = max(done, key=lambda n: n.end)
+        while node is not None:
+            path.append(node.name)
+            deps = [self.nodes[d] for d in node.deps if self.nodes[d].end is not None]
+            node = max(deps, key=lambda n: n.end) if deps else None
+        last = max(n.end for n in done)
+        return list(reversed(path)), last - self.origin
+
+    def report(self):
+        """Returns one line per node with its start and end (ms from run())."""
+        lines = [f"{self.name} graph (ms):"]
+        for node in sorted(self.nodes.values(), key=lambda n: (n.start or 0)):
+            if node.start is None:
+                continue
+            lines.append(f"  {node.name:<14} {(node.start - self.origin) * 1000:>8.1f} -> "
+                         f"{((node.end or node.start) - self.origin) * 1000:>8.1f}  after {', '.join(node.deps) or '-'}")
+        path, seconds = self.critical_path()
+        lines.append(f"  critical path: {' -> '.join(path)} ({seconds * 1000:.1f} ms)")
+        return "\n".join(lines)
@@ -0,0 +1,339 @@
+"""
+Set (playlist) and profile URLs, expanded into track jobs.
+
+A set or profile URL is resolved through the api-v2 'resolve' endpoint with
+the shared client_id. The listing returns API track objects, so a listed
+track needs no page fetch: job_from_api_track() fills in what
+read_track_page() would have read from the page.
+
+expand() is an async generator that yields jobs as the listing comes in:
+  * sets: tracks that come back complete are yielded right away, the rest
+    (only ids) are looked up 50 at a time, several batches concurrently,
+  * profiles: the next page is requested before the jobs of the current
+    page are handed out.
+CollectionDownload feeds those jobs to a pool of downloads, so the first
+track of a 500-track set is downloading after the first listing request,
+not after the whole listing. The listing also has every track's duration,
+so a collection that won't fit on the device stops queueing tracks as soon
+as the listed ones add up to more than the free space on the volumes of the
+part files, the destination and the cache (preflight.SpacePlan), not when
+a write fails. The tracks queued by then fit and finish downloading;
+tracks in the library already aren't counted.
+"""
+
+import asyncio
+import json
+from pathlib import Path
+from urllib.parse import quote, urlsplit
+
+from soundloader import cache, fingerprint, net, pipeline, preflight
+from soundloader.fileio import get_io_executor
+from soundloader.log import get_logger
+
+logger = get_logger(__name__)
+
+API_BASE = "https://api-v2.soundcloud.com"
+# the tracks endpoint takes at most 50 ids per request
+TRACK_BATCH = 50
+# tracks per page of a profile listing
+PAGE_LIMIT = 100
+# concurrent id lookups while listing a set
+LISTING_CONCURRENCY = 4
+DEFAULT_DOWNLOAD_CONCURRENCY = 4
+
+SHORT_LINK_HOSTS = ("on.soundcloud.com", "snd.sc")
+# profile tabs that list the user's own uploads
+PROFILE_TABS = ("tracks", "popular-tracks")
+# the other profile tabs: likes, reposts and the like aren't the user's
+# uploads, albums and sets list sets. None of them is downloaded.
+OTHER_PROFILE_TABS = ("likes", "reposts", "albums", "sets", "followers", "following", "comments", "spotlight",
+                      "toptracks", "playlists")
+# site pages whose path looks like a profile or a track
+SITE_PATHS = ("you", "discover", "stream", "feed", "search", "charts", "upload", "settings", "messages",
+              "notifications", "pages", "pro", "mobile", "imprint", "terms-of-use", "popular", "tags", "jobs")
+
+
+def classify_url(url) -> str:
+    """
+    Tells what a SoundCloud URL points at from its shape alone.
+
+    :return: 'track', 'set', 'user', 'short' (a short link; see final_url)
+        or '' if it isn't a SoundCloud URL this app can download.
+    """
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host in SHORT_LINK_HOSTS:
+        return "short"
+    if host not in ("soundcloud.com", "www.soundcloud.com", "m.soundcloud.com"):
+        return ""
+    segments = [s for s in parts.path.split("/") if s]
+    if not segments or segments[0].lower() in SITE_PATHS:
+        return ""
+    if len(segments) == 1:
+        return "user"
+    if len(segments) == 2 and segments[1] in PROFILE_TABS:
+        return "user"
+    if len(segments) >= 3 and segments[1] == "sets":
+        return "set"
+    if len(segments) == 2 and segments[1] not in OTHER_PROFILE_TABS:
+        return "track"
+    return ""
+
+
+async def final_url(url) -> str:
+    """Follows the redirects of a short link and returns where it ends up."""
+    response = await net.get_client().head(url)
+    return str(response.url)
+
+
+def _api_url(path_or_url, client_id, **params):
+    url = path_or_url if path_or_url.startswith("https://") else API_BASE + path_or_url
+    if "client_id=" not in url:
+        params["client_id"] = client_id
+    sep = "&" if "?" in url else "?"
+    return url + sep + "&".join(f"{k}={quote(str(v), safe='')}" for k, v in params.items())
+
+
+async def fetch_json(url):
+    return json.loads(await net.fetch_text(url))
+
+
+def hls_transcoding(track) -> str:
+    """Returns the url of the AAC (fragmented MP4) HLS stream of an API track object, or ''."""
+    transcodings = (track.get("media") or {}).get("transcodings") or []
+    for t in transcodings:
+        fmt = t.get("format") or {}
+        # the pipeline assembles fragmented MP4 (init.mp4 + .m4s) segments; an MP3
+        # HLS playlist has no init segment and would fail every segment check
+        if fmt.get("protocol") == "hls" and "mp4" in fmt.get("mime_type", "") and t.get("url"):
+            return t["url"]
+    return ""
+
+
+def job_from_api_track(track, client_id=""):
+    """
+    Builds a TrackJob from an API track object, without fetching its page.
+
+    :return: The job, or None if the track has no AAC HLS stream (e.g. blocked in
+        this region, or only offered as MP3).
+    """
+    stream_url = hls_transcoding(track)
+    if not stream_url:
+        return None
+    job = pipeline.TrackJob(track.get("permalink_url") or f"{API_BASE}/tracks/{track.get('id')}")
+    job.stream_url = stream_url
+    job.client_id = client_id
+    job.title = track.get("title") or ""
+    job.artist = (track.get("user") or {}).get("username") or ""
+    job.duration = (track.get("duration") or 0) / 1000
+    job.filename = pipeline.sanitize_filename(job.title) or f"soundcloud_{track.get('id')}"
+    artwork_url = track.get("artwork_url") or (track.get("user") or {}).get("avatar_url") or ""
+    job.thumbnail_url, job.thumbnail_filename = pipeline.thumbnail_target(artwork_url, job.filename)
+    return job
+
+
+def _jobs(tracks, client_id):
+    for track in tracks:
+        job = job_from_api_track(track, client_id)
+        if job is None:
+            logger.warning("skipping track without an AAC HLS stream: %s", track.get("id"))
+        else:
+            yield job
+
+
+async def expand(url, client_id):
+    """
+    Yields a TrackJob for every track of a set or profile URL, as the listing arrives.
+
+    :raises pipeline.PipelineError: If url isn't a set or a profile.
+    """
+    kind = classify_url(url)
+    if kind == "user":
+        # the API resolves the profile itself, not its tabs
+        parts = urlsplit(url)
+        url = f"https://soundcloud.com/{[s for s in parts.path.split('/') if s][0]}"
+    data = await fetch_json(_api_url("/resolve", client_id, url=url))
+    if data.get("kind") == "playlist":
+        async for job in _expand_set(data, client_id):
+            yield job
+    elif data.get("kind") == "user":
+        async for job in _expand_user(data, client_id):
+            yield job
+    else:
+        raise pipeline.PipelineError(f"not a set or a profile: {url} ({data.get('kind')})")
+
+
+async def _expand_set(playlist, client_id):
+    tracks = playlist.get("tracks") or []
+    # the first few tracks come back complete, the rest only as ids
+    complete = [t for t in tracks if t.get("media")]
+    for job in _jobs(complete, client_id):
+        yield job
+
+    ids = [t["id"] for t in tracks if not t.get("media") and "id" in t]
+    batches = [ids[i:i + TRACK_BATCH] for i in range(0, len(ids), TRACK_BATCH)]
+    limit = asyncio.Semaphore(LISTING_CONCURRENCY)
+
+    async def lookup(batch):
+        async with limit:
+            found = await fetch_json(_api_url("/tracks", client_id, ids=",".join(map(str, batch))))
+        # the endpoint doesn't keep the order of the ids
+        by_id = {t.get("id"): t for t in found}
+        return [by_id[i] for i in batch if i in by_id]
+
+    tasks = [asyncio.ensure_future(lookup(batch)) for batch in batches]
+    try:
+        for task in tasks:
+            # in set order; later batches keep loading meanwhile
+            for job in _jobs(await task, client_id):
+                yield job
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _expand_user(user, client_id):
+    next_url = _api_url(f"/users/{user['id']}/tracks", client_id, limit=PAGE_LIMIT, linked_partitioning=1)
+    page = asyncio.ensure_future(fetch_json(next_url))
+    try:
+        while page is not None:
+            data = await page
+            next_href = data.get("next_href")
+            # ask for the next page before handing out this one
+            page = asyncio.ensure_future(fetch_json(_api_url(next_href, client_id))) if next_href else None
+            for job in _jobs(data.get("collection") or [], client_id):
+                yield job
+    finally:
+        if page is not None:
+            page.cancel()
+
+
+class CollectionDownload:
+    """
+    Downloads every track of a set or profile, several at a time, starting
+    as soon as the first tracks are listed.
+
+    :param url: Set or profile URL.
+    :param temp_root: Directory for the per-track temp dirs.
+    :param dest_dir: Directory the .m4a files go to.
+    :param concurrency: Tracks downloading at once.
+    :param on_track: Called as on_track(job, path, error) when a track is
+        done (path is None if it failed). A track that is in the library
+        already is skipped and reported with the path of the existing file.
+    :raises preflight.InsufficientSpaceError: From run(), after the tracks
+        that fit were downloaded, if the rest wouldn't have.
+    """
+
+    def __init__(self, url, temp_root, dest_dir, concurrency=DEFAULT_DOWNLOAD_CONCURRENCY, on_track=None):
+        self.url = url
+        self.temp_root = Path(temp_root)
+        self.dest_dir = dest_dir
+        self.concurrency = concurrency
+        self.on_track = on_track
+        self.listed = 0
+        self.listing_done = False
+        self.paths = []
+        self.failed = []
+        # tracks in the library already (pipeline.DuplicateTrackError)
+        self.skipped = []
+        # estimated size of everything queued so far
+        self.planned_bytes = 0
+        # set once a listed track didn't fit; nothing after it is queued
+        self.out_of_space = None
+        self._names = set()
+
+    @property
+    def finished(self):
+        return len(self.paths) + len(self.failed) + len(self.skipped)
+
+    async def run(self):
+        """Lists and downloads everything. Returns the saved paths."""
+        client_id = await pipeline.get_client_id_from(pipeline.CLIENT_ID_JS_URL)
+        if not client_id:
+            raise pipeline.PipelineError("no client_id")
+        media_cache = cache.get_cache()
+        if media_cache is not None:
+            # for its current size
+            await media_cache.open()
+        plan = await get_io_executor().run(self._space_plan)
+        fingerprints = fingerprint.get_index()
+        queue = asyncio.Queue()
+        workers = [asyncio.ensure_future(self._worker(queue)) for _ in range(self.concurrency)]
+        try:
+            async for job in expand(self.url, client_id):
+                self.listed += 1
+                # a track saved before is skipped by its download and takes no space
+                saved = None
+                if fingerprints is not None and job.stream_id:
+                    saved = await get_io_executor().run(fingerprints.find_existing, job.stream_id)
+                if saved is None:
+                    size = preflight.estimate_from_duration(job.duration)
+                    try:
+                        plan.add(size)
+                    except preflight.InsufficientSpaceError as e:
+                        # stop here; what's queued fits and is still downloaded
+                        self.out_of_space = e
+                        break
+                    self.planned_bytes += size
+                await queue.put(job)
+            else:
+                self.listing_done = True
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+        logger.info("collection %s: %s saved, %s already saved, %s failed%s",
+                    self.url, len(self.paths), len(self.skipped), len(self.failed),
+                    ", out of space" if self.out_of_space else "")
+        if self.out_of_space is not None:
+            raise self.out_of_space
+        return self.paths
+
+    def _space_plan(self):
+        # the volumes a track takes space on, as pipeline.space_needs() counts them,
+        # except the cache: it evicts down to its budget, so the whole collection
+        # only takes what it can still grow by
+        paths = [self.temp_root]
+        if not preflight.same_volume(self.dest_dir, self.temp_root):
+            paths.append(self.dest_dir)
+        fixed = []
+        media_cache = cache.get_cache()
+        if media_cache is not None:
+            fixed.append((media_cache.root, max(0, media_cache.max_bytes - media_cache.total_bytes)))
+        return preflight.SpacePlan(paths, fixed)
+
+    def _unique_name(self, name):
+        # two tracks with the same title must not overwrite each other
+        unique, n = name, 2
+        while unique in self._names:
+            unique, n = f"{name}_{n}", n + 1
+        self._names.add(unique)
+        return unique
+
+    async def _worker(self, queue):
+        while True:
+            job = await queue.get()
+            if job is None:
+                return
+            try:
+                await pipeline.resolve_playlist_url(job, job.client_id)
+                if not job.playlist_url:
+                    raise pipeline.PipelineError(f"no playlist for {job.input_url}")
+                path = await pipeline.download_track(job, self.temp_root / job.job_id, self.dest_dir,
+                                                     self._unique_name(job.filename))
+            except pipeline.DuplicateTrackError as e:
+                logger.info("collection track skipped: %s", e)
+                self.skipped.append(job)
+                if self.on_track:
+                    self.on_track(job, e.existing, None)
+            except Exception as e:
+                logger.warning("collection track failed: %s: %s", job.input_url, e)
+                self.failed.append(job)
+                if self.on_track:
+                    self.on_track(job, None, e)
+            else:
+                self.paths.append(path)
+                if self.on_track:
+                    self.on_track(job, path, None)
@@ -0,0 +1,201 @@
+"""
+Off-loop file I/O.
+
+All file operations in the download pipeline go through an IOExecutor: a
+small dedicated thread pool, so disk latency never stalls the event loop
+(and with it every network read). Streamed downloads use WriteBehindFile,
+which coalesces small network chunks into large positional writes and
+makes producers wait when too many bytes are queued for the disk.
+"""
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# coalesce network chunks into writes of at least this many bytes
+DEFAULT_COALESCE_SIZE = 256 * 1024
+# producers wait once this many bytes are queued but not yet on disk
+DEFAULT_MAX_PENDING_BYTES = 16 * 1024 * 1024
+DEFAULT_WORKERS = 4
+
+_default_executor = None
+
+
+class IOExecutor:
+    """
+    Runs blocking file operations on a dedicated thread pool.
+
+    :param max_workers: Number of I/O threads.
+    :param max_pending_bytes: Write-behind budget shared by every open writer.
+        Once it's used up, WriteBehindFile.write() waits for the disk to catch up.
+    """
+
+    def __init__(self, max_workers=DEFAULT_WORKERS, max_pending_bytes=DEFAULT_MAX_PENDING_BYTES):
+        self.max_pending_bytes = max_pending_bytes
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="soundloader-io")
+        self._pending_bytes = 0
+        self._space = None
+        self._space_loop = None
+
+    @property
+    def pending_bytes(self):
+        """Bytes handed to the pool that haven't been written yet."""
+        return self._pending_bytes
+
+    async def run(self, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) on the I/O pool and returns its result."""
+        loop = asyncio.get_running_loop()
+        # carry context variables (e.g. the active trace) into the worker, like asyncio.to_thread
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._pool, functools.partial(context.run, fn, *args, **kwargs))
+
+    def open_writer(self, path, coalesce_size=DEFAULT_COALESCE_SIZE):
+        """Returns a WriteBehindFile for path. Use it with 'async with'."""
+        return WriteBehindFile(self, path, coalesce_size)
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+    # ------------------- BACKPRESSURE -------------------
+    def _get_space_event(self):
+        loop = asyncio.get_running_loop()
+        if self._space is None or self._space_loop is not loop:
+            self._space = asyncio.Event()
+            self._space_loop = loop
+        return self._space
+
+    async def _reserve(self, size):
+        space = self._get_space_event()
+        # always let a write through when nothing is queued, however large it is
+        while self._pending_bytes and self._pending_bytes + size > self.max_pending_bytes:
+            space.clear()
+            await space.wait()
+        self._pending_bytes += size
+
+    def _release(self, size):
+        self._pending_bytes -= size
+        if self._space is not None:
+            self._space.set()
+
+    def _submit_write(self, fn, size):
+        """Schedules a write that has already reserved size bytes, releasing them when it finishes."""
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._pool, fn)
+        future.add_done_callback(lambda _f: self._release(size))
+        return future
+
+
+class WriteBehindFile:
+    """
+    Buffered, asynchronous file writer.
+
+    write() only copies the data into a buffer. Once coalesce_size bytes have
+    accumulated they are written at their final offset on the I/O pool while
+    the caller keeps reading from the network. close() flushes the rest and
+    reports the first write error, if any.
+    """
+
+    def __init__(self, executor, path, coalesce_size=DEFAULT_COALESCE_SIZE):
+        self.executor = executor
+        self.path = str(path)
+        self.coalesce_size = coalesce_size
+        self.bytes_written = 0
+        self._fd = -1
+        self._buffer = []
+        self._buffered = 0
+        self._offset = 0
+        self._inflight = set()
+        self._error = None
+        # platforms without pwrite share one file position, so serialise seek+write there
+        self._seek_lock = None if hasattr(os, "pwrite") else threading.Lock()
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+        self._fd = await self.executor.run(os.open, self.path, flags, 0o644)
+
+    async def write(self, data):
+        """Queues data for writing. Waits only when the executor's write-behind budget is full."""
+        self._raise_pending_error()
+        if not data:
+            return
+        self._buffer.append(bytes(data))
+        self._buffered += len(data)
+        if self._buffered >= self.coalesce_size:
+            await self._flush_buffer()
+
+    async def flush(self):
+        """Writes everything buffered so far and waits for it to reach the file."""
+        await self._flush_buffer()
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        self._raise_pending_error()
+
+    async def close(self):
+        """Flushes, closes the file and raises the first write error, if any."""
+        if self._fd < 0:
+            return
+        try:
+            await self.flush()
+        finally:
+            fd, self._fd = self._fd, -1
+            await self.executor.run(os.close, fd)
+
+    async def _flush_buffer(self):
+        if not self._buffered:
+            return
+        data = self._buffer[0] if len(self._buffer) == 1 else b"".join(self._buffer)
+        offset = self._offset
+        self._buffer = []
+        self._buffered = 0
+        self._offset += len(data)
+
+        await self.executor._reserve(len(data))
+        future = self.executor._submit_write(functools.partial(self._write_at, data, offset), len(data))
+        self._inflight.add(future)
+        future.add_done_callback(self._write_done)
+
+    def _write_at(self, data, offset):
+        view = memoryview(data)
+        while view:
+            if self._seek_lock is None:
+                written = os.pwrite(self._fd, view, offset)
+            else:
+                with self._seek_lock:
+                    os.lseek(self._fd, offset, os.SEEK_SET)
+                    written = os.write(self._fd, view)
+            view = view[written:]
+            offset += written
+        return len(data)
+
+    def _write_done(self, future):
+        self._inflight.discard(future)
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            if self._error is None:
+                self._error = error
+        else:
+            self.bytes_written += future.result()
+
+    def _raise_pending_error(self):
+        if self._error is not None:
+            raise self._error
+
+
+def get_io_executor():
+    """Returns the process-wide IOExecutor, creating it on first use."""
+    global _default_executor
+    if _default_executor is None:
+        _default_executor = IOExecutor()
+    return _default_executor
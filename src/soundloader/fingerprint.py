@@ -0,0 +1,235 @@
+"""
+Duplicate detection by audio payload.
+
+The same track saved twice (its page title changed, two short links, two
+sets that share it) ends up under two names with the same media. A file's
+fingerprint is the sha256 of its mdat payloads only. Tags live in moov,
+so renaming or retagging a file doesn't change its fingerprint.
+
+FingerprintIndex is kept in fingerprints.json in the app's data dir:
+  files:   path -> [size, mtime_ns, fingerprint]. A rescan only hashes the
+           files whose size or mtime changed,
+  streams: stream id -> fingerprint of the file it was saved as.
+The stream map is what catches a duplicate before any segment is fetched:
+download_track() asks find_existing(stream_id) as soon as it has the
+resolved job, and only a track downloaded before has an entry.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import threading
+
+from soundloader import mp4meta
+from soundloader.log import get_logger
+
+logger = get_logger(__name__)
+
+HASH_BUFFER = 1024 * 1024
+
+_index = None
+
+
+def payload_fingerprint(path):
+    """
+    Returns the sha256 hex digest of the mdat payloads of an MP4 file, or
+    None if it isn't one (blocking).
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < 8:
+            return None
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        digest = hashlib.sha256()
+        found = False
+        for kind, begin, end in mp4meta.iter_boxes(buf, 0, size):
+            if kind != b"mdat":
+                continue
+            found = True
+            for offset in range(begin, end, HASH_BUFFER):
+                digest.update(buf[offset:min(offset + HASH_BUFFER, end)])
+        return digest.hexdigest() if found else None
+    except mp4meta.MP4Error:
+        return None
+    finally:
+        buf.close()
+
+
+def file_fingerprint(path):
+    """
+    Returns (size, mtime_ns, fingerprint) of a file, or None if it isn't
+    an MP4 (blocking; picklable, so it can run on the CPU tier).
+    """
+    st = os.stat(path)
+    fingerprint = payload_fingerprint(path)
+    return (st.st_size, st.st_mtime_ns, fingerprint) if fingerprint is not None else None
+
+
+class FingerprintIndex:
+    """
+    Fingerprints of the library files and of the streams they were saved
+    from. Safe to use from worker threads.
+
+    :param path: The JSON file the index is kept in (None: memory only).
+    """
+
+    def __init__(self, path=None):
+        self.path = str(path) if path is not None else None
+        self.files = {}
+        self.streams = {}
+        self._paths = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        # download_track() and the app's fingerprint loop both save
+        self._save_lock = threading.Lock()
+
+    def load(self):
+        """Reads the index file (blocking). A missing or damaged file starts an empty index."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            files, streams = data["files"], data["streams"]
+        except (OSError, ValueError, KeyError, TypeError):
+            files, streams = {}, {}
+        with self._lock:
+            self.files = {path: tuple(entry) for path, entry in files.items()}
+            self.streams = dict(streams)
+            self._paths = {}
+            for path, (_, _, fingerprint) in self.files.items():
+                self._paths.setdefault(fingerprint, set()).add(path)
+        return self
+
+    def save(self):
+        """Writes the index file if it changed (blocking)."""
+        if self.path is None:
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                data = {"files": {path: list(entry) for path, entry in self.files.items()}, "streams": dict(self.streams)}
+                self._dirty = False
+            temp_path = None
+            try:
+                folder = os.path.dirname(self.path) or "."
+                os.makedirs(folder, exist_ok=True)
+                fd, temp_path = tempfile.mkstemp(prefix="fingerprints.", suffix=".tmp", dir=folder)
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(data, f)
+                os.replace(temp_path, self.path)
+            except BaseException:
+                # written again on the next save()
+                self._dirty = True
+                if temp_path is not None and os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+    # ------------------- FILES -------------------
+    def cached(self, path):
+        """Returns the stored fingerprint of path if the file hasn't changed since, else None (one stat)."""
+        path = str(path)
+        entry = self.files.get(path)
+        if entry is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return entry[2] if (st.st_size, st.st_mtime_ns) == entry[:2] else None
+
+    def update(self, path):
+        """
+        Returns the fingerprint of path, hashing the payload only if the
+        file is new or changed (blocking).
+        """
+        fingerprint = self.cached(path)
+        if fingerprint is not None:
+            return fingerprint
+        try:
+            entry = file_fingerprint(path)
+        except OSError as e:
+            logger.debug("could not fingerprint %s: %s", path, e)
+            return None
+        return self.store(path, entry)
+
+    def store(self, path, entry):
+        """
+        Records the file_fingerprint() of path (computed elsewhere, e.g. on the
+        CPU tier). Returns the fingerprint; None drops the file.
+        """
+        path = str(path)
+        if entry is None:
+            self.forget(path)
+            return None
+        with self._lock:
+            self._unlink(path)
+            self.files[path] = tuple(entry)
+            self._paths.setdefault(entry[2], set()).add(path)
+            self._dirty = True
+        return entry[2]
+
+    def forget(self, path):
+        """Drops a file that was removed."""
+        with self._lock:
+            if self._unlink(str(path)):
+                self._dirty = True
+
+    def retain(self, paths):
+        """Drops every file not in paths (e.g. after a full scan found the rest gone)."""
+        keep = {str(path) for path in paths}
+        with self._lock:
+            for path in [path for path in self.files if path not in keep]:
+                self._unlink(path)
+                self._dirty = True
+
+    def _unlink(self, path):
+        entry = self.files.pop(path, None)
+        if entry is None:
+            return False
+        paths = self._paths.get(entry[2])
+        if paths is not None:
+            paths.discard(path)
+            if not paths:
+                del self._paths[entry[2]]
+        return True
+
+    def paths_with(self, fingerprint):
+        """Library paths whose payload has fingerprint."""
+        with self._lock:
+            return sorted(self._paths.get(fingerprint, ()))
+
+    # ------------------- STREAMS -------------------
+    def link_stream(self, stream_id, fingerprint):
+        """Remembers that stream_id was saved as a file with fingerprint."""
+        with self._lock:
+            if self.streams.get(stream_id) != fingerprint:
+                self.streams[stream_id] = fingerprint
+                self._dirty = True
+
+    def find_existing(self, stream_id):
+        """
+        Returns the path of a library file with the payload of stream_id, or
+        None if the stream wasn't saved before (or its file is gone).
+        """
+        fingerprint = self.streams.get(stream_id)
+        if fingerprint is None:
+            return None
+        for path in self.paths_with(fingerprint):
+            if os.path.exists(path):
+                return path
+        return None
+
+
+def get_index():
+    """Returns the fingerprint index, or None if it isn't configured."""
+    return _index
+
+
+def configure(path):
+    """Sets up the fingerprint index kept at path (None turns duplicate detection off). Call load() on it."""
+    global _index
+    _index = FingerprintIndex(path) if path is not None else None
+    return _index
@@ -0,0 +1,134 @@
+"""
+Checks a segment while it downloads.
+
+A connection that drops mid-body can leave a short chunkN.m4s that looks
+like any other file, and it would end up inside the saved track. A
+SegmentVerifier is fed every network chunk as it's written (no second read
+of the file) and, at the end, checks that:
+  * the byte count matches Content-Length,
+  * the fMP4 box structure adds up: every box header is sane and the last
+    box ends exactly at the end of the body, so a truncated mdat is caught,
+  * the boxes a segment needs are there: ftyp and moov for the init
+    segment, moof and mdat for a media segment.
+It also keeps a running sha256 of the body, which goes into the job
+record (TrackJob.segment_digests) and saves the media cache from hashing
+the file again.
+"""
+
+import hashlib
+import struct
+
+INIT = 'init'
+MEDIA = 'media'
+
+REQUIRED_BOXES = {INIT: ('ftyp', 'moov'), MEDIA: ('moof', 'mdat')}
+
+
+class IntegrityError(Exception):
+    """A segment body is incomplete or isn't a well-formed fMP4 segment."""
+
+
+class SegmentVerifier:
+    """
+    Incremental checks over a segment body.
+
+    :param kind: INIT or MEDIA.
+    :param expected_length: The Content-Length, if the response had one.
+    """
+
+    def __init__(self, kind=MEDIA, expected_length=None):
+        self.kind = kind
+        self.expected_length = expected_length
+        self.length = 0
+        self.boxes = []
+        self._sha256 = hashlib.sha256()
+        # offset of the next box header, and the start of a header split over chunks
+        self._next_box = 0
+        self._header = b""
+
+    def feed(self, data):
+        """Takes the next chunk of the body. Raises IntegrityError as soon as the structure breaks."""
+        if self.expected_length is not None and self.length + len(data) > self.expected_length:
+            # longer than promised: no need to wait for the end
+            raise IntegrityError(f"got {self.length + len(data)} of {self.expected_length} bytes")
+        self._sha256.update(data)
+        start = self.length
+        self.length += len(data)
+        # walk every box header that starts inside this chunk
+        while self._next_box < self.length:
+            offset = self._next_box - start
+            if self._header or offset < 0:
+                # the header started in an earlier chunk
+                self._header += data[max(offset, 0):max(offset, 0) + 16 - len(self._header)]
+                header = self._header
+            else:
+                header = data[offset:offset + 16]
+            if not self._read_header(header):
+                self._header = header
+                return
+            self._header = b""
+
+    def _read_header(self, header):
+        if len(header) < 8:
+            return False
+        size, box_type = struct.unpack(">I4s", header[:8])
+        header_size = 8
+        if size == 1:
+            if len(header) < 16:
+                return False
+            size = struct.unpack(">Q", header[8:16])[0]
+            header_size = 16
+        elif size == 0:
+            # "to the end of the file": only sane for the last box, checked in finish()
+            size = None
+        if not box_type.isalnum():
+            raise IntegrityError(f"bad box type {box_type!r} at {self._next_box}")
+        if size is not None and size < header_size:
+            raise IntegrityError(f"bad box size {size} at {self._next_box}")
+        self.boxes.append(box_type.decode('latin-1'))
+        if size is None:
+            self._next_box = float('inf')
+        else:
+            self._next_box += size
+        return True
+
+    @property
+    def hexdigest(self):
+        return self._sha256.hexdigest()
+
+    def finish(self):
+        """
+        Checks the complete body.
+
+        :return: The sha256 hex digest of the body.
+        :raises IntegrityError: If anything is missing.
+        """
+        if self.expected_length is not None and self.length != self.expected_length:
+            raise IntegrityError(f"got {self.length} of {self.expected_length} bytes")
+        if self._next_box != float('inf') and self._next_box != self.length:
+            raise IntegrityError(f"last box ends at {self._next_box}, body has {self.length} bytes")
+        missing = [box for box in REQUIRED_BOXES[self.kind] if box not in self.boxes]
+        if missing:
+            raise IntegrityError(f"{self.kind} segment without {', '.join(missing)}")
+        return self.hexdigest
+
+
+def segment_kind(index):
+    return INIT if index == 0 else MEDIA
+
+
+def content_length(headers):
+    """The body length promised by response headers, or None (also for encoded bodies, which httpx decodes)."""
+    if headers.get("content-encoding", "identity") != "identity":
+        return None
+    try:
+        return int(headers["content-length"])
+    except (KeyError, ValueError):
+        return None
+
+
+def verify_bytes(data, kind=MEDIA):
+    """Checks a whole segment held in memory. Returns its sha256 hex digest."""
+    verifier = SegmentVerifier(kind, len(data))
+    verifier.feed(data)
+    return verifier.finish()
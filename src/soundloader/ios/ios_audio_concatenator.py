@@ -1,13 +1,14 @@
-//
-//  ios_audio_concatenator.py
-//  SoundLoader
-//
-//  Created by Max Green on 10/5/25.
+#
+#  ios_audio_concatenator.py
+#  SoundLoader
+#
+#  Created by Max Green on 10/5/25.
 
 # ios_audio_concatenator.py
 from rubicon.objc import ObjCClass, objc_method, objc_block, py_from_ns
 from pathlib import Path
-import asyncio
+
+from soundloader.concat import FutureBridge
 
 # Get references to native classes
 NSURL = ObjCClass('NSURL')
@@ -45,18 +46,20 @@ class AudioConcatenator:
         # Convert output Path to NSURL
         native_output_url = NSURL.fileURLWithPath(str(output_path))
         
-        # Create an asyncio Future to track the asynchronous native operation
-        future = asyncio.Future()
+        # Create an asyncio Future to track the asynchronous native operation.
+        # The completion block runs on an AVFoundation thread, so the result
+        # goes back to the event loop through the bridge.
+        bridge = FutureBridge()
 
         # 2. Define the Objective-C completion block (runs when the native work is done)
         @objc_block
         def completion_handler(success: bool, error: NSError) -> None:
             # Transfer the result back to the Python world
             if success:
-                future.set_result(output_path)
+                bridge.set_result(output_path)
             else:
                 py_error = py_from_ns(error)
-                future.set_exception(Exception(f"Audio concatenation failed: {py_error.localizedDescription}"))
+                bridge.set_exception(Exception(f"Audio concatenation failed: {py_error.localizedDescription}"))
         
         # 3. Call the native Objective-C method
         self._native.concatenateAudioFiles_toOutputURL_completionHandler_(
@@ -65,4 +68,4 @@ class AudioConcatenator:
             completion_handler
         )
 
-        return future
+        return bridge.future
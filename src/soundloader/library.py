@@ -0,0 +1,128 @@
+"""
+Compact in-memory index of the audio files in the storage directory.
+"""
+
+import sys
+from operator import attrgetter
+
+
+class Track:
+    """
+    One library entry. Slotted so a large library doesn't pay for a
+    per-entry __dict__, and holds no decoded artwork.
+    """
+
+    __slots__ = ('full_path', 'filename', 'title', 'artist', 'duration', 'has_art', 'fingerprint')
+
+    def __init__(self, full_path, filename, title=None, artist=None, duration=None, has_art=False,
+                 fingerprint=None):
+        self.full_path = full_path
+        self.filename = filename
+        self.title = title
+        # many tracks share an artist, so keep a single copy of each name
+        self.artist = sys.intern(artist) if isinstance(artist, str) else artist
+        self.duration = duration
+        self.has_art = has_art
+        # sha256 of the audio payload (see fingerprint.py), None until it's known
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def from_metadata(cls, file_path, metadata, fingerprint=None):
+        """
+        Builds a Track from the dictionary returned by get_m4a_metadata.
+
+        :param file_path: A pathlib.Path to the audio file.
+        :param metadata: The metadata dictionary, or None if it couldn't be read.
+        :param fingerprint: The payload fingerprint, if it's known already.
+        """
+        if not metadata:
+            return cls(str(file_path), file_path.name, fingerprint=fingerprint)
+        return cls(
+            str(file_path),
+            file_path.name,
+            title=metadata.get('title'),
+            artist=metadata.get('artist'),
+            duration=metadata.get('duration'),
+            has_art=bool(metadata.get('has_art') or metadata.get('thumbnail')),
+            fingerprint=fingerprint,
+        )
+
+    def __repr__(self):
+        return f"Track({self.full_path!r}, title={self.title!r}, artist={self.artist!r})"
+
+
+# sort keys that tolerate missing tags
+SORT_KEYS = {
+    'filename': lambda t: t.filename.lower(),
+    'title': lambda t: (t.title or "").lower(),
+    'artist': lambda t: (t.artist or "").lower(),
+    'duration': lambda t: t.duration or 0.0,
+    'full_path': attrgetter('full_path'),
+}
+
+
+class Library:
+    """
+    Tracks keyed by full path. Keeps insertion order, and adding, replacing
+    or removing a single file doesn't touch any other entry.
+    """
+
+    def __init__(self, tracks=()):
+        self._tracks = {}
+        for track in tracks:
+            self.upsert(track)
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def __iter__(self):
+        return iter(self._tracks.values())
+
+    def __contains__(self, full_path):
+        return str(full_path) in self._tracks
+
+    def get(self, full_path):
+        return self._tracks.get(str(full_path))
+
+    def upsert(self, track):
+        """Adds a track, replacing any entry with the same path. Returns True if it was new."""
+        is_new = track.full_path not in self._tracks
+        self._tracks[track.full_path] = track
+        return is_new
+
+    def remove(self, full_path):
+        """Removes and returns the entry for a path, or None if it wasn't listed."""
+        return self._tracks.pop(str(full_path), None)
+
+    def clear(self):
+        self._tracks.clear()
+
+    def filter(self, search_term):
+        """
+        Returns the tracks whose filename contains search_term (case-insensitive).
+        An empty term returns every track.
+        """
+        if not search_term:
+            return list(self._tracks.values())
+        search_term = search_term.lower()
+        return [t for t in self._tracks.values() if search_term in t.filename.lower()]
+
+    def duplicates(self):
+        """Returns lists of the tracks that share a payload fingerprint (two or more each)."""
+        groups = {}
+        for track in self._tracks.values():
+            if track.fingerprint is not None:
+                groups.setdefault(track.fingerprint, []).append(track)
+        return [group for group in groups.values() if len(group) > 1]
+
+    def sorted(self, key='filename', reverse=False, tracks=None):
+        """
+        Returns tracks ordered by one of SORT_KEYS.
+
+        :param key: Name of the field to sort by.
+        :param reverse: Sort in descending order.
+        :param tracks: Optional subset (e.g. the result of filter) to sort instead of the whole library.
+        """
+        if tracks is None:
+            tracks = self._tracks.values()
+        return sorted(tracks, key=SORT_KEYS[key], reverse=reverse)
@@ -0,0 +1,86 @@
+"""
+httpx transport that applies the limits of ratelimit.py and the priority
+slots of scheduler.py to every request.
+
+Kept out of ratelimit.py and net.py so httpx is still only imported when
+the first request is made.
+"""
+
+import httpx
+
+from soundloader import ratelimit, scheduler
+
+# times a request is retried after a 429 (after waiting for the host to unblock)
+MAX_THROTTLE_RETRIES = 3
+
+
+class LimitedStream(httpx.AsyncByteStream):
+    """
+    A response body that takes its size from the byte buckets as it's read,
+    and gives back its scheduler slot when it's closed.
+    """
+
+    def __init__(self, stream, limiter, host, slots=None):
+        self._stream = stream
+        self._limiter = limiter
+        self._host = host
+        self._slots = slots
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            await self._limiter.consume(self._host, len(chunk))
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+                self._slots = None
+
+
+class LimitedTransport(httpx.AsyncBaseTransport):
+    """
+    Waits for the request and byte buckets and for a scheduler slot around
+    another transport, and backs off (and retries) when a host answers 429.
+    The slot is held until the response body is closed.
+
+    :param transport: The transport doing the actual I/O.
+    :param limiter: A ratelimit.Limiter (default: the shared one).
+    :param slots: A scheduler.PriorityScheduler (default: the shared one).
+    """
+
+    def __init__(self, transport, limiter=None, slots=None):
+        self._transport = transport
+        self._limiter = limiter
+        self._slots = slots
+
+    async def handle_async_request(self, request):
+        limiter = self._limiter or ratelimit.get_limiter()
+        slots = self._slots or scheduler.get_scheduler()
+        host = request.url.host
+        attempt = 0
+        while True:
+            await limiter.request(host)
+            # rate limits first, so a request waiting for a token doesn't sit on a slot
+            await slots.acquire()
+            try:
+                response = await self._transport.handle_async_request(request)
+            except BaseException:
+                slots.release()
+                raise
+            if response.status_code != 429:
+                break
+            limiter.throttled(host, ratelimit.parse_retry_after(response.headers.get("retry-after")))
+            if attempt == MAX_THROTTLE_RETRIES:
+                break
+            attempt += 1
+            await response.aclose()
+            slots.release()
+        return httpx.Response(status_code=response.status_code, headers=response.headers,
+                              stream=LimitedStream(response.stream, limiter, host, slots),
+                              extensions=response.extensions)
+
+    async def aclose(self):
+        await self._transport.aclose()
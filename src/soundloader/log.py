@@ -0,0 +1,122 @@
+"""
+Logging for SoundLoader.
+
+Thin layer over the standard logging module:
+  * get_logger(name) returns a child of the "soundloader" logger,
+  * Truncated(payload) defers and caps the rendering of large payloads
+    (page HTML, JS bundles, JSON) so they cost nothing below DEBUG,
+  * RateLimitFilter caps per-key message rates (e.g. one line per segment)
+    and reports how many similar messages it dropped.
+
+Call sites use %-style arguments (logger.debug("got %s", value)) so the
+message is only formatted when the level is enabled. The level comes from
+the SOUNDLOADER_LOG_LEVEL environment variable (default INFO).
+"""
+
+import logging
+import os
+import sys
+import time
+
+ROOT_LOGGER_NAME = "soundloader"
+DEFAULT_LEVEL = "INFO"
+# default number of characters of a payload that make it into a log line
+DEFAULT_PAYLOAD_LIMIT = 200
+
+_configured = False
+
+
+class Truncated:
+    """
+    Lazily rendered, length-capped view of a payload.
+
+    logger.debug("received html=%s", Truncated(html)) never builds a string
+    unless DEBUG is enabled, and then only the first `limit` characters.
+    """
+
+    __slots__ = ('payload', 'limit')
+
+    def __init__(self, payload, limit=DEFAULT_PAYLOAD_LIMIT):
+        self.payload = payload
+        self.limit = limit
+
+    def __str__(self):
+        payload = self.payload
+        if payload is None:
+            return "None"
+        if isinstance(payload, (bytes, bytearray)):
+            text = bytes(payload[:self.limit]).decode("utf-8", "replace")
+        else:
+            text = str(payload)[:self.limit]
+        extra = len(payload) - self.limit if hasattr(payload, "__len__") else 0
+        if extra > 0:
+            return f"{text!r}… (+{extra} more)"
+        return repr(text)
+
+    __repr__ = __str__
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `burst` records per `interval` seconds for each
+    rate key. A record opts in by passing extra={'rate_key': 'segment'}; other
+    records are never limited. The next record that gets through for a key
+    carries a note with the number of records dropped in between.
+    """
+
+    def __init__(self, burst=5, interval=1.0, clock=time.monotonic):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.clock = clock
+        # rate key -> [window start, records in window, records suppressed]
+        self._windows = {}
+
+    def filter(self, record):
+        key = getattr(record, "rate_key", None)
+        if key is None:
+            return True
+        now = self.clock()
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            suppressed = window[2] if window else 0
+            window = self._windows[key] = [now, 0, 0]
+            if suppressed:
+                record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        if window[1] >= self.burst:
+            window[2] += 1
+            return False
+        window[1] += 1
+        return True
+
+
+def configure(level=None, stream=None):
+    """
+    Sets up the "soundloader" logger once: level, one stream handler and the
+    rate limit filter. Safe to call more than once.
+    """
+    global _configured
+    logger = logging.getLogger(ROOT_LOGGER_NAME)
+    level = level or os.environ.get("SOUNDLOADER_LOG_LEVEL", DEFAULT_LEVEL)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    if _configured:
+        return logger
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    handler.addFilter(RateLimitFilter())
+    logger.addHandler(handler)
+    logger.propagate = False
+    _configured = True
+    return logger
+
+
+def get_logger(name=None):
+    """Returns the "soundloader" logger or one of its children, configuring it on first use."""
+    if not _configured:
+        configure()
+    if not name or name == ROOT_LOGGER_NAME:
+        return logging.getLogger(ROOT_LOGGER_NAME)
+    if not name.startswith(ROOT_LOGGER_NAME + "."):
+        name = f"{ROOT_LOGGER_NAME}.{name}"
+    return logging.getLogger(name)
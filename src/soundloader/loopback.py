@@ -0,0 +1,296 @@
+"""
+Loopback HTTP server for playing a track while it downloads.
+
+download_track() assembles segments in playlist order into a part file
+and reports its progress on a GrowingFile. LoopbackServer serves published
+GrowingFiles on 127.0.0.1 with Range support; a read of bytes that aren't
+committed yet waits until the downloader has written them, so a player
+pointed at the URL can start as soon as the first segments are in.
+
+Ranges while the final size is still unknown:
+  * bytes=a-b  waits for byte b (or the end of the file) and sends exactly a-b,
+  * bytes=a-   sends whatever is committed past a (at least one byte) with
+               Content-Range "a-x/*"; the client asks again for the rest,
+  * bytes=-n   waits for the download to finish,
+  * no Range   streams the whole file as it grows (close-delimited).
+"""
+
+import asyncio
+import os
+import secrets
+
+from soundloader import scratch
+from soundloader.log import get_logger
+
+logger = get_logger(__name__)
+
+# bytes sent per write to the client socket
+SEND_CHUNK = 256 * 1024
+MAX_HEADER_BYTES = 16 * 1024
+
+
+class GrowingFile:
+    """
+    A file that a downloader appends to from the start, in order.
+
+    committed is the number of bytes at the start of the file that are on
+    disk and final. size is set once the download has finished.
+
+    :param path: Path of the file being written.
+    :param content_type: Content-Type to serve it with.
+    """
+
+    def __init__(self, path, content_type="audio/mp4"):
+        self.path = str(path)
+        self.content_type = content_type
+        self.committed = 0
+        self.size = None
+        self.error = None
+        # set while a LoopbackServer serves the file; the downloader then leaves it in place
+        self.published = False
+        self.delete_when_unpublished = False
+        self.readers = 0
+        self._changed = asyncio.Event()
+
+    @property
+    def done(self):
+        return self.size is not None or self.error is not None
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def commit(self, offset):
+        """Marks the first offset bytes as written."""
+        if offset > self.committed:
+            self.committed = offset
+            self._notify()
+
+    def finish(self):
+        """Marks the file complete at its committed size."""
+        self.size = self.committed
+        self._notify()
+
+    def fail(self, error):
+        """Marks the download as failed; waiting readers get the error."""
+        self.error = error
+        self._notify()
+
+    async def wait_for(self, end):
+        """
+        Waits until end bytes are committed or the file is complete.
+
+        :return: The number of bytes that can be read (<= end).
+        :raises: The download's error if it failed before end bytes arrived.
+        """
+        while self.committed < end and self.size is None:
+            if self.error is not None:
+                raise self.error
+            await self._changed.wait()
+        return min(end, self.committed)
+
+
+class LoopbackServer:
+    """
+    Serves GrowingFiles at http://127.0.0.1:<port>/<token><suffix>.
+
+    :param host: Interface to listen on (keep it on loopback).
+    :param port: 0 picks a free port.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        self._server = None
+        self._files = {}
+
+    @property
+    def running(self):
+        return self._server is not None
+
+    async def start(self):
+        if self._server is None:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+            self.port = self._server.sockets[0].getsockname()[1]
+            logger.debug("loopback server listening on %s:%s", self.host, self.port)
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def publish(self, growing, suffix=".m4a"):
+        """Makes growing available and returns its URL."""
+        token = secrets.token_urlsafe(12) + suffix
+        self._files[token] = growing
+        growing.published = True
+        return f"http://{self.host}:{self.port}/{token}"
+
+    def unpublish(self, url):
+        """Stops serving url. Deletes the file if its downloader is done with it."""
+        growing = self._files.pop(url.rsplit("/", 1)[-1], None)
+        if growing is None:
+            return
+        growing.published = False
+        if growing.delete_when_unpublished or growing.error is not None:
+            # the download left the part file to us (see scratch.py); nothing uses it any more
+            scratch.get_collector().release(growing.path)
+            try:
+                os.remove(growing.path)
+            except OSError:
+                pass
+
+    # ------------------- HTTP -------------------
+    async def _handle(self, reader, writer):
+        try:
+            while await self._handle_request(reader, writer):
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        except Exception as e:
+            logger.error("loopback request failed: %s", e)
+        finally:
+            writer.close()
+
+    async def _handle_request(self, reader, writer):
+        """Serves one request. Returns True if the connection can be reused."""
+        head = await reader.readuntil(b"\r\n\r\n")
+        if len(head) > MAX_HEADER_BYTES:
+            return await self._send_status(writer, 431, "Request Header Fields Too Large")
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _version = lines[0].split(" ", 2)
+        except ValueError:
+            return await self._send_status(writer, 400, "Bad Request")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                key, value = line.split(":", 1)
+                headers[key.strip().lower()] = value.strip()
+        keep_alive = headers.get("connection", "").lower() != "close"
+
+        if method not in ("GET", "HEAD"):
+            return await self._send_status(writer, 405, "Method Not Allowed")
+        growing = self._files.get(target.lstrip("/").split("?", 1)[0])
+        if growing is None:
+            return await self._send_status(writer, 404, "Not Found")
+
+        growing.readers += 1
+        try:
+            return await self._serve(writer, growing, method, headers.get("range"), keep_alive)
+        finally:
+            growing.readers -= 1
+
+    async def _serve(self, writer, growing, method, range_header, keep_alive):
+        common = [("Content-Type", growing.content_type), ("Accept-Ranges", "bytes")]
+
+        if not range_header:
+            if growing.size is None:
+                # length unknown: stream until the download finishes, then close
+                await self._send_head(writer, 200, "OK", common + [("Connection", "close")])
+                if method == "GET":
+                    await self._stream(writer, growing, 0, None)
+                return False
+            return await self._send_range(writer, growing, method, 200, "OK", common, 0, growing.size - 1,
+                                          keep_alive, content_range=False)
+
+        parsed = _parse_range(range_header)
+        if parsed is None:
+            return await self._send_status(writer, 416, "Range Not Satisfiable")
+        start, end = parsed
+
+        if start is None:
+            # suffix range: needs the final size
+            await growing.wait_for(float("inf"))
+            size = growing.size
+            start, end = max(0, size - end), size - 1
+        elif end is None:
+            # open ended: whatever is available from start on
+            available = await growing.wait_for(start + 1)
+            if available <= start:
+                return await self._send_unsatisfiable(writer, growing)
+            end = (growing.size if growing.size is not None else growing.committed) - 1
+        else:
+            available = await growing.wait_for(end + 1)
+            if available <= start:
+                return await self._send_unsatisfiable(writer, growing)
+            end = min(end, available - 1)
+
+        if growing.size is not None and start >= growing.size:
+            return await self._send_unsatisfiable(writer, growing)
+        return await self._send_range(writer, growing, method, 206, "Partial Content", common, start, end,
+                                      keep_alive, content_range=True)
+
+    async def _send_range(self, writer, growing, method, status, reason, headers, start, end,
+                          keep_alive, content_range):
+        length = end - start + 1
+        headers = headers + [("Content-Length", str(length))]
+        if content_range:
+            total = growing.size if growing.size is not None else "*"
+            headers.append(("Content-Range", f"bytes {start}-{end}/{total}"))
+        if not keep_alive:
+            headers.append(("Connection", "close"))
+        await self._send_head(writer, status, reason, headers)
+        if method == "GET":
+            await self._stream(writer, growing, start, end + 1)
+        return keep_alive
+
+    async def _stream(self, writer, growing, start, stop):
+        """Sends bytes [start, stop) of the file, waiting for each part to be committed. stop=None: to the end."""
+        loop = asyncio.get_running_loop()
+        fd = await loop.run_in_executor(None, os.open, growing.path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+            offset = start
+            while stop is None or offset < stop:
+                want = offset + SEND_CHUNK if stop is None else min(stop, offset + SEND_CHUNK)
+                available = await growing.wait_for(want)
+                if available <= offset:
+                    break
+                data = await loop.run_in_executor(None, _read_at, fd, offset, available - offset)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+                offset += len(data)
+        finally:
+            os.close(fd)
+
+    async def _send_unsatisfiable(self, writer, growing):
+        total = growing.size if growing.size is not None else "*"
+        await self._send_head(writer, 416, "Range Not Satisfiable",
+                              [("Content-Range", f"bytes */{total}"), ("Content-Length", "0")])
+        return True
+
+    async def _send_status(self, writer, status, reason):
+        await self._send_head(writer, status, reason, [("Content-Length", "0"), ("Connection", "close")])
+        return False
+
+    async def _send_head(self, writer, status, reason, headers):
+        lines = [f"HTTP/1.1 {status} {reason}"] + [f"{k}: {v}" for k, v in headers]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+
+def _read_at(fd, offset, size):
+    # the fd belongs to one response, so seek + read is safe everywhere (no pread on Windows)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, size)
+
+
+def _parse_range(value):
+    """Parses a single 'bytes=' range into (start, end); start None means a suffix of end bytes."""
+    if not value.startswith("bytes=") or "," in value:
+        return None
+    first, _, last = value[6:].strip().partition("-")
+    try:
+        if not first:
+            return (None, int(last)) if last else None
+        start = int(first)
+        end = int(last) if last else None
+    except ValueError:
+        return None
+    if end is not None and end < start:
+        return None
+    return start, end
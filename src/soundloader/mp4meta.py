@@ -0,0 +1,288 @@
+"""
+Tags and duration of an MP4 file, read straight from its box headers.
+
+TinyTag reads a file front to back. The tracks this app saves are
+fragmented MP4s (the init segment plus one moof/mdat pair per HLS
+segment). Their moov has no duration, so finding the duration means
+walking the whole file. read_metadata() memory-maps the file and visits
+only the boxes it needs:
+  * moov/udta/meta/ilst for the tags. The cover art is only looked at,
+    not copied, unless it's asked for,
+  * moov/mvex/mehd or moov/mvhd for the duration, when they have one,
+  * otherwise the top-level sidx, or the moof headers: the last
+    fragment's decode time (tfdt) plus its sample durations (trun, tfhd or
+    trex). Only the top-level box headers are read on the way there; the
+    mdat payloads are jumped over and never paged in.
+Anything it can't make sense of returns None, so the caller can fall back
+to TinyTag.
+"""
+
+import mmap
+import os
+import struct
+
+TEXT_TAGS = {
+    b"\xa9nam": 'title',
+    b"\xa9ART": 'artist',
+    b"\xa9alb": 'album',
+    b"\xa9gen": 'genre',
+    b"\xa9day": 'year',
+}
+NUMBER_TAGS = {b"trkn": 'track', b"disk": 'disc'}
+# 'data' atom type indicator of UTF-8 text
+DATA_UTF8 = 1
+
+# trun flags
+TRUN_DATA_OFFSET = 0x000001
+TRUN_FIRST_SAMPLE_FLAGS = 0x000004
+TRUN_SAMPLE_DURATION = 0x000100
+TRUN_SAMPLE_SIZE = 0x000200
+TRUN_SAMPLE_FLAGS = 0x000400
+TRUN_SAMPLE_CTO = 0x000800
+# tfhd flags
+TFHD_BASE_DATA_OFFSET = 0x000001
+TFHD_SAMPLE_DESCRIPTION = 0x000002
+TFHD_DEFAULT_DURATION = 0x000008
+
+
+class MP4Error(ValueError):
+    """The file isn't an MP4 (or its box structure is broken)."""
+
+
+def iter_boxes(buf, start, end):
+    """Yields (type, payload start, end) of the boxes from start to end of buf."""
+    offset = start
+    while offset + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", buf, offset)
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                raise MP4Error(f"truncated box header at {offset}")
+            size = struct.unpack_from(">Q", buf, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            # extends to the end of the file
+            size = end - offset
+        if size < header or offset + size > end:
+            raise MP4Error(f"bad size for {kind!r} at {offset}")
+        yield kind, offset + header, offset + size
+        offset += size
+
+
+def find_box(buf, start, end, *path):
+    """Returns (payload start, end) of the first box at path (e.g. b"moov", b"mvhd"), or None."""
+    for kind, begin, stop in iter_boxes(buf, start, end):
+        if kind == path[0]:
+            if len(path) == 1:
+                return begin, stop
+            return find_box(buf, begin, stop, *path[1:])
+    return None
+
+
+def _duration_field(buf, begin):
+    # mvhd and mdhd: (timescale, duration) after version/flags and the two timestamps
+    version = buf[begin]
+    if version == 1:
+        return struct.unpack_from(">IQ", buf, begin + 20)
+    return struct.unpack_from(">II", buf, begin + 12)
+
+
+def _read_tags(buf, meta, metadata, load_image):
+    begin, stop = meta
+    # ISO 'meta' is a full box (4 bytes of version and flags); QuickTime's isn't
+    if buf[begin + 4:begin + 8] != b"hdlr":
+        begin += 4
+    ilst = find_box(buf, begin, stop, b"ilst")
+    if ilst is None:
+        return
+    for kind, item_begin, item_end in iter_boxes(buf, *ilst):
+        data = find_box(buf, item_begin, item_end, b"data")
+        if data is None or data[1] - data[0] < 8:
+            continue
+        type_indicator = struct.unpack_from(">I", buf, data[0])[0] & 0xFFFFFF
+        value_begin, value_end = data[0] + 8, data[1]
+        if kind in TEXT_TAGS and type_indicator == DATA_UTF8:
+            metadata[TEXT_TAGS[kind]] = bytes(buf[value_begin:value_end]).decode('utf-8', 'replace')
+        elif kind in NUMBER_TAGS and value_end - value_begin >= 4:
+            # reserved, number, total
+            metadata[NUMBER_TAGS[kind]] = struct.unpack_from(">H", buf, value_begin + 2)[0] or None
+        elif kind == b"covr" and value_end > value_begin:
+            metadata['has_art'] = True
+            if load_image and metadata['image'] is None:
+                metadata['image'] = bytes(buf[value_begin:value_end])
+
+
+def _sidx_duration(buf, begin, stop):
+    version = buf[begin]
+    timescale = struct.unpack_from(">I", buf, begin + 8)[0]
+    offset = begin + (20 if version == 0 else 28)
+    count = struct.unpack_from(">H", buf, offset + 2)[0]
+    offset += 4
+    if not timescale or offset + count * 12 > stop:
+        return None
+    total = 0
+    for reference, duration, _sap in struct.iter_unpack(">III", buf[offset:offset + count * 12]):
+        # only media references; type 1 points at another sidx
+        if not reference >> 31:
+            total += duration
+    return total / timescale
+
+
+def _traf_end(buf, traf, default_duration):
+    """Returns (track id, decode time after the fragment or None, duration) of a traf."""
+    track_id = None
+    decode_time = None
+    duration = 0
+    for kind, begin, stop in iter_boxes(buf, *traf):
+        if kind == b"tfhd":
+            flags = struct.unpack_from(">I", buf, begin)[0] & 0xFFFFFF
+            track_id = struct.unpack_from(">I", buf, begin + 4)[0]
+            offset = begin + 8
+            if flags & TFHD_BASE_DATA_OFFSET:
+                offset += 8
+            if flags & TFHD_SAMPLE_DESCRIPTION:
+                offset += 4
+            if flags & TFHD_DEFAULT_DURATION:
+                default_duration = struct.unpack_from(">I", buf, offset)[0]
+        elif kind == b"tfdt":
+            version = buf[begin]
+            decode_time = struct.unpack_from(">Q" if version == 1 else ">I", buf, begin + 4)[0]
+        elif kind == b"trun":
+            flags = struct.unpack_from(">I", buf, begin)[0] & 0xFFFFFF
+            count = struct.unpack_from(">I", buf, begin + 4)[0]
+            offset = begin + 8
+            if flags & TRUN_DATA_OFFSET:
+                offset += 4
+            if flags & TRUN_FIRST_SAMPLE_FLAGS:
+                offset += 4
+            if not flags & TRUN_SAMPLE_DURATION:
+                duration += count * (default_duration or 0)
+                continue
+            fields = sum(1 for flag in (TRUN_SAMPLE_DURATION, TRUN_SAMPLE_SIZE, TRUN_SAMPLE_FLAGS, TRUN_SAMPLE_CTO)
+                         if flags & flag)
+            table = buf[offset:offset + count * 4 * fields]
+            if len(table) < count * 4 * fields:
+                raise MP4Error("truncated trun")
+            # the duration is the first field of every sample entry
+            duration += sum(struct.unpack(f">{count * fields}I", table)[::fields])
+    end = decode_time + duration if decode_time is not None else None
+    return track_id, end, duration
+
+
+def _top_level(buf, size):
+    """Returns {box type: [(payload start, end), ...]} of the top-level boxes (one tight pass, no generator)."""
+    boxes = {}
+    offset = 0
+    unpack_from = struct.unpack_from
+    while offset + 8 <= size:
+        box_size, kind = unpack_from(">I4s", buf, offset)
+        header = 8
+        if box_size == 1:
+            if offset + 16 > size:
+                raise MP4Error(f"truncated box header at {offset}")
+            box_size = unpack_from(">Q", buf, offset + 8)[0]
+            header = 16
+        elif box_size == 0:
+            box_size = size - offset
+        if box_size < header or offset + box_size > size:
+            raise MP4Error(f"bad size for {kind!r} at {offset}")
+        boxes.setdefault(kind, []).append((offset + header, offset + box_size))
+        offset += box_size
+    return boxes
+
+
+def _trafs(buf, moof, track_id, default_duration):
+    for kind, begin, stop in iter_boxes(buf, *moof):
+        if kind == b"traf":
+            traf_track, end, duration = _traf_end(buf, (begin, stop), default_duration)
+            if track_id is None or traf_track in (None, track_id):
+                yield end, duration
+
+
+def _fragments_duration(buf, moofs, track_id, timescale, default_duration):
+    # the last fragment's decode time covers all the ones before it
+    last = list(_trafs(buf, moofs[-1], track_id, default_duration))
+    if last and all(end is not None for end, _ in last):
+        end = max(end for end, _ in last)
+    else:
+        # no tfdt: add up every fragment
+        end = sum(duration for moof in moofs for _, duration in _trafs(buf, moof, track_id, default_duration))
+    return end / timescale if end else None
+
+
+def _read_duration(buf, top, moov):
+    mvhd = find_box(buf, *moov, b"mvhd")
+    movie_timescale, movie_duration = _duration_field(buf, mvhd[0]) if mvhd else (0, 0)
+    mvex = find_box(buf, *moov, b"mvex")
+    if mvex is None:
+        # not fragmented: the header has it
+        return movie_duration / movie_timescale if movie_timescale and movie_duration else None
+
+    mehd = find_box(buf, *mvex, b"mehd")
+    if mehd is not None and movie_timescale:
+        version = buf[mehd[0]]
+        fragment_duration = struct.unpack_from(">Q" if version == 1 else ">I", buf, mehd[0] + 4)[0]
+        if fragment_duration:
+            return fragment_duration / movie_timescale
+
+    # segments concatenated into one file each bring their own sidx
+    durations = [_sidx_duration(buf, begin, stop) for begin, stop in top.get(b"sidx", ())]
+    if durations and all(durations):
+        return sum(durations)
+
+    # the first track's media timescale, id and default sample duration
+    track_id, timescale, default_duration = None, movie_timescale, None
+    trak = find_box(buf, *moov, b"trak")
+    if trak is not None:
+        tkhd = find_box(buf, *trak, b"tkhd")
+        if tkhd is not None:
+            track_id = struct.unpack_from(">I", buf, tkhd[0] + (20 if buf[tkhd[0]] == 1 else 12))[0]
+        mdhd = find_box(buf, *trak, b"mdia", b"mdhd")
+        if mdhd is not None:
+            timescale = _duration_field(buf, mdhd[0])[0] or timescale
+    for kind, begin, stop in iter_boxes(buf, *mvex):
+        if kind == b"trex" and (track_id is None or struct.unpack_from(">I", buf, begin + 4)[0] == track_id):
+            default_duration = struct.unpack_from(">I", buf, begin + 12)[0]
+            break
+    duration = None
+    if timescale and b"moof" in top:
+        duration = _fragments_duration(buf, top[b"moof"], track_id, timescale, default_duration)
+    if duration is None and movie_timescale and movie_duration:
+        return movie_duration / movie_timescale
+    return duration
+
+
+def read_metadata(file_path, load_image=False):
+    """
+    Reads the tags and the duration of an MP4/M4A file.
+
+    :param file_path: Path of the file.
+    :param load_image: Also return the cover art bytes as 'image'.
+    :return: A dictionary with title, artist, album, genre, year, duration
+        (seconds), track, disc, has_art and image, or None if the file isn't
+        an MP4 this reader understands.
+    :raises OSError: If the file can't be opened.
+    """
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < 8:
+            return None
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if buf[4:8] != b"ftyp":
+            return None
+        metadata = dict.fromkeys(('title', 'artist', 'album', 'genre', 'year', 'duration', 'track', 'disc', 'image'))
+        metadata['has_art'] = False
+        top = _top_level(buf, size)
+        if b"moov" not in top:
+            return None
+        moov = top[b"moov"][0]
+        meta = find_box(buf, *moov, b"udta", b"meta")
+        if meta is not None:
+            _read_tags(buf, meta, metadata, load_image)
+        metadata['duration'] = _read_duration(buf, top, moov)
+        return metadata
+    except (MP4Error, struct.error, IndexError):
+        return None
+    finally:
+        buf.close()
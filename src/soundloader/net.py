@@ -0,0 +1,109 @@
+"""
+Shared HTTP client.
+
+Every request in the app goes through one lazily created httpx.AsyncClient,
+so httpx is only imported when the first request is made and connections
+are pooled across the page fetch, the API calls and the segment downloads.
+
+fetch_text and fetch_bytes are single-flight: concurrent requests for the
+same URL (the same track or artwork queued twice) share one response.
+
+All requests pass the global rate and bandwidth limits (ratelimit.py) and
+take a connection slot by priority (scheduler.py), so a resolve doesn't
+queue behind the segments of a download.
+"""
+
+from soundloader import scheduler, singleflight
+from soundloader.fileio import get_io_executor
+
+# default timeout (seconds) for requests that don't pass their own
+DEFAULT_TIMEOUT = 30.0
+
+_client = None
+# optional httpx transport for the shared client (see use_transport)
+_transport = None
+
+_text_flights = singleflight.Group("text")
+_bytes_flights = singleflight.Group("bytes")
+
+
+def get_client():
+    """Returns the shared httpx.AsyncClient, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        import httpx
+        from soundloader.limited_transport import LimitedTransport
+
+        transport = _transport or httpx.AsyncHTTPTransport(
+            # the app has never verified certificates (see the old ssl=False / verify=False calls)
+            verify=False,
+            limits=httpx.Limits(max_connections=scheduler.DEFAULT_SLOTS, max_keepalive_connections=16),
+        )
+        _client = httpx.AsyncClient(
+            timeout=DEFAULT_TIMEOUT,
+            # short links (on.soundcloud.com) redirect to the track page
+            follow_redirects=True,
+            # every request waits for the rate and bandwidth limits and a slot
+            transport=LimitedTransport(transport),
+        )
+    return _client
+
+
+def use_transport(transport):
+    """
+    Sends every request of the shared client through an httpx transport,
+    e.g. one that routes all hosts to a local stand-in server for benchmarks.
+    Pass None to go back to the network. Takes effect for the next client.
+    """
+    global _client, _transport
+    _transport = transport
+    _client = None
+
+
+async def aclose_client():
+    """Closes the shared client, if one was created."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def fetch_text(url, timeout=None) -> str:
+    """
+    Fetches a URL and returns the body as text.
+
+    :raises httpx.HTTPStatusError: For 4xx and 5xx responses.
+    :raises httpx.RequestError: For connection errors and timeouts.
+    """
+    return await _text_flights.do(url, _get_text, url, timeout)
+
+
+async def fetch_bytes(url, timeout=None) -> bytes:
+    """Fetches a URL and returns the body as bytes. Raises like fetch_text."""
+    return await _bytes_flights.do(url, _get_bytes, url, timeout)
+
+
+async def _get_text(url, timeout):
+    response = await get_client().get(url, timeout=timeout or DEFAULT_TIMEOUT)
+    response.raise_for_status()
+    return response.text
+
+
+async def _get_bytes(url, timeout):
+    response = await get_client().get(url, timeout=timeout or DEFAULT_TIMEOUT)
+    response.raise_for_status()
+    return response.content
+
+
+async def download_to(url, file_path, timeout=None) -> int:
+    """
+    Streams a URL into a local file through the write-behind I/O executor.
+
+    :return: The number of bytes written.
+    """
+    async with get_client().stream("GET", url, timeout=timeout or DEFAULT_TIMEOUT) as response:
+        response.raise_for_status()
+        async with get_io_executor().open_writer(file_path) as file:
+            async for chunk in response.aiter_bytes():
+                await file.write(chunk)
+    return file.bytes_written
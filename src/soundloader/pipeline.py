@@ -0,0 +1,1340 @@
+"""
+The resolve and download pipeline, without any UI.
+
+resolve_track() turns a track page URL into a TrackJob (stream, playlist,
+artwork and tags); download_track() fetches the playlist and its segments
+into a temp directory, concatenates them and tags the result. The app, the
+batch runner and the benchmarks all drive these same functions.
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import uuid
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from soundloader import (cache, concat, cpu, dag, fingerprint, integrity, net, preflight, ratelimit, scheduler,
+                         scratch, segstore, singleflight, tracing)
+from soundloader.loopback import GrowingFile
+from soundloader.fileio import get_io_executor
+from soundloader.log import Truncated, get_logger
+
+logger = get_logger(__name__)
+
+# global constants
+TWITTER_PLAYER = "twitter:player"
+TWITTER_TITLE = "twitter:title"
+STREAM_URL_BEGIN = "https://api-v2.soundcloud.com/media/soundcloud:tracks:"
+STREAM_URL_END = "/stream/hls"
+BASE_URL_THUMBNAIL = "i1.sndcdn.com/a"
+STREAM_ID_BEGIN = "media/soundcloud:tracks:"
+STREAM_ID_END = "/stream"
+FLAG_CLIENT_ID = "client_id:u?"
+TEST_STREAM_ID = "151531814"
+CLIENT_ID_JS_URL = "https://a-v2.sndcdn.com/assets/0-2e3ca6a5.js"
+# tries per segment (a failed integrity check or a dropped connection is retried)
+SEGMENT_ATTEMPTS = 3
+SEGMENT_RETRY_DELAY = 0.25
+COPY_BUFFER = 1024 * 1024
+
+
+class PipelineError(Exception):
+    """A track couldn't be resolved or downloaded. The message says which step failed."""
+
+
+class DuplicateTrackError(PipelineError):
+    """The track is in the library already (see fingerprint.py); existing is its path."""
+
+    def __init__(self, stream_id, existing):
+        super().__init__(f"track {stream_id} is already saved as {existing}")
+        self.stream_id = stream_id
+        self.existing = existing
+
+
+class TrackJob:
+    """
+    Everything the pipeline learns about one track, from the page URL to the
+    saved file. Replaces the module level globals the app used to share
+    between the load and download steps.
+
+    :param input_url: The track page URL (or short link) the user entered.
+    """
+
+    def __init__(self, input_url):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.input_url = input_url
+        self.player_url = ""
+        self.stream_url = ""
+        self.client_id = ""
+        self.full_stream_url = ""
+        self.playlist_url = ""
+        self.chunk_urls = []
+        self.filename = ""
+        self.thumbnail_url = ""
+        self.thumbnail_filename = ""
+        self.title = ""
+        self.artist = ""
+        # seconds, when known before the playlist is (from an API listing)
+        self.duration = 0.0
+        # prefetched by resolve_track (None if not fetched)
+        self.artwork = None
+        self.playlist_text = None
+        # segment index -> task fetching its bytes ahead of the download (see speculate.py)
+        self.segment_prefetch = {}
+        # set by download_track
+        self.partial = None
+        self.dest_filepath = ""
+        self.bytes_downloaded = 0
+        # preflight.SizeEstimate of the assembled track
+        self.size_estimate = None
+        # sha256 of every verified segment (index -> hex digest) and of the assembled, untagged track
+        self.segment_digests = {}
+        self.sha256 = ""
+        # payload fingerprint of the saved file (see fingerprint.py)
+        self.fingerprint = ""
+
+    @property
+    def stream_id(self):
+        # the track id in .../media/soundcloud:tracks:<id>/stream/hls
+        if STREAM_ID_BEGIN not in self.stream_url:
+            return ""
+        return self.stream_url.split(STREAM_ID_BEGIN, 1)[1].split(STREAM_ID_END, 1)[0]
+
+    def __repr__(self):
+        return f"TrackJob({self.job_id}, {self.input_url!r})"
+
+
+# remove prohibited characters from filename
+def sanitize_filename(filename):
+    """Removes or replaces sensitive characters from a filename.
+
+    Args:
+        filename (str): The filename to sanitize.
+
+    Returns:
+        str: The sanitized filename.
+    """
+
+    # 1. Remove or replace characters that are invalid across platforms
+    filename = re.sub(r'[<>:"/\\|?*\x00-\x1F]', '_', filename)
+
+    # 2. Remove or replace characters that might cause issues with specific OS
+    filename = filename.replace(' ', '_')  # replace spaces
+    filename = filename.strip('. ')  # Remove leading/trailing spaces and dots
+
+    # 3. Remove potentially problematic characters
+    filename = re.sub(r'[,;!@#\$%^&()+]', '', filename)
+
+    # 4. Normalize Unicode characters
+    filename = filename.encode('ascii', 'ignore').decode('ascii')
+
+    return filename
+
+
+# delete directory and all its files and subfolders
+def delete_directory_recursively(directory_path):
+    logger.debug("delete_directory_recursively: directory_path=%s", directory_path)
+
+    # check if dir exists
+    if not os.path.exists(directory_path):
+        logger.error("Error: Directory '%s' does not exist.", directory_path)
+        return
+
+    try:
+        # The core function for recursive deletion
+        shutil.rmtree(directory_path)
+        logger.debug("Directory '%s' and all contents deleted successfully.", directory_path)
+    except PermissionError:
+        logger.error("Error: Permission denied. Cannot delete directory '%s'.", directory_path)
+    except Exception as e:
+        # Catch any other unexpected I/O errors
+        logger.error("An unexpected error occurred while deleting '%s': %s", directory_path, e)
+
+
+# create (or empty) a temp directory for one job
+async def prepare_temp_dir(temp_dir):
+    io_executor = get_io_executor()
+    docs_path = str(temp_dir)
+    if os.path.isdir(docs_path):
+        # a leftover of an earlier run: moved aside and deleted in the background
+        await scratch.get_collector().discard(docs_path)
+    await io_executor.run(os.makedirs, docs_path, exist_ok=True)
+    logger.debug("Directory '%s' created successfully.", docs_path)
+
+
+# write a file into another at offset and delete it, hashing what's copied
+# on the way (blocking; run on the I/O executor)
+def write_file_at(output_path, offset, segment_path, digest=None) -> int:
+    with open(output_path, 'r+b') as outfile, open(segment_path, 'rb') as infile:
+        outfile.seek(offset)
+        while True:
+            block = infile.read(COPY_BUFFER)
+            if not block:
+                break
+            if digest is not None:
+                digest.update(block)
+            outfile.write(block)
+        size = infile.tell()
+    os.remove(segment_path)
+    return size
+
+
+# write an in-memory segment into a file at offset, hashing it (blocking; run on the I/O executor)
+def write_buffer_at(output_path, offset, data, digest=None) -> int:
+    with open(output_path, 'r+b') as outfile:
+        outfile.seek(offset)
+        outfile.write(data)
+    if digest is not None:
+        digest.update(data)
+    return len(data)
+
+
+# create (or empty) a file and preallocate it (blocking; run on the I/O executor)
+def create_output(output_path, expected_size=None) -> bool:
+    open(output_path, 'wb').close()
+    return bool(expected_size) and preflight.preallocate(output_path, expected_size)
+
+
+# cut a preallocated file back to what was written (blocking; run on the I/O executor)
+def truncate_file(path, size):
+    with open(path, 'r+b') as f:
+        f.truncate(size)
+
+
+class SegmentAssembler:
+    """
+    Appends downloaded segments to the output in playlist order while the
+    rest are still downloading: segment i goes in as soon as it and every
+    segment before it are on disk. The output grows from the start, which is
+    what lets the loopback server play a track before it has finished.
+
+    :param output_path: The file to assemble (truncated by open()).
+    :param count: Number of segments in the playlist (init segment included).
+    :param growing: Optional GrowingFile that is told how many bytes are final.
+    :param expected_size: Estimated final size; the file is preallocated to it.
+    """
+
+    def __init__(self, output_path, count, growing=None, expected_size=None):
+        self.output_path = str(output_path)
+        self.count = count
+        self.growing = growing
+        self.expected_size = expected_size
+        self.preallocated = False
+        # running hash of the output, fed by the appends (no extra read)
+        self.digest = hashlib.sha256()
+        self.next_index = 0
+        self.offset = 0
+        self.failed_index = None
+        self._ready = {}
+        self._lock = asyncio.Lock()
+
+    @property
+    def complete(self):
+        return self.next_index == self.count
+
+    async def open(self):
+        self.preallocated = await get_io_executor().run(create_output, self.output_path, self.expected_size)
+
+    async def add(self, index, segment):
+        """Hands over segment index: its file, a segstore.MemorySegment, or '' if its download failed."""
+        self._ready[index] = segment
+        async with self._lock:
+            while self.failed_index is None and self.next_index in self._ready:
+                segment = self._ready.pop(self.next_index)
+                if not segment:
+                    # everything after a missing segment would be unplayable
+                    self.failed_index = self.next_index
+                    return
+                # written at its offset: a preallocated file is already longer
+                if isinstance(segment, segstore.MemorySegment):
+                    try:
+                        self.offset += await get_io_executor().run(write_buffer_at, self.output_path, self.offset,
+                                                                   segment.view, self.digest)
+                    finally:
+                        segment.release()
+                else:
+                    self.offset += await get_io_executor().run(write_file_at, self.output_path, self.offset,
+                                                               segment, self.digest)
+                self.next_index += 1
+                if self.growing is not None:
+                    self.growing.commit(self.offset)
+
+    async def finish(self):
+        # everything was appended as it arrived; only the unused part of the
+        # preallocation (the estimate was high) has to go
+        if self.preallocated:
+            await get_io_executor().run(truncate_file, self.output_path, self.offset)
+
+
+class BatchAssembler:
+    """
+    SegmentAssembler's interface for concat backends that can't stream (the
+    native one): keeps the segment files until all of them are in, then
+    hands them to the backend in one go.
+
+    :param backend: A concat.ConcatBackend.
+    """
+
+    def __init__(self, output_path, count, growing=None, backend=None):
+        self.output_path = str(output_path)
+        self.count = count
+        self.growing = growing
+        self.backend = backend or concat.StreamingConcatenator()
+        self.next_index = 0
+        self.offset = 0
+        self.failed_index = None
+        # the backend writes the output, so there is no running hash
+        self.digest = None
+        self._paths = [None] * count
+
+    @property
+    def complete(self):
+        return self.next_index == self.count
+
+    async def open(self):
+        pass
+
+    async def add(self, index, segment_path):
+        self._paths[index] = segment_path
+
+    async def finish(self):
+        missing = [i for i, path in enumerate(self._paths) if not path]
+        if missing:
+            self.failed_index = missing[0]
+            return
+        if not await concatenate_m4_segments(self._paths, self.output_path, self.backend):
+            raise PipelineError(f"could not concatenate {self.count} segments with {self.backend.name}")
+        self.next_index = self.count
+        self.offset = await get_io_executor().run(os.path.getsize, self.output_path)
+        if self.growing is not None:
+            self.growing.commit(self.offset)
+
+
+# write cover art, title and artist tags (blocking; run on the I/O executor)
+def write_mp4_tags(audio_file_path, image_file_path, title, artist) -> bool:
+    from mutagen.mp4 import MP4, MP4Cover
+
+    # 1. Load the MP4 file
+    audio = MP4(audio_file_path)
+
+    # 2. Determine the image format (MPEG/JPEG or PNG)
+    if image_file_path.lower().endswith(('.jpg', '.jpeg')):
+        image_format = MP4Cover.FORMAT_JPEG
+    elif image_file_path.lower().endswith('.png'):
+        image_format = MP4Cover.FORMAT_PNG
+    else:
+        logger.warning("Unsupported image format for: %s", image_file_path)
+        return False
+
+    # 3. Read the image data
+    with open(image_file_path, 'rb') as f:
+        image_data = f.read()
+
+    # 4. Create the MP4Cover object and add it to the tags
+    # The key for cover art in MP4 tags is 'covr'
+    audio['covr'] = [MP4Cover(image_data, image_format)]
+
+    # You can add other tags here if needed (e.g., '©nam' for Title)
+    audio['©nam'] = [title]
+    audio['©ART'] = [artist]
+    # audio['alb'] = [album_title]
+    # audio['aArt'] = [album_artist]
+    # audio['©day'] = [track_year]
+    # audio['©gen'] = [track_genre]
+
+    # save metadata to tags
+    audio.save()
+    return True
+
+
+# ------------------- RESOLVE -------------------
+# (1A) get html from url as string
+@tracing.traced()
+async def get_html_from(url: str) -> str:
+    """
+    Asynchronously fetches the HTML content of a given URL.
+
+    Args:
+        url: The URL of the webpage to fetch.
+
+    Returns:
+        The HTML content as a string, or "" if an error occurs.
+    """
+
+    import httpx
+
+    try:
+        # Send the request through the shared client
+        # Raise an exception for bad status codes (4xx or 5xx)
+        html = await net.fetch_text(url)
+        logger.debug("received html response from: url=%s", url)
+        return html
+
+    except httpx.RequestError as e:
+        # Handle connection-related errors (e.g., DNS failure, connection refused)
+        logger.error("Connection Error for %s: %s", url, e)
+        return ""
+    except httpx.HTTPStatusError as e:
+        # Handle HTTP errors (e.g., 404 Not Found, 500 Server Error)
+        logger.error("HTTP Error for %s: %s %s", url, e.response.status_code, e.response.reason_phrase)
+        return ""
+    except Exception as e:
+        # Handle any other unexpected exceptions
+        logger.error("An unexpected error occurred for %s: %s", url, e)
+        return ""
+
+
+# (1B) parse html for player_url
+def extract_player_url(html) -> str:
+    logger.debug("extract_player_url: len(html)=%s", len(html))
+
+    # check for test stream id
+    if TEST_STREAM_ID in html:
+        # TODO extract stream id
+        logger.debug("found test stream id: TEST_STREAM_ID=%s", TEST_STREAM_ID)
+    else:
+        logger.debug("missing test stream id: TEST_STREAM_ID=%s", TEST_STREAM_ID)
+
+    if TWITTER_PLAYER in html:
+        logger.debug("found TWITTER_PLAYER in html")
+
+        # extract player_url
+        searchIndex = html.find(TWITTER_PLAYER) + len(TWITTER_PLAYER)
+        startIndex = html.find("content", searchIndex) + 9
+        endIndex = html.find('"', startIndex)
+        return html[startIndex:endIndex]
+    logger.warning("missing TWITTER_PLAYER in html:\nhtml=%s", Truncated(html))
+    return ""
+
+
+# (1C) extract stream url from the page
+def extract_stream_url(html) -> str:
+    if STREAM_ID_BEGIN in html and STREAM_ID_END in html:
+        start = html.find(STREAM_ID_BEGIN) + len(STREAM_ID_BEGIN)
+        end = html.find(STREAM_ID_END)
+        return STREAM_URL_BEGIN + html[start:end] + STREAM_URL_END
+    return ""
+
+
+# (1E) extract filename, thumbnail_url, metadata
+def extract_info(html) -> tuple[str, str, str, str]:
+    logger.debug("extract_info: len(html)=%s", len(html))
+
+    # check for test stream id
+    if TEST_STREAM_ID in html:
+        # TODO extract stream id
+        logger.debug("found test stream id: TEST_STREAM_ID=%s", TEST_STREAM_ID)
+    else:
+        logger.debug("missing test stream id: TEST_STREAM_ID=%s", TEST_STREAM_ID)
+
+    # extract filename
+    filename = "soundloader_download"
+    if TWITTER_TITLE in html:
+        searchIndex = html.find(TWITTER_TITLE)
+        startIndex = html.find("content", searchIndex) + 9
+        endIndex = html.find('"', startIndex)
+        filename = html[startIndex:endIndex]
+        logger.debug("found TWITTER_TITLE in html: filename=%s", filename)
+    else:
+        logger.warning("missing TWITTER_TITLE in html: filename=%s", filename)
+
+    # extract thumbnail url
+    t_url = ""
+    if BASE_URL_THUMBNAIL in html:
+        startIndex = html.find(BASE_URL_THUMBNAIL)
+        endIndex = html.find('"', startIndex)
+        t_url = "https://" + html[startIndex:endIndex]
+        logger.debug("found BASE_URL_THUMBNAIL in html: t_url=%s", t_url)
+    else:
+        logger.warning("missing BASE_URL_THUMBNAIL in html: t_url=%s", t_url)
+
+    # get meta
+    meta = ""
+    if "<h1" in html and "<meta" in html:
+        start = html.find("<h1")
+        end = html.find("<meta", start)
+        meta = html[start:end]
+    else:
+        logger.warning("html missing meta!")
+
+    # get track title and artist
+    tt = filename  # default title
+    ta = ""
+    if "<a" in meta:
+        search = meta.find("<a")
+        start = meta.find(">", search)
+        end = meta.find("</a", start)
+        tt = meta[start:end]
+        logger.debug("found track title: tt=%s", tt)
+        search = meta.rfind("<a")
+        start = meta.find(">", search)
+        end = meta.find("</a", start)
+        ta = meta[start:end]
+        logger.debug("found track artist: ta=%s", ta)
+    return filename, t_url, tt, ta
+
+
+# pick the artwork url and file name for a track
+def thumbnail_target(thumbnail_url, track_filename) -> tuple[str, str]:
+    # set thumbnail resolution
+    if "-large" in thumbnail_url:
+        logger.debug("changed resolution of thumbnail_url to t500x500")
+        thumbnail_url.replace("-large", "-t500x500")
+    else:
+        logger.debug("kept resolution of thumbnail_url")
+
+    # set thumbnail filename
+    if thumbnail_url.endswith(".jpg"):
+        # handle jpg
+        thumbnail_filename = track_filename + ".jpg"
+    elif thumbnail_url.endswith(".webp"):
+        # convert webp to jpg
+        thumbnail_filename = track_filename + ".jpg"
+        thumbnail_url = thumbnail_url.replace("vi_webp", "vi")
+        thumbnail_url = thumbnail_url.replace(".webp", ".jpg")
+    elif thumbnail_url.endswith(".png"):
+        # handle png
+        thumbnail_filename = track_filename + ".png"
+    else:
+        # handle unexpected file extension
+        thumbnail_filename = track_filename + thumbnail_url[thumbnail_url.rfind('.'):]
+        logger.warning("unexpected file extension: thumbnail_url=%s", thumbnail_url)
+    logger.debug("thumbnail_filename=%s", thumbnail_filename)
+    return thumbnail_url, thumbnail_filename
+
+
+# (1F) scan a js bundle for the client_id
+def extract_client_id(js_content) -> str:
+    start = js_content.find('client_id=')
+    if start < 0:
+        return ""
+    start += 10
+    end = js_content.find('"', start)
+    return js_content[start:end]
+
+
+# (1F) get client_id
+@tracing.traced()
+async def get_client_id_from(js_url) -> str:
+    import httpx
+
+    try:
+        # execute js request (raises for bad status codes)
+        js_content = await net.fetch_text(js_url, timeout=10)
+        logger.debug("received javascript: js_content=%s", Truncated(js_content))
+
+        # check for test stream id
+        if TEST_STREAM_ID in js_content:
+            # TODO extract stream id
+            logger.debug("found test stream id: TEST_STREAM_ID=%s", TEST_STREAM_ID)
+        else:
+            logger.debug("missing test stream id: TEST_STREAM_ID=%s", TEST_STREAM_ID)
+
+        # extract client_id
+        c_id = extract_client_id(js_content)
+        if c_id:
+            logger.debug("found client_id! c_id=%s", c_id)
+        return c_id
+
+    except httpx.HTTPError as e:
+        logger.error("Error: %s", e)
+        return ""
+
+    except Exception as e:
+        logger.error("Unexpected Error: %s", e)
+        return ""
+
+
+# (1G) request json w/ response handler
+@tracing.traced()
+async def get_json_as_string(url: str) -> str:
+    import httpx
+
+    logger.debug("start get_json_as_string: url=%s", url)
+    try:
+        # get the response content as a string (raises for 4xx or 5xx)
+        json_string = await net.fetch_text(url)
+        logger.debug("received json_string=%s", Truncated(json_string))
+
+        # check for test stream id
+        if TEST_STREAM_ID in json_string:
+            # TODO extract stream id
+            logger.debug("found test stream id: TEST_STREAM_ID=%s", TEST_STREAM_ID)
+        else:
+            logger.debug("missing test stream id: TEST_STREAM_ID=%s", TEST_STREAM_ID)
+
+        return json_string
+
+    except httpx.HTTPStatusError as e:
+        # Handle HTTP errors (e.g., 404 Not Found, 500 Server Error)
+        return f"HTTP Error: {e.response.status_code} - {e.response.reason_phrase}"
+    except httpx.RequestError as e:
+        # Handle general request errors (e.g., connection timeout, DNS error)
+        return f"Request Error: An error occurred while requesting {e.request.url} - {e.__class__.__name__}"
+    except Exception as e:
+        # Handle other unexpected errors
+        return f"An unexpected error occurred: {e}"
+
+
+# (1H) get playlist url from the stream json
+@tracing.traced()
+async def fetch_playlist_url(url) -> str:
+    playlist_url = ""
+    json_str = await get_json_as_string(url)
+    logger.debug("finished request json_str=%s", Truncated(json_str))
+
+    # get playlist_url from json
+    if "https://" in json_str:
+        start = json_str.find("https://")
+        end = json_str.find('"', start)
+        playlist_url = json_str[start:end]
+        logger.debug("found playlist_url=%s", playlist_url)
+    else:
+        logger.warning("missing playlist_url in json_str=%s", Truncated(json_str))
+    return playlist_url
+
+
+# (1) read everything the job needs from the track page
+def read_track_page(job, html):
+    logger.debug("finished get_html_from: html=%s", Truncated(html))
+
+    # extract player url
+    job.player_url = extract_player_url(html)
+    logger.debug("found player_url=%s", job.player_url)
+
+    # extract last stream url
+    job.stream_url = extract_stream_url(html)
+    if not job.stream_url:
+        logger.warning("missing stream id in: player_url=%s", job.player_url)
+        raise PipelineError(f"missing stream id in {job.input_url}")
+    logger.debug("stream_url=%s", job.stream_url)
+
+    # check for progressive stream
+    if "stream/progressive" in html:
+        logger.debug("found stream/progressive !")
+    else:
+        logger.debug("missing stream/progressive !")
+
+    # extract thumbnail, filename and metadata
+    filename, thumbnail_url, job.title, job.artist = extract_info(html)
+    logger.debug("audio info: track_filename=%s thumbnail_url=%s track_title=%s track_artist=%s",
+                 filename, thumbnail_url, job.title, job.artist)
+
+    # sanitize filename
+    job.filename = sanitize_filename(filename)
+    job.thumbnail_url, job.thumbnail_filename = thumbnail_target(thumbnail_url, job.filename)
+    return job
+
+
+# (1H) build the full stream url and ask the api for the playlist url
+async def resolve_playlist_url(job, client_id) -> str:
+    job.client_id = client_id
+    logger.debug("client_id=%s", job.client_id)
+
+    # build full stream url
+    job.full_stream_url = job.stream_url + "?client_id=" + job.client_id  # + "&app_version=1759307428&app_locale=en"
+    logger.debug("full_stream_url=%s", job.full_stream_url)
+
+    # get playlist url
+    job.playlist_url = await fetch_playlist_url(job.full_stream_url)
+    logger.debug("playlist_url=%s", job.playlist_url)
+    return job.playlist_url
+
+
+# (1I) prefetch the artwork for the preview (and later the tags)
+async def prefetch_artwork(job):
+    if not job.thumbnail_url:
+        return None
+    with scheduler.priority_scope(scheduler.ARTWORK):
+        job.artwork = await net.fetch_bytes(job.thumbnail_url)
+    return job.artwork
+
+
+# (1J) prefetch the playlist so the download can start on the segments right away
+async def prefetch_playlist(job):
+    if not job.playlist_url:
+        return None
+    with scheduler.priority_scope(scheduler.HEAD):
+        job.playlist_text = await net.fetch_text(job.playlist_url)
+    return job.playlist_text
+
+
+@tracing.traced()
+async def resolve_track(input_url, prefetch=True) -> TrackJob:
+    """
+    Resolves a track page into everything needed to download it.
+
+    The steps run as a dependency graph: the client_id lookup doesn't need
+    the page, so it overlaps the page fetch; the artwork is fetched as soon
+    as the page is parsed, and the playlist as soon as its url is known.
+
+    :param input_url: The track page URL (or short link).
+    :param prefetch: Also fetch the artwork and the playlist (job.artwork,
+        job.playlist_text). Failures there don't fail the resolve.
+    :return: A TrackJob with playlist_url, thumbnail and tags filled in.
+    :raises PipelineError: If the page has no stream id.
+    """
+    job = TrackJob(input_url)
+
+    graph = dag.Graph("resolve")
+    graph.add("page", lambda: get_html_from(input_url))
+    graph.add("client_id", lambda: get_client_id_from(CLIENT_ID_JS_URL))
+    graph.add("info", lambda html: read_track_page(job, html), deps=("page",))
+    graph.add("playlist_url", lambda _job, client_id: resolve_playlist_url(job, client_id),
+              deps=("info", "client_id"))
+    if prefetch:
+        graph.add("artwork", lambda _job: prefetch_artwork(job), deps=("info",), optional=True)
+        graph.add("playlist", lambda _url: prefetch_playlist(job), deps=("playlist_url",), optional=True)
+    # the requests of this job share the rate limits fairly with other jobs,
+    # and go ahead of segment traffic (a preview is waiting for them)
+    with ratelimit.owner_scope(job.job_id), scheduler.priority_scope(scheduler.INTERACTIVE):
+        await graph.run()
+    logger.debug("%s", graph.report())
+    return job
+
+
+# ------------------- DOWNLOAD -------------------
+# (2A) download playlist
+@tracing.traced()
+async def download_m3u_file(url, save_path, filename) -> str:
+    """
+    Asynchronously downloads a file from a URL and saves it to the app's data folder.
+    """
+    import httpx
+
+    save_path = os.path.join(save_path, filename)
+    try:
+        # stream the file content to disk (raises for 4xx or 5xx)
+        await net.download_to(url, save_path)
+
+        logger.debug("✅ Download complete. File saved to: %s", save_path)
+
+        return save_path
+
+    except httpx.HTTPError as e:
+        error_message = f"Download failed: {e}"
+        logger.error("❌ %s", error_message)
+        return ""
+    except Exception as e:
+        error_message = f"An unexpected error occurred: {e}"
+        logger.error("❌ %s", error_message)
+        return ""
+
+
+# (2B) parse m3u for chunk_urls
+@tracing.traced()
+def parse_m3u_file(file_path) -> []:
+    """
+    Parses an M3U file at the given path and returns a list of all URLs.
+
+    :param file_path: The full path to the M3U file in the iOS sandbox.
+    :return: A list of strings, where each string is a media URL.
+    """
+    if not os.path.exists(file_path):
+        logger.error("Error: File not found at path: %s", file_path)
+        return []
+
+    try:
+        # 'r' mode opens the file for reading in text mode.
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return parse_m3u_lines(f)
+
+    except Exception as e:
+        # Handle potential file access or encoding errors
+        logger.error("Error reading or parsing M3U file: %s", e)
+        return []
+
+
+def parse_m3u_lines(lines) -> []:
+    """Returns the init segment url followed by the media urls of an M3U playlist's lines."""
+    urls = []
+    for line in lines:
+        # Remove leading/trailing whitespace and newline characters
+        clean_line = line.strip()
+
+        # add init.mp4 url
+        if "EXT-X-MAP" in clean_line:
+            start = clean_line.find("https")
+            end = clean_line.rfind('"')
+            init_chunk_url = clean_line[start:end]
+            urls.append(init_chunk_url)
+            logger.debug("found and added init_chunk_url=%s", init_chunk_url)
+
+        # Ignore comments/metadata lines (which start with '#')
+        if clean_line and not clean_line.startswith('#'):
+            urls.append(clean_line)
+    return urls
+
+
+# file name of segment i in a job's temp directory
+def chunk_filename(chunk_index):
+    # the initialization segment is special and gets its own name and .mp4 extension
+    if chunk_index == 0:
+        return "init.mp4"
+    return "chunk" + str(chunk_index) + ".m4s"
+
+
+# concurrent downloads of the same segment (the same track queued twice)
+# share one request, keyed by the segment's path without the signature
+segment_flights = singleflight.Group("segment")
+
+
+# (2C) download chunk
+@tracing.traced()
+async def download_chunk(url: str, dir_path: Path, chunk_index: int, digests=None, store=None):
+    """
+    Downloads and verifies segment chunk_index into dir_path.
+
+    :param digests: Optional dict that gets the segment's sha256 under chunk_index.
+    :param store: Optional segstore.SegmentStore to keep the segment in
+        memory instead, while its budget allows.
+    :return: The segment's path (or its segstore.MemorySegment), or "" if it
+        couldn't be downloaded intact.
+    """
+    # one line per segment, so this message is rate limited
+    logger.debug("start download_chunk: url=%s dir_path=%s chunk_index=%s", url, dir_path, chunk_index,
+                 extra={'rate_key': 'download_chunk'})
+    tracing.annotate(index=chunk_index)
+    final_path = Path(dir_path) / chunk_filename(chunk_index)
+    kind = integrity.segment_kind(chunk_index)
+    key = urlsplit(url).path
+    flight = segment_flights.get(key)
+    if flight is not None:
+        # already on its way for another job: that download copies it here too
+        flight.followers.append(final_path)
+        tracing.annotate(coalesced=True)
+    try:
+        digest, segment, copied = await segment_flights.do(key, fetch_shared_chunk, key, url, final_path, kind, store)
+    except asyncio.CancelledError:
+        # our job is gone: nothing to copy for it any more
+        if flight is not None and final_path in flight.followers:
+            flight.followers.remove(final_path)
+        raise
+    if flight is not None:
+        # the other job's download wrote our copy to final_path
+        segment = str(final_path) if digest else ""
+        if not digest or final_path not in copied:
+            # it failed, was dropped with its job, or couldn't write our copy: try on our own
+            digest, segment = await fetch_chunk_to(url, final_path, kind, store)
+    if not digest:
+        return ""
+    if digests is not None:
+        digests[chunk_index] = digest
+    return segment
+
+
+# download one segment to final_path (or into store), then copy it to the jobs that asked for it meanwhile.
+# Returns (digest, segment) as fetch_chunk_to() does, and the follower paths that got their copy;
+# a copy that fails is only the follower's problem (it fetches the segment itself)
+async def fetch_shared_chunk(key, url, final_path, kind, store=None):
+    digest, segment = await fetch_chunk_to(url, final_path, kind, store)
+    flight = segment_flights.forget(key)
+    copied = frozenset()
+    if digest and flight is not None and flight.followers:
+        if isinstance(segment, segstore.MemorySegment):
+            copied = await get_io_executor().run(write_copies, segment.view, list(flight.followers))
+        else:
+            copied = await get_io_executor().run(link_or_copy, final_path, list(flight.followers))
+    return digest, segment, copied
+
+
+async def fetch_chunk_to(url, final_path, kind=integrity.MEDIA, store=None):
+    """
+    Streams a segment into final_path, checking it as it arrives (see
+    integrity.py), and fetches it again if it's incomplete or the
+    connection drops.
+
+    :param store: Optional segstore.SegmentStore. The segment is received
+        into memory if the response has a Content-Length and the store's
+        budget has room for it, else it spills to final_path.
+    :return: (sha256 hex digest, the segment: final_path as a string or a
+        segstore.MemorySegment), or ("", "") if every attempt failed.
+    """
+    import httpx
+
+    name = url.split('?')[0].split('/')[-1]
+    for attempt in range(SEGMENT_ATTEMPTS):
+        if attempt:
+            await asyncio.sleep(SEGMENT_RETRY_DELAY * 2 ** (attempt - 1))
+        try:
+            # Use the shared client so segments reuse pooled connections
+            async with net.get_client().stream("GET", url) as response:
+                response.raise_for_status()  # Raise exception for bad status codes
+                length = integrity.content_length(response.headers)
+                verifier = integrity.SegmentVerifier(kind, length)
+                memory = store.allocate(length) if store is not None else None
+
+                if memory is not None:
+                    # the verifier stops anything longer than the buffer
+                    try:
+                        async for chunk in response.aiter_bytes():
+                            verifier.feed(chunk)
+                            memory.write(chunk)
+                        digest = verifier.finish()
+                    except BaseException:
+                        memory.release()
+                        raise
+                    tracing.annotate(bytes=memory.length, retries=attempt, in_memory=True)
+                    return digest, memory
+
+                # Write content to a local file in coalesced chunks, off the event loop
+                async with get_io_executor().open_writer(final_path) as file:
+                    async for chunk in response.aiter_bytes():
+                        verifier.feed(chunk)
+                        await file.write(chunk)
+                digest = verifier.finish()
+            tracing.annotate(bytes=file.bytes_written, retries=attempt)
+            return digest, str(final_path)
+
+        except integrity.IntegrityError as e:
+            logger.warning("segment %s failed verification (attempt %s): %s", name, attempt + 1, e,
+                           extra={'rate_key': 'download_chunk_error'})
+        except httpx.HTTPStatusError as e:
+            logger.error("failed to download %s. status: %s", name, e.response.status_code,
+                         extra={'rate_key': 'download_chunk_error'})
+            if e.response.status_code < 500:
+                # expired signature, gone, ...: asking again won't help
+                break
+        except httpx.RequestError as e:
+            logger.error("failed to download %s. request error: %s", name, e,
+                         extra={'rate_key': 'download_chunk_error'})
+        except Exception as e:
+            logger.error("failed to download %s. unexpected error: %s", name, e,
+                         extra={'rate_key': 'download_chunk_error'})
+            break
+    tracing.annotate(retries=attempt)
+    # nothing half-written may be mistaken for the segment
+    await get_io_executor().run(_remove_quietly, final_path)
+    return "", ""
+
+
+# give each path its own copy of source (hard links: segment files are never modified).
+# Returns the paths that got one (blocking; run on the I/O executor)
+def link_or_copy(source, paths):
+    copied = set()
+    for path in paths:
+        try:
+            try:
+                os.link(source, path)
+            except OSError:
+                shutil.copyfile(source, path)
+        except OSError as e:
+            logger.warning("could not copy segment to %s: %s", path, e)
+            _remove_quietly(path)
+            continue
+        copied.add(path)
+    return frozenset(copied)
+
+
+# write data to every path. Returns the paths written (blocking; run on the I/O executor)
+def write_copies(data, paths):
+    copied = set()
+    for path in paths:
+        try:
+            with open(path, 'wb') as f:
+                f.write(data)
+        except OSError as e:
+            logger.warning("could not copy segment to %s: %s", path, e)
+            _remove_quietly(path)
+            continue
+        copied.add(path)
+    return frozenset(copied)
+
+
+# (2C) write a segment that was fetched ahead of the download
+@tracing.traced()
+async def use_prefetched_chunk(task, url: str, dir_path: Path, chunk_index: int, digests=None, store=None):
+    try:
+        data = await task
+        digest = integrity.verify_bytes(data, integrity.segment_kind(chunk_index))
+    except asyncio.CancelledError:
+        if not task.cancelled():
+            raise
+        data = None
+    except Exception as e:
+        logger.debug("prefetch of chunk %s failed, downloading it again: %s", chunk_index, e)
+        data = None
+    if data is None:
+        return await download_chunk(url, dir_path, chunk_index, digests, store)
+
+    if digests is not None:
+        digests[chunk_index] = digest
+    # it's in memory already; only a spill writes it out
+    segment = store.adopt(data) if store is not None else None
+    tracing.annotate(index=chunk_index, bytes=len(data), in_memory=segment is not None)
+    if segment is not None:
+        return segment
+    final_path = Path(dir_path) / chunk_filename(chunk_index)
+    await get_io_executor().run(final_path.write_bytes, data)
+    return str(final_path)
+
+
+# (2C) download thumbnail
+@tracing.traced()
+async def download_art(url: str, save_path: Path, thumbnail_filename: str) -> str:
+    import httpx
+
+    try:
+        final_path = Path(save_path) / thumbnail_filename
+
+        # artwork is small; fetching it as bytes lets jobs with the same artwork share the request
+        with scheduler.priority_scope(scheduler.ARTWORK):
+            data = await net.fetch_bytes(url)
+        await get_io_executor().run(final_path.write_bytes, data)
+        tracing.annotate(bytes=len(data))
+
+        return str(final_path)
+    except httpx.HTTPError as e:
+        return f"ERROR: Failed to download {url.split('/')[-1]}. Request error: {e}"
+    except Exception as e:
+        return f"ERROR: Failed to download {url.split('/')[-1]}. Unexpected error: {e}"
+
+
+@tracing.traced()
+async def concatenate_m4_segments(file_list, output_path, backend=None) -> bool:
+    """
+    Concatenates a list of .m4s or .mp4 segments into a single fragmented MP4 audio (m4a) file.
+
+    :param file_list: A list of full file paths, starting with the init segment.
+    :param output_path: The full path for the final concatenated MP4 file.
+    :param backend: concat.ConcatBackend to use (default: the pure-Python one).
+    :return: True on success, False otherwise.
+    """
+    if not file_list:
+        logger.error("Error: File list is empty.")
+        return False
+
+    try:
+        backend = backend or concat.StreamingConcatenator()
+        await backend.concatenate_audio_files(file_list, output_path)
+
+        logger.info("Successfully concatenated files to: %s", output_path)
+        return True
+
+    except FileNotFoundError as e:
+        logger.error("Error: One of the files was not found: %s", e)
+        return False
+    except Exception as e:
+        logger.error("An unexpected error occurred: %s", e)
+        return False
+
+
+@tracing.traced()
+async def add_tags_to_mp4(audio_file_path, image_file_path, title, artist) -> bool:
+    """
+    Adds album art, title and artist to an MP4 audio file using the Mutagen library.
+
+    :param audio_file_path: Full path to the MP4/M4A audio file.
+    :param image_file_path: Full path to the JPEG or PNG image file.
+    :return: True if the tags were written.
+    """
+    logger.debug("add_tags_to_mp4 audio_file_path=%s image_file_path=%s", audio_file_path, image_file_path)
+
+    try:
+        # mutagen parses and rewrites the file in pure Python: a CPU worker, off the loop's GIL
+        tagged = await cpu.get_cpu_executor().run(write_mp4_tags, audio_file_path, image_file_path, title, artist)
+        if tagged:
+            logger.info("Successfully set tags on: %s", audio_file_path)
+        return tagged
+
+    except FileNotFoundError:
+        logger.error("Error: Audio or image file not found.")
+    except Exception as e:
+        logger.error("An error occurred: %s", e)
+    return False
+
+
+async def load_playlist(job, temp_dir, filename):
+    """Sets job.playlist_text and job.chunk_urls (downloading the playlist unless it was prefetched)."""
+    if job.playlist_text is None:
+        # download playlist
+        logger.debug("downloading from playlist url: playlist_url=%s", job.playlist_url)
+        with scheduler.priority_scope(scheduler.HEAD):
+            playlist_path = await download_m3u_file(job.playlist_url, str(temp_dir), filename)
+        logger.debug("finished playlist download: playlist_path=%s", playlist_path)
+        if playlist_path:
+            job.playlist_text = await get_io_executor().run(Path(playlist_path).read_text, encoding='utf-8')
+
+    # parse playlist for chunk_urls
+    job.chunk_urls = parse_m3u_lines(job.playlist_text.splitlines()) if job.playlist_text else []
+    logger.debug("finished parsing m3u: len(chunk_urls)=%s", len(job.chunk_urls))
+
+
+async def estimate_track_size(job, probe=False):
+    """Sets job.size_estimate from the loaded playlist (see preflight.estimate_size)."""
+    lines = job.playlist_text.splitlines() if job.playlist_text else ()
+    estimate = await preflight.estimate_size(job.chunk_urls, lines, probe=probe)
+    if estimate is None and not probe:
+        # no durations either: the segment sizes are all there is
+        estimate = await preflight.estimate_size(job.chunk_urls, lines, probe=True)
+    if estimate is None:
+        logger.warning("no size estimate for %s", job.input_url)
+    else:
+        tracing.annotate(bytes=estimate.total_bytes, source=estimate.source)
+    job.size_estimate = estimate or job.size_estimate
+    return job.size_estimate
+
+
+# (path, bytes) a download of total bytes needs (blocking; run on the I/O executor)
+def space_needs(job, total, temp_dir, dest_dir, backend, media_cache):
+    part_dir = os.path.dirname(job.partial.path)
+    needs = [(part_dir, total)]
+    if not backend.streaming:
+        # the segments stay on disk until they are all in
+        needs.append((temp_dir, total))
+    if not preflight.same_volume(dest_dir, part_dir):
+        # the part file is copied, not renamed, into dest_dir
+        needs.append((dest_dir, total))
+    if media_cache is not None:
+        needs.append((media_cache.root, total))
+    return needs
+
+
+async def reserve_space(job, temp_dir, dest_dir, backend, media_cache):
+    """
+    Reserves the space job's track needs on the part file's, the
+    destination's and the cache's volumes (see preflight.SpaceBudget).
+    If an estimate from the durations alone is too close to call, the
+    segment sizes are probed first.
+
+    :return: A preflight.Reservation, or None without a size estimate.
+    :raises preflight.InsufficientSpaceError: If the track won't fit.
+    """
+    if job.size_estimate is None:
+        return None
+    io_executor, budget = get_io_executor(), preflight.get_budget()
+    args = (temp_dir, dest_dir, backend, media_cache)
+    needs = await io_executor.run(space_needs, job, job.size_estimate.total_bytes, *args)
+    if job.size_estimate.source == 'duration' and not await io_executor.run(budget.fits, needs,
+                                                                            preflight.ESTIMATE_MARGIN):
+        # the real bitrate may be well off the nominal one: measure before deciding
+        await estimate_track_size(job, probe=True)
+        needs = await io_executor.run(space_needs, job, job.size_estimate.total_bytes, *args)
+    return await io_executor.run(budget.reserve, needs)
+
+
+async def assemble_segments(job, temp_dir, filename, backend=None, media_cache=None) -> int:
+    """
+    Fetches the playlist and every segment of job (from media_cache, the
+    segments prefetched for it or the network) and assembles them into the
+    part file job.partial.
+
+    :return: The size of the part file.
+    :raises PipelineError: If the init segment or a later segment is missing.
+    """
+    if not job.chunk_urls:
+        await load_playlist(job, temp_dir, filename)
+    expected_size = job.size_estimate.total_bytes if job.size_estimate else None
+
+    # streaming backends append segments to the part file in order as they
+    # arrive; the others get all of them at the end
+    backend = backend or concat.get_selector().select(len(job.chunk_urls), expected_size)
+    # streaming assembly takes segments from memory (segstore.py) while the budgets allow
+    store = None
+    if backend.streaming:
+        assembler = SegmentAssembler(job.partial.path, len(job.chunk_urls), job.partial, expected_size)
+        store = segstore.SegmentStore()
+    else:
+        assembler = BatchAssembler(job.partial.path, len(job.chunk_urls), job.partial, backend)
+    await assembler.open()
+
+    async def fetch_segment(i, url):
+        segment = ""
+        if media_cache is not None:
+            key = cache.segment_key(job.stream_id, url)
+            chunk_path = str(Path(temp_dir) / chunk_filename(i))
+            if await media_cache.get_file(key, chunk_path) is not None:
+                # checked against its hash on the way out
+                segment = chunk_path
+                job.segment_digests[i] = media_cache.digest(key)
+        if not segment:
+            # the first segments (early playback) go ahead of the rest
+            with scheduler.priority_scope(scheduler.segment_priority(i)):
+                if i in prefetched:
+                    segment = await use_prefetched_chunk(prefetched[i], url, temp_dir, i, job.segment_digests,
+                                                         store)
+                else:
+                    segment = await download_chunk(url, temp_dir, chunk_index=i, digests=job.segment_digests,
+                                                   store=store)
+            if isinstance(segment, str) and segment and media_cache is not None:
+                # segment files are never modified, so the cache can share them. Segments held
+                # in memory aren't written out for it: the finished track is cached whole.
+                await media_cache.put_file(key, segment, link=True, sha256=job.segment_digests.get(i))
+        await assembler.add(i, segment)
+
+    # make an array of download tasks for each chunk url (reusing segments fetched ahead)
+    prefetched, job.segment_prefetch = job.segment_prefetch, {}
+    download_tasks = [fetch_segment(i, url) for i, url in enumerate(job.chunk_urls)]
+
+    # use asyncio.gather to run all tasks concurrently
+    try:
+        with tracing.span("download_segments", segments=len(download_tasks)):
+            await asyncio.gather(*download_tasks)
+            if store is not None:
+                tracing.annotate(in_memory=store.in_memory, spilled=store.spilled)
+    finally:
+        if store is not None:
+            # whatever a failed segment left queued behind it
+            store.close()
+    logger.debug("finished downloading chunks: len(chunk_urls)=%s", len(job.chunk_urls))
+    await assembler.finish()
+
+    # check that every segment made it in, starting with the initialization chunk
+    if not job.chunk_urls or assembler.failed_index == 0:
+        logger.warning("missing init chunk for: %s", job.input_url)
+        raise PipelineError(f"missing init segment for {job.input_url}")
+    if not assembler.complete:
+        logger.error("ERROR assembling chunk files: missing chunk %s of %s",
+                     assembler.failed_index, len(job.chunk_urls))
+        raise PipelineError(f"missing segment {assembler.failed_index} for {job.input_url}")
+    if assembler.digest is not None:
+        job.sha256 = assembler.digest.hexdigest()
+    return assembler.offset
+
+
+async def download_track(job, temp_dir, dest_dir, filename=None, partial=None, backend=None,
+                         allow_duplicate=False) -> str:
+    """
+    Downloads a resolved track: playlist, segments and artwork into temp_dir.
+    Segments are assembled in order into a part file while they download,
+    which then becomes the tagged .m4a in dest_dir. temp_dir is removed at the end
+    (in the background, see scratch.py).
+
+    If the media cache is configured (see cache.py) a track or segments that
+    were downloaded before are taken from it instead of the network.
+
+    :param job: A TrackJob from resolve_track().
+    :param temp_dir: Scratch directory for this job only (created if missing).
+    :param dest_dir: Directory the finished .m4a is written to.
+    :param filename: Output name without extension (defaults to the track's name).
+    :param partial: GrowingFile for the part file, if the caller wants to serve
+        it while it downloads (see loopback.py). By default the part file
+        lives next to temp_dir and nobody watches it.
+    :param backend: concat.ConcatBackend to join the segments with (default:
+        the fastest one for the segment count, see concat.BackendSelector).
+    :param allow_duplicate: Download the track even if the fingerprint index
+        has it in the library already.
+    :return: The path of the saved file.
+    :raises DuplicateTrackError: If the track was saved before (checked before
+        anything is downloaded).
+    :raises PipelineError: If the init segment or a later segment is missing.
+    :raises preflight.InsufficientSpaceError: If the track won't fit on disk
+        (checked before any segment is downloaded).
+    """
+    temp_dir = Path(temp_dir)
+    filename = filename or job.filename
+    logger.debug("start download_track: job=%s temp_dir=%s filename=%s", job, temp_dir, filename)
+    fingerprints = fingerprint.get_index() if job.stream_id else None
+    if fingerprints is not None and not allow_duplicate:
+        existing = await get_io_executor().run(fingerprints.find_existing, job.stream_id)
+        if existing is not None:
+            raise DuplicateTrackError(job.stream_id, existing)
+    collector = scratch.get_collector()
+    await prepare_temp_dir(temp_dir)
+    job.partial = partial or GrowingFile(temp_dir.parent / f"{job.job_id}.m4a.part")
+    collector.claim(temp_dir, job.partial.path)
+    media_cache = cache.get_cache() if job.stream_id else None
+    # the requests of this job share the rate limits fairly with other jobs
+    owner = ratelimit.set_owner(job.job_id)
+    reservation = None
+
+    try:
+        # the whole track, if it was downloaded before
+        size = None
+        if media_cache is not None:
+            with tracing.span("cache_lookup"):
+                size = await media_cache.get_file(cache.track_key(job.stream_id), job.partial.path)
+        track_cached = size is not None
+        if track_cached:
+            logger.info("track %s taken from the cache", job.stream_id)
+            job.sha256 = media_cache.digest(cache.track_key(job.stream_id))
+            job.partial.commit(size)
+        else:
+            await load_playlist(job, temp_dir, filename)
+            # fail now if the track won't fit, not when a write fails halfway through
+            with tracing.span("preflight"):
+                estimate = await estimate_track_size(job)
+                backend = backend or concat.get_selector().select(
+                    len(job.chunk_urls), estimate.total_bytes if estimate else None)
+                reservation = await reserve_space(job, temp_dir, dest_dir, backend, media_cache)
+            size = await assemble_segments(job, temp_dir, filename, backend, media_cache)
+        job.bytes_downloaded = size
+        job.partial.finish()
+
+        # download thumbnail (or write the one prefetched for the preview, or the cached one)
+        thumbnail_filepath = str(temp_dir / job.thumbnail_filename)
+        if job.artwork is None and media_cache is not None:
+            job.artwork = await media_cache.get_bytes(cache.artwork_key(job.thumbnail_url))
+        if job.artwork is not None:
+            await get_io_executor().run(Path(thumbnail_filepath).write_bytes, job.artwork)
+        else:
+            thumbnail_filepath = await download_art(job.thumbnail_url, temp_dir, job.thumbnail_filename)
+        logger.debug("finished downloading thumbnail: thumbnail_filepath=%s", thumbnail_filepath)
+        if media_cache is not None and not thumbnail_filepath.startswith("ERROR"):
+            await media_cache.put_file(cache.artwork_key(job.thumbnail_url), thumbnail_filepath)
+
+        # the part file becomes the output. If it's being served it has to stay
+        # byte for byte as it is (tagging rewrites the file), so copy it instead.
+        dest_filepath = os.path.join(str(dest_dir), filename + ".m4a")
+        with tracing.span("finalize", bytes=size):
+            if job.partial.published:
+                await get_io_executor().run(shutil.copyfile, job.partial.path, dest_filepath)
+                job.partial.delete_when_unpublished = True
+            else:
+                await get_io_executor().run(shutil.move, job.partial.path, dest_filepath)
+        logger.info("SUCCESS assembled chunk files: len(chunk_urls)=%s dest_filepath=%s",
+                    len(job.chunk_urls), dest_filepath)
+        job.dest_filepath = dest_filepath
+
+        # keep the untagged track (tagging rewrites the file, so it's a copy);
+        # its segments are then redundant
+        if media_cache is not None and not track_cached:
+            with tracing.span("cache_store", bytes=size):
+                await media_cache.put_file(cache.track_key(job.stream_id), dest_filepath, sha256=job.sha256 or None)
+            await media_cache.discard_prefix(f"segment:{job.stream_id}:")
+
+        # set file tags
+        thumbnail_filepath = str(temp_dir / job.thumbnail_filename)
+        await add_tags_to_mp4(dest_filepath, thumbnail_filepath, job.title, job.artist)
+        logger.debug("finished setting tags")
+
+        # so the next download of this stream is caught before it starts
+        if fingerprints is not None:
+            with tracing.span("fingerprint", bytes=size):
+                entry = await cpu.get_cpu_executor().run(fingerprint.file_fingerprint, dest_filepath)
+                job.fingerprint = fingerprints.store(dest_filepath, entry) or ""
+            if job.fingerprint:
+                fingerprints.link_stream(job.stream_id, job.fingerprint)
+                await get_io_executor().run(fingerprints.save)
+        return dest_filepath
+
+    except BaseException as e:
+        if not job.partial.done:
+            job.partial.fail(e if isinstance(e, Exception) else PipelineError("download cancelled"))
+        if not job.partial.published:
+            await get_io_executor().run(_remove_quietly, job.partial.path)
+        raise
+
+    finally:
+        ratelimit.reset_owner(owner)
+        if reservation is not None:
+            reservation.release()
+        if media_cache is not None:
+            await media_cache.flush()
+
+        # delete temp files (in the background, see scratch.py); a part file
+        # that's still being served stays claimed until the server lets go of it
+        with tracing.span("cleanup"):
+            if not job.partial.published:
+                collector.release(job.partial.path)
+            await collector.discard(temp_dir)
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
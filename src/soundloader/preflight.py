@@ -0,0 +1,374 @@
+"""
+Checks that run before a download writes anything.
+
+estimate_size() works out how big a track will be from the best source at
+hand:
+  * EXT-X-BYTERANGE tags in the playlist: exact,
+  * the sizes of the init segment and a few media segments (HEAD, or a
+    one-byte Range GET where HEAD has no Content-Length), scaled to the
+    whole track by the EXTINF durations,
+  * the durations alone, at a typical AAC bitrate.
+Probing costs a round trip before the first segment, so the pipeline only
+probes when the durations leave it too close to call (ESTIMATE_MARGIN).
+
+SpaceBudget then checks that the part file, the saved copy and the cache
+copy fit on their volumes, counting what the downloads already running
+have reserved, and raises InsufficientSpaceError before the first segment
+is fetched instead of when a write fails halfway through. preallocate()
+gives the part file its estimated size up front, so it isn't grown (and
+fragmented) one segment at a time.
+"""
+
+import asyncio
+import errno
+import os
+import shutil
+import threading
+
+from soundloader import net, scheduler
+from soundloader.log import get_logger
+
+logger = get_logger(__name__)
+
+# SoundCloud's AAC HLS streams are 160 kbit/s
+DEFAULT_BYTES_PER_SECOND = 160_000 // 8
+# media segments probed for their size (spread over the track), besides the init segment
+PROBE_SEGMENTS = 3
+# a size from the durations alone is trusted if this many times it fits;
+# closer than that the segments are probed
+ESTIMATE_MARGIN = 2.0
+PROBE_TIMEOUT = 5.0
+# space left free on a volume on top of what a download needs
+HEADROOM_BYTES = 32 * 1024 * 1024
+
+
+class InsufficientSpaceError(OSError):
+    """A download wouldn't fit on one of its volumes."""
+
+    def __init__(self, path, needed, free):
+        super().__init__(errno.ENOSPC, f"{needed} bytes needed, {max(free, 0)} free", path)
+        self.needed = needed
+        self.free = free
+
+
+class SizeEstimate:
+    """
+    :param total_bytes: Estimated size of the assembled track.
+    :param source: 'byterange', 'probe' or 'duration'.
+    :param duration: Seconds of media in the playlist (0 if it has no EXTINF tags).
+    """
+
+    __slots__ = ('total_bytes', 'source', 'duration')
+
+    def __init__(self, total_bytes, source, duration=0.0):
+        self.total_bytes = int(total_bytes)
+        self.source = source
+        self.duration = duration
+
+    @property
+    def exact(self):
+        return self.source == 'byterange'
+
+    def __repr__(self):
+        return f"SizeEstimate({self.total_bytes}, {self.source!r})"
+
+
+def parse_playlist_sizes(lines):
+    """
+    Reads the segment durations and byte ranges of an M3U playlist, in the
+    order of parse_m3u_lines() (init segment first).
+
+    :return: (durations, lengths): one entry per segment; durations of the
+        init segment and lengths without an EXT-X-BYTERANGE are None.
+    """
+    durations, lengths = [], []
+    duration = length = None
+    for line in lines:
+        line = line.strip()
+        if line.startswith("#EXT-X-MAP"):
+            map_length = None
+            if "BYTERANGE=" in line:
+                map_length = _byterange_length(line.split("BYTERANGE=", 1)[1].split(",")[0].strip('"'))
+            durations.append(None)
+            lengths.append(map_length)
+        elif line.startswith("#EXTINF:"):
+            duration = _float(line[len("#EXTINF:"):].split(",", 1)[0])
+        elif line.startswith("#EXT-X-BYTERANGE:"):
+            length = _byterange_length(line[len("#EXT-X-BYTERANGE:"):])
+        elif line and not line.startswith("#"):
+            durations.append(duration)
+            lengths.append(length)
+            duration = length = None
+    return durations, lengths
+
+
+def _byterange_length(value):
+    # <length>[@<offset>]
+    try:
+        return int(value.split("@", 1)[0])
+    except ValueError:
+        return None
+
+
+def _float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def estimate_from_duration(seconds):
+    return int(seconds * DEFAULT_BYTES_PER_SECOND)
+
+
+async def probe_size(url):
+    """
+    Returns the size of url's body without downloading it, or None.
+    Signed CDN URLs don't always allow HEAD, so this falls back to asking
+    for the first byte and reading the total from Content-Range.
+    """
+    import httpx
+
+    client = net.get_client()
+    try:
+        response = await client.head(url, timeout=PROBE_TIMEOUT)
+        if response.status_code == 200 and response.headers.get("content-length"):
+            return int(response.headers["content-length"])
+        async with client.stream("GET", url, headers={"Range": "bytes=0-0"}, timeout=PROBE_TIMEOUT) as response:
+            content_range = response.headers.get("content-range", "")
+            if response.status_code == 206 and "/" in content_range:
+                total = content_range.rsplit("/", 1)[1]
+                return int(total) if total.isdigit() else None
+            if response.status_code == 200 and response.headers.get("content-length"):
+                # the server ignored the Range; don't read the body
+                return int(response.headers["content-length"])
+    except (httpx.HTTPError, ValueError) as e:
+        logger.debug("size probe failed for %s: %s", url.split("?")[0], e)
+    return None
+
+
+def _probe_indexes(count):
+    media = list(range(1, count))
+    if len(media) <= PROBE_SEGMENTS:
+        return [0] + media
+    step = (len(media) - 1) / (PROBE_SEGMENTS - 1)
+    return [0] + sorted({media[round(i * step)] for i in range(PROBE_SEGMENTS)})
+
+
+async def estimate_size(chunk_urls, playlist_lines=(), probe=False):
+    """
+    Estimates the assembled size of a track's segments.
+
+    :param chunk_urls: Segment urls from parse_m3u_lines() (init segment first).
+    :param playlist_lines: The playlist, for EXTINF durations and byte ranges.
+    :param probe: Ask the CDN for the size of a few segments (unless there are byte ranges).
+    :return: A SizeEstimate, or None if there is nothing to go on.
+    """
+    if not chunk_urls:
+        return None
+    durations, lengths = parse_playlist_sizes(playlist_lines)
+    if len(lengths) != len(chunk_urls):
+        # the playlist doesn't match the urls; sizes by index would be wrong
+        durations, lengths = [None] * len(chunk_urls), [None] * len(chunk_urls)
+    media_duration = sum(d for d in durations[1:] if d)
+
+    if all(length is not None for length in lengths):
+        return SizeEstimate(sum(lengths), 'byterange', media_duration)
+
+    if probe:
+        indexes = _probe_indexes(len(chunk_urls))
+        with scheduler.priority_scope(scheduler.HEAD):
+            sizes = await asyncio.gather(*(probe_size(chunk_urls[i]) for i in indexes))
+        probed = {i: size for i, size in zip(indexes, sizes) if size is not None}
+        media = [i for i in probed if i > 0]
+        if 0 in probed and media:
+            init = probed[0]
+            probed_duration = sum(durations[i] or 0 for i in media)
+            if media_duration and probed_duration:
+                # scale by duration: the last segment is usually shorter
+                per_second = sum(probed[i] for i in media) / probed_duration
+                return SizeEstimate(init + per_second * media_duration, 'probe', media_duration)
+            per_segment = sum(probed[i] for i in media) / len(media)
+            return SizeEstimate(init + per_segment * (len(chunk_urls) - 1), 'probe', media_duration)
+
+    if media_duration:
+        return SizeEstimate(estimate_from_duration(media_duration), 'duration', media_duration)
+    return None
+
+
+def existing_parent(path):
+    """path, or the closest of its parents that exists (for stat on a file not created yet)."""
+    path = os.path.abspath(str(path))
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+def same_volume(a, b) -> bool:
+    return os.stat(existing_parent(a)).st_dev == os.stat(existing_parent(b)).st_dev
+
+
+def free_bytes(path) -> int:
+    return shutil.disk_usage(existing_parent(path)).free
+
+
+class Reservation:
+    """Space held for one download; release() when it's done (or failed)."""
+
+    def __init__(self, budget, by_device):
+        self._budget = budget
+        self.by_device = by_device
+
+    def release(self):
+        if self.by_device:
+            self._budget._release(self.by_device)
+            self.by_device = {}
+
+
+class SpaceBudget:
+    """
+    Free space per volume, minus what running downloads have reserved.
+
+    Reservations are kept until a download ends, while the space it has
+    already written is gone from the volume too; that counts some bytes
+    twice, which errs on the side of failing early.
+
+    :param headroom: Bytes to leave free on every volume.
+    """
+
+    def __init__(self, headroom=HEADROOM_BYTES):
+        self.headroom = headroom
+        self.reserved = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _by_device(needs):
+        by_device, paths = {}, {}
+        for path, nbytes in needs:
+            if nbytes <= 0:
+                continue
+            path = existing_parent(path)
+            device = os.stat(path).st_dev
+            by_device[device] = by_device.get(device, 0) + int(nbytes)
+            paths.setdefault(device, path)
+        return by_device, paths
+
+    def _free(self, device, path):
+        return shutil.disk_usage(path).free - self.reserved.get(device, 0) - self.headroom
+
+    def fits(self, needs, factor=1.0) -> bool:
+        """Whether factor times needs would fit right now (blocking; nothing is reserved)."""
+        by_device, paths = self._by_device(needs)
+        with self._lock:
+            return all(nbytes * factor <= self._free(device, paths[device]) for device, nbytes in by_device.items())
+
+    def reserve(self, needs):
+        """
+        Reserves space for a download (blocking; run on the I/O executor).
+
+        :param needs: (path, bytes) pairs; paths on the same volume add up.
+        :return: A Reservation.
+        :raises InsufficientSpaceError: If a volume doesn't have the space.
+        """
+        by_device, paths = self._by_device(needs)
+        with self._lock:
+            for device, nbytes in by_device.items():
+                free = self._free(device, paths[device])
+                if nbytes > free:
+                    raise InsufficientSpaceError(paths[device], nbytes, free)
+            for device, nbytes in by_device.items():
+                self.reserved[device] = self.reserved.get(device, 0) + nbytes
+        return Reservation(self, by_device)
+
+    def _release(self, by_device):
+        with self._lock:
+            for device, nbytes in by_device.items():
+                left = self.reserved.get(device, 0) - nbytes
+                if left > 0:
+                    self.reserved[device] = left
+                else:
+                    self.reserved.pop(device, None)
+
+
+class SpacePlan:
+    """
+    What a batch of downloads (a collection) will need, added up per volume
+    as the downloads are planned, against the space that was free when the
+    plan was made. Creating it is blocking.
+
+    :param paths: Where each download keeps a copy (the part file, the
+        saved file); paths on one volume add up.
+    :param fixed: (path, bytes) the batch takes once however many downloads
+        there are, e.g. what a capped cache can still grow by.
+    :param headroom: Bytes to leave free on every volume.
+    """
+
+    def __init__(self, paths, fixed=(), headroom=HEADROOM_BYTES):
+        self.copies = {}
+        self.paths = {}
+        self.free = {}
+        self.planned = {}
+        budget = get_budget()
+        for path, copies in [(path, 1) for path in paths] + [(path, 0) for path, _ in fixed]:
+            path = existing_parent(path)
+            device = os.stat(path).st_dev
+            self.copies[device] = self.copies.get(device, 0) + copies
+            if device not in self.paths:
+                self.paths[device] = path
+                # minus what downloads outside the plan have reserved
+                self.free[device] = shutil.disk_usage(path).free - budget.reserved.get(device, 0) - headroom
+                self.planned[device] = 0
+        for path, nbytes in fixed:
+            self.planned[os.stat(existing_parent(path)).st_dev] += nbytes
+
+    def add(self, nbytes):
+        """
+        Plans one more download of nbytes.
+
+        :raises InsufficientSpaceError: If it won't fit too (it isn't planned then).
+        """
+        for device, copies in self.copies.items():
+            needed = self.planned[device] + copies * nbytes
+            if needed > self.free[device]:
+                raise InsufficientSpaceError(self.paths[device], needed, self.free[device])
+        for device, copies in self.copies.items():
+            self.planned[device] += copies * nbytes
+
+
+def preallocate(path, size) -> bool:
+    """
+    Allocates size bytes for path on disk in one go (blocking; run on the
+    I/O executor). The file's length becomes size; the writer truncates it
+    to what it actually wrote at the end.
+
+    :return: False where the platform can't preallocate (the file is left alone).
+    :raises InsufficientSpaceError: If the volume is full.
+    """
+    if size <= 0 or not hasattr(os, "posix_fallocate"):
+        return False
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        os.posix_fallocate(fd, 0, size)
+        return True
+    except OSError as e:
+        if e.errno == errno.ENOSPC:
+            raise InsufficientSpaceError(path, size, free_bytes(path)) from e
+        # e.g. a file system without fallocate support
+        logger.debug("could not preallocate %s: %s", path, e)
+        return False
+    finally:
+        os.close(fd)
+
+
+_budget = None
+
+
+def get_budget():
+    """Returns the SpaceBudget shared by all downloads."""
+    global _budget
+    if _budget is None:
+        _budget = SpaceBudget()
+    return _budget
@@ -0,0 +1,341 @@
+"""
+Global bandwidth and request-rate limits.
+
+Every request of the shared HTTP client passes through one Limiter (see
+net.py): a request takes a token from the global request bucket and from
+its host's bucket, and every chunk of a response body takes its size from
+the global and per-host byte buckets. Rates can be changed at any time with
+configure(); None means unlimited. Each host is held to
+DEFAULT_HOST_REQUESTS_PER_SECOND by default, so a collection with hundreds
+of queued segments doesn't fire them at the CDN all at once. The app reads
+its limits from a settings file (SettingsFile), which is read again before
+every download, so editing it changes the limits of a running app.
+
+Waiters are served fairly between jobs: each bucket keeps a queue per
+owner (the job that made the request, see owner_scope) and hands out
+tokens round-robin, so a job with 300 queued segments can't starve one
+that just started.
+
+A 429 from a host blocks every request to that host until its Retry-After
+has passed, and halves the host's request rate (or limits an unlimited host
+to THROTTLED_REQUESTS_PER_SECOND) for a while, instead of letting the other
+queued requests run into the same wall.
+"""
+
+import asyncio
+import contextvars
+import json
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from soundloader.log import get_logger
+
+logger = get_logger(__name__)
+
+# defaults: each host gets a steady request rate (a track's segments come in
+# one burst, the rest of a collection at the rate); no bandwidth caps
+DEFAULT_HOST_REQUESTS_PER_SECOND = 32.0
+DEFAULT_HOST_REQUEST_BURST = 32
+# the Limiter.configure() arguments a settings file may set
+SETTINGS_KEYS = ('bytes_per_second', 'requests_per_second', 'host_requests_per_second', 'host_bytes_per_second',
+                 'host_request_burst')
+# request rate of a host without a configured limit after it answered 429
+THROTTLED_REQUESTS_PER_SECOND = 20.0
+# seconds to wait after a 429 without a usable Retry-After
+DEFAULT_RETRY_AFTER = 2.0
+# after a 429 the host's request rate recovers to its limit over this many seconds
+THROTTLE_RECOVERY_SECONDS = 30.0
+
+# the job a request belongs to, for fair sharing
+_owner = contextvars.ContextVar("soundloader_ratelimit_owner", default=None)
+
+
+def set_owner(owner):
+    """Attributes the requests of the current task (and tasks it starts) to owner. Returns a token for reset_owner."""
+    return _owner.set(owner)
+
+
+def reset_owner(token):
+    _owner.reset(token)
+
+
+@contextmanager
+def owner_scope(owner):
+    """Like set_owner, for the requests made inside the block."""
+    token = set_owner(owner)
+    try:
+        yield
+    finally:
+        reset_owner(token)
+
+
+class TokenBucket:
+    """
+    A token bucket with fair, round-robin service of waiting owners.
+
+    :param rate: Tokens per second (None: unlimited).
+    :param burst: Bucket size (default: one second of tokens).
+    """
+
+    def __init__(self, rate=None, burst=None):
+        self.rate = None
+        self.burst = None
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self._waiters = OrderedDict()
+        self._pump = None
+        self._wakeup = None
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate, burst=None):
+        self._refill()
+        was_limited = bool(self.rate)
+        self.rate = rate
+        self.burst = (burst or rate) if rate else None
+        if self.burst is not None:
+            # a bucket that just got a limit starts full
+            self.tokens = min(self.tokens, self.burst) if was_limited else self.burst
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    @property
+    def waiting(self):
+        return sum(len(q) for q in self._waiters.values())
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def drain(self, seconds):
+        """Takes seconds worth of tokens out (may go negative), e.g. after being throttled."""
+        if self.rate:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+    async def acquire(self, amount=1, owner=None):
+        """
+        Waits for amount tokens. A request larger than the bucket waits for a
+        full bucket and leaves it in debt, so large bodies still average out.
+        """
+        if not self.rate:
+            return
+        self._refill()
+        if not self._waiters and self.tokens >= min(amount, self.burst):
+            self.tokens -= amount
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(owner, deque()).append((amount, future))
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.ensure_future(self._run_pump())
+        try:
+            await future
+        except asyncio.CancelledError:
+            if not future.done():
+                future.cancel()
+            raise
+
+    async def _run_pump(self):
+        self._wakeup = asyncio.Event()
+        while self._waiters:
+            owner, queue = next(iter(self._waiters.items()))
+            amount, future = queue[0]
+            if future.done():
+                # cancelled while waiting
+                queue.popleft()
+                if not queue:
+                    del self._waiters[owner]
+                continue
+            self._refill()
+            if self.rate and self.tokens < min(amount, self.burst):
+                delay = (min(amount, self.burst) - self.tokens) / self.rate
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if self.rate:
+                self.tokens -= amount
+            queue.popleft()
+            future.set_result(None)
+            # round robin: this owner goes to the back of the line
+            del self._waiters[owner]
+            if queue:
+                self._waiters[owner] = queue
+
+
+class HostLimits:
+    __slots__ = ('requests', 'bytes', 'blocked_until', 'throttled_at')
+
+    def __init__(self, requests_per_second, request_burst, bytes_per_second):
+        self.requests = TokenBucket(requests_per_second, request_burst)
+        self.bytes = TokenBucket(bytes_per_second)
+        self.blocked_until = 0.0
+        self.throttled_at = None
+
+
+class Limiter:
+    """
+    Global and per-host limits for requests/s and bytes/s.
+
+    :param bytes_per_second: Total download bandwidth (None: unlimited).
+    :param requests_per_second: Total request rate.
+    :param host_requests_per_second: Request rate per host.
+    :param host_bytes_per_second: Bandwidth per host.
+    """
+
+    def __init__(self, bytes_per_second=None, requests_per_second=None,
+                 host_requests_per_second=DEFAULT_HOST_REQUESTS_PER_SECOND, host_bytes_per_second=None,
+                 host_request_burst=DEFAULT_HOST_REQUEST_BURST):
+        self.requests = TokenBucket()
+        self.bytes = TokenBucket()
+        self.hosts = {}
+        self.throttle_count = 0
+        self.configure(bytes_per_second, requests_per_second, host_requests_per_second, host_bytes_per_second,
+                       host_request_burst)
+
+    def configure(self, bytes_per_second=None, requests_per_second=None,
+                  host_requests_per_second=DEFAULT_HOST_REQUESTS_PER_SECOND, host_bytes_per_second=None,
+                  host_request_burst=DEFAULT_HOST_REQUEST_BURST):
+        """Changes the limits; requests already waiting pick up the new rates."""
+        self.bytes_per_second = bytes_per_second
+        self.requests_per_second = requests_per_second
+        self.host_requests_per_second = host_requests_per_second
+        self.host_bytes_per_second = host_bytes_per_second
+        self.host_request_burst = host_request_burst
+        self.bytes.set_rate(bytes_per_second)
+        self.requests.set_rate(requests_per_second)
+        for host in self.hosts.values():
+            host.requests.set_rate(host_requests_per_second, host_request_burst)
+            host.bytes.set_rate(host_bytes_per_second)
+
+    def _host(self, host):
+        limits = self.hosts.get(host)
+        if limits is None:
+            limits = HostLimits(self.host_requests_per_second, self.host_request_burst, self.host_bytes_per_second)
+            self.hosts[host] = limits
+        return limits
+
+    async def request(self, host):
+        """Waits until a request to host may be sent."""
+        limits = self._host(host)
+        owner = _owner.get()
+        while True:
+            wait = limits.blocked_until - time.monotonic()
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        self._recover(limits)
+        await self.requests.acquire(1, owner)
+        await limits.requests.acquire(1, owner)
+
+    async def consume(self, host, nbytes):
+        """Waits until nbytes more of a response from host may be read."""
+        if self.bytes_per_second is None and self.host_bytes_per_second is None:
+            return
+        owner = _owner.get()
+        await self.bytes.acquire(nbytes, owner)
+        await self._host(host).bytes.acquire(nbytes, owner)
+
+    def throttled(self, host, retry_after=None):
+        """Call on a 429 from host: blocks it for retry_after seconds and halves its request rate."""
+        limits = self._host(host)
+        delay = retry_after if retry_after is not None else DEFAULT_RETRY_AFTER
+        limits.blocked_until = max(limits.blocked_until, time.monotonic() + delay)
+        self.throttle_count += 1
+        rate = limits.requests.rate
+        limits.requests.set_rate(max(1.0, rate / 2) if rate else THROTTLED_REQUESTS_PER_SECOND,
+                                 self.host_request_burst)
+        limits.requests.drain(0)
+        limits.throttled_at = time.monotonic()
+        logger.warning("throttled by %s: pausing %.1f s, %s requests/s", host, delay, limits.requests.rate)
+
+    def _recover(self, limits):
+        # back to the configured rate once the host has been quiet for a while
+        if limits.throttled_at is not None and time.monotonic() - limits.throttled_at > THROTTLE_RECOVERY_SECONDS:
+            limits.throttled_at = None
+            limits.requests.set_rate(self.host_requests_per_second, self.host_request_burst)
+
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header (only the delay-seconds form), or None."""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class SettingsFile:
+    """
+    Limits kept in a JSON file, e.g. {"host_requests_per_second": 10}. A
+    key that isn't in the file keeps its default; null means unlimited.
+
+    :param path: The settings file (it doesn't have to exist).
+    :param limiter: The Limiter to configure (default: the shared one).
+    """
+
+    def __init__(self, path, limiter=None):
+        self.path = str(path)
+        self.limiter = limiter
+        self.settings = {}
+        # (mtime, size) of the file as last applied; False: never applied
+        self._stamp = False
+
+    def read(self):
+        """Returns the limits in the file (blocking). A missing or damaged file has none."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        settings = {}
+        for key in SETTINGS_KEYS:
+            value = data.get(key, "default")
+            if value is None or (isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0):
+                settings[key] = value
+            elif value != "default":
+                logger.warning("ignoring rate limit setting %s=%r", key, value)
+        return settings
+
+    def reload(self):
+        """Applies the file to the limiter if it changed since the last call (blocking). Returns True if it did."""
+        try:
+            st = os.stat(self.path)
+            stamp = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stamp = None
+        if stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        self.settings = self.read() if stamp is not None else {}
+        (self.limiter or get_limiter()).configure(**self.settings)
+        logger.info("rate limits: %s", self.settings or "defaults")
+        return True
+
+    def save(self, **settings):
+        """Writes settings to the file and applies them (blocking)."""
+        settings = {key: value for key, value in settings.items() if key in SETTINGS_KEYS}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(settings, f)
+        os.replace(temp_path, self.path)
+        self._stamp = False
+        self.reload()
+
+
+_limiter = None
+
+
+def get_limiter():
+    """Returns the shared Limiter (default limits until configure() is called)."""
+    global _limiter
+    if _limiter is None:
+        _limiter = Limiter()
+    return _limiter
@@ -0,0 +1,134 @@
+"""
+Priority classes for the connection slots of the shared client.
+
+A download of a long track asks for hundreds of segments at once. Without
+priorities, a URL pasted meanwhile waits for its page and stream requests
+behind all of them, and the preview shows up late. So every request takes
+a slot from one PriorityScheduler (see limited_transport.py), and when a
+slot frees up the most urgent waiter gets it:
+
+    INTERACTIVE  the resolve of a pasted URL (page, client_id, stream json)
+    ARTWORK      cover art for the preview and the tags
+    HEAD         the playlist and the first segments of a track (early playback)
+    BULK         the rest of the segments
+
+Segment traffic (HEAD and BULK) can't take the last RESERVED_SLOTS slots,
+so an interactive request never waits for a segment to finish before it
+gets a connection. Requests take the priority of the task that makes them
+(priority_scope); unmarked requests count as INTERACTIVE.
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+from contextlib import contextmanager
+
+INTERACTIVE = 0
+ARTWORK = 1
+HEAD = 2
+BULK = 3
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", ARTWORK: "artwork", HEAD: "head", BULK: "bulk"}
+
+# same as the connection limit of the shared client's pool (see net.py)
+DEFAULT_SLOTS = 32
+# slots segment traffic leaves free for interactive requests and artwork
+RESERVED_SLOTS = 4
+# segments of a track fetched as HEAD, the rest are BULK
+HEAD_SEGMENTS = 4
+
+_priority = contextvars.ContextVar("soundloader_request_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def priority_scope(priority):
+    """Requests made inside the block (and tasks started in it) get priority."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    return _priority.get()
+
+
+def segment_priority(index):
+    return HEAD if index < HEAD_SEGMENTS else BULK
+
+
+class PriorityScheduler:
+    """
+    Hands out a fixed number of slots, most urgent waiter first (FIFO
+    within a priority).
+
+    :param slots: Requests allowed at once.
+    :param reserved: Slots only INTERACTIVE and ARTWORK requests may use.
+    """
+
+    def __init__(self, slots=DEFAULT_SLOTS, reserved=RESERVED_SLOTS):
+        self.slots = slots
+        self.reserved = min(reserved, slots - 1)
+        self.active = 0
+        self.granted = dict.fromkeys(PRIORITY_NAMES, 0)
+        self._waiters = []
+        self._order = itertools.count()
+
+    @property
+    def waiting(self):
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def _limit(self, priority):
+        return self.slots if priority <= ARTWORK else self.slots - self.reserved
+
+    async def acquire(self, priority=None):
+        """Waits for a slot. Every acquire must be paired with a release()."""
+        if priority is None:
+            priority = _priority.get()
+        if not self._waiters and self.active < self._limit(priority):
+            self._grant(priority)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        self._wake()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # got the slot just as it was cancelled
+                self.release()
+            raise
+
+    def release(self):
+        self.active -= 1
+        self._wake()
+
+    def _grant(self, priority):
+        self.active += 1
+        self.granted[priority] = self.granted.get(priority, 0) + 1
+
+    def _wake(self):
+        while self._waiters:
+            priority, _, future = self._waiters[0]
+            if future.done():
+                # cancelled while waiting
+                heapq.heappop(self._waiters)
+                continue
+            if self.active >= self._limit(priority):
+                return
+            heapq.heappop(self._waiters)
+            self._grant(priority)
+            future.set_result(None)
+
+
+_scheduler = None
+
+
+def get_scheduler():
+    """Returns the shared PriorityScheduler."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = PriorityScheduler()
+    return _scheduler
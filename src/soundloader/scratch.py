@@ -0,0 +1,209 @@
+"""
+Garbage collection of the scratch directory.
+
+Every download works in temp/<job id>/ (playlist, spilled segments,
+artwork) next to its part file temp/<job id>.m4a.part. Deleting the
+directory used to be the last step of download_track(), and a rmtree of a
+few hundred segment files is slow on a phone's flash; the download wasn't
+done until it was. A crash, or the app being killed in the background,
+left the directory and the part file behind for good.
+
+The ScratchCollector takes that off the critical path:
+  - running jobs claim() their paths, so nothing deletes them under a job,
+  - discard() renames a directory aside to temp/.trash-<id> (one rename,
+    the path is free again at once) and deletes the trash in a background
+    task on the I/O executor,
+  - sweep() runs at startup: it deletes every trash entry, and every entry
+    of the temp root older than orphan_age that no job claims.
+A trash entry that a crash left half deleted is picked up by the next
+sweep. prune() keeps a directory of per-job output (the job traces) to its
+newest entries. The media cache under its own directory keeps to its byte
+budget by LRU (see cache.py); that budget is checked again when the cache
+opens.
+"""
+
+import asyncio
+import os
+import shutil
+import time
+import uuid
+
+from soundloader.fileio import get_io_executor
+from soundloader.log import get_logger
+
+logger = get_logger(__name__)
+
+TRASH_PREFIX = ".trash-"
+# leftovers younger than this may belong to a job that is starting right now
+DEFAULT_ORPHAN_AGE = 60 * 60
+
+_collector = None
+
+
+def _move_aside(path):
+    # blocking; returns the trash path, or None if there's nothing at path
+    trash = os.path.join(os.path.dirname(path), TRASH_PREFIX + uuid.uuid4().hex[:12])
+    try:
+        os.rename(path, trash)
+    except FileNotFoundError:
+        return None
+    return trash
+
+
+def _delete(path) -> int:
+    # blocking; deletes a file or a directory tree, returns the bytes freed
+    freed = 0
+    try:
+        if os.path.isdir(path) and not os.path.islink(path):
+            for folder, _, names in os.walk(path):
+                for name in names:
+                    try:
+                        freed += os.lstat(os.path.join(folder, name)).st_size
+                    except OSError:
+                        pass
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            freed = os.lstat(path).st_size
+            os.remove(path)
+    except OSError as e:
+        logger.debug("could not delete %s: %s", path, e)
+    return freed
+
+
+def _expired(root, live, orphan_age, now):
+    # blocking; the entries of root the sweep deletes
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return []
+    expired = []
+    for name in names:
+        path = os.path.join(root, name)
+        if name.startswith(TRASH_PREFIX):
+            expired.append(path)
+            continue
+        if path in live:
+            continue
+        try:
+            age = now - os.lstat(path).st_mtime
+        except OSError:
+            continue
+        if age >= orphan_age:
+            expired.append(path)
+    return expired
+
+
+def _surplus(root, keep, max_age, now):
+    # blocking; the entries of root beyond the newest keep, or older than max_age
+    entries = []
+    try:
+        with os.scandir(root) as it:
+            for entry in it:
+                try:
+                    entries.append((entry.stat(follow_symlinks=False).st_mtime, entry.path))
+                except OSError:
+                    pass
+    except OSError:
+        return []
+    entries.sort(reverse=True)
+    surplus = entries[keep:] if keep is not None else []
+    if max_age is not None:
+        surplus += [(mtime, path) for mtime, path in entries[:len(entries) - len(surplus)]
+                    if now - mtime >= max_age]
+    return [path for _, path in surplus]
+
+
+class ScratchCollector:
+    """
+    Deletes scratch files in the background and sweeps the ones crashes left.
+
+    :param orphan_age: Seconds after which an unclaimed entry of the temp
+        root counts as left behind.
+    """
+
+    def __init__(self, orphan_age=DEFAULT_ORPHAN_AGE):
+        self.orphan_age = orphan_age
+        self.live = set()
+        self.deleted = 0
+        self.freed_bytes = 0
+        self._tasks = set()
+
+    def claim(self, *paths):
+        """Marks paths as in use by a running job."""
+        self.live.update(str(path) for path in paths)
+
+    def release(self, *paths):
+        """The job is done with paths (they aren't deleted)."""
+        self.live.difference_update(str(path) for path in paths)
+
+    async def discard(self, path):
+        """
+        Releases path and deletes it in the background. When this returns
+        path is free already (it's been renamed aside).
+        """
+        path = str(path)
+        self.release(path)
+        trash = await get_io_executor().run(_move_aside, path)
+        if trash is not None:
+            self._delete_later(trash)
+
+    def _delete_later(self, path):
+        task = asyncio.get_running_loop().create_task(self._delete(path))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _delete(self, path):
+        freed = await get_io_executor().run(_delete, path)
+        self.deleted += 1
+        self.freed_bytes += freed
+
+    async def drain(self):
+        """Waits for the deletions in progress (tests and shutdown)."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def sweep(self, root):
+        """
+        Deletes the trash and the unclaimed entries older than orphan_age in
+        root. Returns the number of entries deleted.
+        """
+        root = str(root)
+        expired = await get_io_executor().run(_expired, root, set(self.live), self.orphan_age, time.time())
+        # a job may have claimed one while the listing ran
+        expired = [path for path in expired if path not in self.live]
+        freed = 0
+        for path in expired:
+            freed += await get_io_executor().run(_delete, path)
+        self.deleted += len(expired)
+        self.freed_bytes += freed
+        if expired:
+            logger.info("scratch sweep: deleted %s entries (%s bytes) from %s", len(expired), freed, root)
+        return len(expired)
+
+    async def prune(self, root, keep=None, max_age=None):
+        """
+        Deletes the entries of root beyond the newest keep, and those older
+        than max_age seconds. Returns the number deleted.
+        """
+        surplus = await get_io_executor().run(_surplus, str(root), keep, max_age, time.time())
+        for path in surplus:
+            self.freed_bytes += await get_io_executor().run(_delete, path)
+        self.deleted += len(surplus)
+        if surplus:
+            logger.debug("pruned %s entries from %s", len(surplus), root)
+        return len(surplus)
+
+
+def get_collector():
+    """Returns the ScratchCollector shared by all downloads."""
+    global _collector
+    if _collector is None:
+        _collector = ScratchCollector()
+    return _collector
+
+
+def configure(orphan_age=DEFAULT_ORPHAN_AGE):
+    """Replaces the shared collector (e.g. with another orphan age)."""
+    global _collector
+    _collector = ScratchCollector(orphan_age)
+    return _collector
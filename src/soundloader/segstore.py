@@ -0,0 +1,162 @@
+"""
+Segments kept in memory between the network and the part file.
+
+Without it, every segment takes a round trip through the scratch
+directory: it's written to temp/chunkN.m4s, read back and copied into the
+part file, then deleted. For a short track on a fast link those file
+operations cost more than the transfer. A SegmentStore receives a segment
+into one bytearray, preallocated from the response's Content-Length, and
+the assembler writes that buffer (a memoryview, no copy) straight into the
+part file.
+
+Memory is bounded twice: per job (SegmentStore limit) and per process (the
+MemoryBudget shared by every store). A segment only takes memory while
+both have room for it, and gives it back once it's in the part file. A
+segment that doesn't fit, or has no Content-Length to size its buffer by,
+spills: it goes to its chunkN.m4s file as before. So a small track never
+writes a segment to the scratch directory, and a batch of large ones
+keeps its peak RSS within the global budget.
+"""
+
+from soundloader.log import get_logger
+
+logger = get_logger(__name__)
+
+# memory all downloads together may hold in segments
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024
+# memory one download may hold in segments
+DEFAULT_JOB_LIMIT = 16 * 1024 * 1024
+
+_budget = None
+_job_limit = DEFAULT_JOB_LIMIT
+
+
+class MemoryBudget:
+    """
+    Bytes of segment buffers the whole process may hold.
+
+    :param limit: The budget in bytes.
+    """
+
+    def __init__(self, limit=DEFAULT_MEMORY_BUDGET):
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+
+    def take(self, size) -> bool:
+        if self.used + size > self.limit:
+            return False
+        self.used += size
+        self.peak = max(self.peak, self.used)
+        return True
+
+    def give(self, size):
+        self.used -= size
+
+
+class MemorySegment:
+    """A segment body in a preallocated buffer. release() it once it's written out."""
+
+    __slots__ = ('store', 'buffer', 'length', '_view')
+
+    def __init__(self, store, buffer, length=0):
+        self.store = store
+        self.buffer = buffer
+        self.length = length
+        self._view = memoryview(buffer)
+
+    @property
+    def size(self):
+        return len(self.buffer)
+
+    @property
+    def view(self):
+        """The bytes received so far (no copy)."""
+        return self._view[:self.length]
+
+    def write(self, data):
+        # the caller checked the length against the buffer (SegmentVerifier does)
+        end = self.length + len(data)
+        self._view[self.length:end] = data
+        self.length = end
+
+    def release(self):
+        if self.store is not None:
+            self.store._release(self)
+            self.store = None
+
+
+class SegmentStore:
+    """
+    The segment memory of one download.
+
+    :param budget: The shared MemoryBudget (default: the process-wide one).
+    :param limit: Bytes this download may hold at once (0 turns memory off).
+    """
+
+    def __init__(self, budget=None, limit=None):
+        self.budget = budget or get_budget()
+        self.limit = _job_limit if limit is None else limit
+        self.used = 0
+        self.in_memory = 0
+        self.spilled = 0
+        self.closed = False
+        self._segments = set()
+
+    def _take(self, size):
+        if self.closed or self.used + size > self.limit or not self.budget.take(size):
+            self.spilled += 1
+            return False
+        self.used += size
+        self.in_memory += 1
+        return True
+
+    def allocate(self, size):
+        """Returns an empty MemorySegment of size bytes, or None if it has to spill."""
+        if not size or not self._take(size):
+            return None
+        segment = MemorySegment(self, bytearray(size))
+        self._segments.add(segment)
+        return segment
+
+    def adopt(self, data):
+        """Wraps bytes that are in memory already (a prefetched segment). None if they have to spill."""
+        if not self._take(len(data)):
+            return None
+        segment = MemorySegment(self, data, len(data))
+        self._segments.add(segment)
+        return segment
+
+    def _release(self, segment):
+        if segment in self._segments:
+            self._segments.discard(segment)
+            self.used -= segment.size
+            self.budget.give(segment.size)
+
+    def close(self):
+        """Gives back the memory of every segment still held (the download failed or was cancelled)."""
+        self.closed = True
+        for segment in list(self._segments):
+            segment.release()
+        if self.in_memory or self.spilled:
+            logger.debug("segment store: %s in memory, %s spilled", self.in_memory, self.spilled)
+
+
+def get_budget():
+    """Returns the MemoryBudget shared by all downloads."""
+    global _budget
+    if _budget is None:
+        _budget = MemoryBudget()
+    return _budget
+
+
+def configure(limit=None, job_limit=None):
+    """
+    Sets the process-wide and the per-download memory limits (None keeps a
+    limit as it is, 0 sends every segment to disk).
+    """
+    global _job_limit
+    if limit is not None:
+        get_budget().limit = limit
+    if job_limit is not None:
+        _job_limit = job_limit
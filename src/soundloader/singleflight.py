@@ -0,0 +1,82 @@
+"""
+Coalescing of concurrent identical requests.
+
+A Group runs at most one call per key at a time. Callers that ask for a
+key that is already in flight wait for that call and get its result (or
+its exception) instead of starting their own:
+
+    pages = Group("page")
+    html = await pages.do(url, net_fetch, url)
+
+The shared call is only cancelled when every caller waiting for it has
+been cancelled, so one job giving up doesn't fail the others.
+"""
+
+import asyncio
+
+from soundloader.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class Flight:
+    __slots__ = ('task', 'waiters', 'followers')
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+        # extra per-caller data the shared call may use (e.g. where to copy its result)
+        self.followers = []
+
+
+class Group:
+    """
+    One in-flight call per key.
+
+    :param name: For the log and the statistics.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self._flights = {}
+
+    def get(self, key):
+        """Returns the Flight for key if a call is in flight, else None."""
+        return self._flights.get(key)
+
+    def forget(self, key):
+        """Lets the next call for key start a new flight, even while the current one runs."""
+        return self._flights.pop(key, None)
+
+    async def do(self, key, fn, *args, **kwargs):
+        """
+        Returns the result of fn(*args, **kwargs), sharing it with every
+        concurrent call for the same key. Only the first caller's fn runs.
+        """
+        self.calls += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = Flight(asyncio.ensure_future(fn(*args, **kwargs)))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _task: self._finished(key, flight))
+        else:
+            self.coalesced += 1
+            logger.debug("%s: joined in-flight call for %s", self.name, key, extra={'rate_key': 'singleflight'})
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # everybody who wanted it is gone
+                flight.task.cancel()
+
+    def _finished(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.task.cancelled():
+            # retrieved by the waiters; don't log it again when there were none left
+            flight.task.exception()
@@ -0,0 +1,107 @@
+"""
+Speculative work for the paste -> Load -> Download flow.
+
+As soon as the search field holds a track URL, Speculator starts resolving
+it in the background. When the user taps Load, take() hands over the
+(usually finished) job, so the preview shows without waiting. Once the
+preview is up, prefetch_segments() starts on the first few segments, and
+download_track() picks them up from job.segment_prefetch. Everything is
+cancelled as soon as the input changes to something else.
+"""
+
+import asyncio
+
+from soundloader import net, pipeline, scheduler
+from soundloader.log import get_logger
+
+logger = get_logger(__name__)
+
+# segments (including the init segment) fetched before the user taps Download
+DEFAULT_PREFETCH_SEGMENTS = 3
+
+
+class Speculator:
+    """
+    Runs at most one speculative resolve (and segment prefetch) at a time.
+
+    :param resolve: Coroutine function url -> TrackJob (pipeline.resolve_track).
+    :param prefetch_segments: Segments to fetch ahead once a preview is shown.
+    """
+
+    def __init__(self, resolve=None, prefetch_segments=DEFAULT_PREFETCH_SEGMENTS):
+        self.resolve = resolve or pipeline.resolve_track
+        self.prefetch_count = prefetch_segments
+        self.url = None
+        self.task = None
+        self.job = None
+
+    def start(self, url):
+        """Starts resolving url in the background, unless it's already being resolved."""
+        if url == self.url and self.task is not None:
+            return
+        self.cancel()
+        logger.debug("speculative resolve: %s", url)
+        self.url = url
+        self.task = asyncio.ensure_future(self.resolve(url))
+        # don't log "exception never retrieved" for speculation nobody used
+        self.task.add_done_callback(_consume_exception)
+
+    def cancel(self):
+        """Drops the speculative resolve and any segments fetched ahead for it."""
+        if self.task is not None:
+            if not self.task.done():
+                logger.debug("cancelled speculative resolve: %s", self.url)
+            self.task.cancel()
+        if self.job is not None:
+            for task in self.job.segment_prefetch.values():
+                task.cancel()
+            self.job.segment_prefetch = {}
+        self.url = None
+        self.task = None
+        self.job = None
+
+    async def take(self, url):
+        """
+        Returns the speculatively resolved job for url, waiting for it if
+        it's still running. Returns None if nothing was speculated for url
+        or the speculation failed for a reason other than PipelineError (the
+        caller then resolves as usual).
+
+        :raises pipeline.PipelineError: If the page itself was bad.
+        """
+        if url != self.url or self.task is None:
+            return None
+        try:
+            self.job = await asyncio.shield(self.task)
+            return self.job
+        except pipeline.PipelineError:
+            self.cancel()
+            raise
+        except asyncio.CancelledError:
+            # the speculation was cancelled, not the caller
+            if self.task is not None and not self.task.cancelled():
+                raise
+            return None
+        except Exception as e:
+            logger.warning("speculative resolve failed, resolving again: %s", e)
+            self.cancel()
+            return None
+
+    def prefetch_segments(self, job):
+        """Starts fetching the first segments of job into memory (job.segment_prefetch)."""
+        if job.playlist_text is None or job.segment_prefetch:
+            return
+        if job is not self.job:
+            self.job = job
+        urls = pipeline.parse_m3u_lines(job.playlist_text.splitlines())
+        for index, url in enumerate(urls[:self.prefetch_count]):
+            with scheduler.priority_scope(scheduler.segment_priority(index)):
+                task = asyncio.ensure_future(net.fetch_bytes(url))
+            task.add_done_callback(_consume_exception)
+            job.segment_prefetch[index] = task
+        logger.debug("prefetching %s segments of %s", len(job.segment_prefetch), job.input_url)
+
+
+def _consume_exception(task):
+    if not task.cancelled():
+        task.exception()
@@ -0,0 +1,65 @@
+"""
+Lightweight wall-clock timing for named stages (startup, scans).
+"""
+
+import time
+from contextlib import contextmanager
+
+from soundloader.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class StageTimer:
+    """
+    Records how long named stages take and when they finished, relative to
+    the moment the timer was created.
+
+    Usage:
+        timer = StageTimer("startup")
+        with timer.stage("fonts"):
+            ...
+        timer.mark("interactive")
+        print(timer.report())
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.origin = time.perf_counter()
+        # (stage name, seconds from origin to start, duration in seconds)
+        self.stages = []
+
+    def elapsed(self):
+        """Seconds since the timer was created."""
+        return time.perf_counter() - self.origin
+
+    @contextmanager
+    def stage(self, name):
+        """Times the body of a with-block (sync or inside a coroutine)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.stages.append((name, start - self.origin, end - start))
+            logger.debug("%s: %s took %.1f ms (done at +%.1f ms)",
+                         self.name, name, (end - start) * 1000, (end - self.origin) * 1000)
+
+    def mark(self, name):
+        """Records a zero-length milestone, e.g. 'interactive'."""
+        self.stages.append((name, self.elapsed(), 0.0))
+        logger.debug("%s: %s at +%.1f ms", self.name, name, self.elapsed() * 1000)
+
+    def get(self, name):
+        """Returns (start, duration) of the most recent stage with this name, or None."""
+        for stage_name, start, duration in reversed(self.stages):
+            if stage_name == name:
+                return start, duration
+        return None
+
+    def report(self):
+        """Returns a table of all recorded stages, ordered by finish time."""
+        lines = [f"{self.name} timings (ms):", f"{'stage':<24} {'start':>9} {'duration':>9} {'done':>9}"]
+        for name, start, duration in sorted(self.stages, key=lambda s: s[1] + s[2]):
+            lines.append(f"{name:<24} {start * 1000:>9.1f} {duration * 1000:>9.1f} {(start + duration) * 1000:>9.1f}")
+        return "\n".join(lines)
@@ -0,0 +1,310 @@
+"""
+Span-based tracing for the download pipeline.
+
+A Tracer collects the spans of one job (load + download of a track). The
+active tracer and span live in context variables, so tasks spawned inside
+a job (segment downloads) record into the same trace without threading a
+tracer through every call. A job's trace can be exported as Chrome
+trace-event JSON (open it in chrome://tracing or https://ui.perfetto.dev),
+and TraceAggregator folds finished jobs into per-stage histograms.
+"""
+
+import asyncio
+import bisect
+import contextvars
+import functools
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+_current_tracer = contextvars.ContextVar("soundloader_tracer", default=None)
+_current_span = contextvars.ContextVar("soundloader_span", default=None)
+
+
+class Span:
+    """One timed operation. args holds annotations such as bytes and retries."""
+
+    __slots__ = ('name', 'start_ns', 'end_ns', 'lane', 'args')
+
+    def __init__(self, name, lane, args):
+        self.name = name
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns = None
+        self.lane = lane
+        self.args = args
+
+    @property
+    def duration(self):
+        """Duration in seconds (up to now if the span is still open)."""
+        end = self.end_ns if self.end_ns is not None else time.perf_counter_ns()
+        return (end - self.start_ns) / 1e9
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def add(self, key, amount=1):
+        """Increments a numeric annotation, e.g. span.add('retries')."""
+        self.args[key] = self.args.get(key, 0) + amount
+
+
+class Tracer:
+    """
+    Collects spans for one job.
+
+    :param job_id: Identifier used in exported file names and trace metadata.
+    :param name: Human readable job name (e.g. the track URL).
+    """
+
+    def __init__(self, job_id, name=""):
+        self.job_id = str(job_id)
+        self.name = name
+        self.origin_ns = time.perf_counter_ns()
+        self.spans = []
+        # asyncio tasks / threads mapped to small lane numbers for the trace viewer
+        self._lanes = {}
+
+    def _lane(self):
+        task = None
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            pass
+        key = task if task is not None else threading.get_ident()
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = len(self._lanes) + 1
+        return lane
+
+    @contextmanager
+    def span(self, name, **args):
+        """Times a with-block as a span of this tracer and makes it the current span."""
+        span = Span(name, self._lane(), args)
+        self.spans.append(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.args['error'] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end_ns = time.perf_counter_ns()
+            _current_span.reset(token)
+
+    def durations(self):
+        """Returns {span name: [durations in seconds]} for the finished spans."""
+        result = {}
+        for span in self.spans:
+            if span.end_ns is not None:
+                result.setdefault(span.name, []).append(span.duration)
+        return result
+
+    def to_chrome_trace(self):
+        """Returns the job as a Chrome trace-event dictionary."""
+        pid = os.getpid()
+        events = [{
+            "name": "process_name", "ph": "M", "pid": pid, "tid": 0,
+            "args": {"name": f"job {self.job_id} {self.name}".strip()},
+        }]
+        for span in self.spans:
+            end_ns = span.end_ns if span.end_ns is not None else time.perf_counter_ns()
+            events.append({
+                "name": span.name,
+                "cat": "pipeline",
+                "ph": "X",
+                "ts": (span.start_ns - self.origin_ns) / 1000,
+                "dur": (end_ns - span.start_ns) / 1000,
+                "pid": pid,
+                "tid": span.lane,
+                "args": {k: _json_safe(v) for k, v in span.args.items()},
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"job_id": self.job_id}}
+
+    def export(self, path):
+        """Writes the Chrome trace JSON to path (blocking)."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(), f)
+        return str(path)
+
+
+def _json_safe(value):
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+# ------------------- CONTEXT HELPERS -------------------
+def start_job(job_id, name=""):
+    """Creates a Tracer and makes it current for this context (and tasks created from it)."""
+    tracer = Tracer(job_id, name)
+    _current_tracer.set(tracer)
+    return tracer
+
+
+def activate(tracer):
+    """Makes an existing tracer current, e.g. when a job continues in another UI callback."""
+    _current_tracer.set(tracer)
+
+
+def current_tracer():
+    return _current_tracer.get()
+
+
+def current_span():
+    return _current_span.get()
+
+
+class _NullSpan:
+    """Stands in for a Span when no job is being traced."""
+
+    args = {}
+
+    def set(self, **args):
+        pass
+
+    def add(self, key, amount=1):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+@contextmanager
+def span(name, **args):
+    """Times a with-block in the current job's trace. A no-op outside of a traced job."""
+    tracer = _current_tracer.get()
+    if tracer is None:
+        yield _NULL_SPAN
+        return
+    with tracer.span(name, **args) as s:
+        yield s
+
+
+def annotate(**args):
+    """Adds annotations (bytes=..., status=...) to the current span, if any."""
+    s = _current_span.get()
+    if s is not None:
+        s.set(**args)
+
+
+def traced(name=None):
+    """Decorator that wraps every call of a coroutine function (or plain function) in a span."""
+    def decorator(fn):
+        span_name = name or fn.__name__
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ------------------- AGGREGATION -------------------
+class Histogram:
+    """
+    Log-bucketed histogram of durations (seconds), with about 9% resolution
+    between 100 µs and ~10 minutes. Percentiles are bucket upper bounds.
+    """
+
+    BUCKET_GROWTH = 2 ** 0.125
+    MIN_VALUE = 1e-4
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.buckets = {}
+
+    def _bucket(self, value):
+        if value <= self.MIN_VALUE:
+            return 0
+        return int(math.ceil(math.log(value / self.MIN_VALUE, self.BUCKET_GROWTH)))
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        bucket = self._bucket(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, p):
+        """Returns the value at percentile p (0-100)."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * p / 100))
+        keys = sorted(self.buckets)
+        cumulative = []
+        running = 0
+        for key in keys:
+            running += self.buckets[key]
+            cumulative.append(running)
+        bucket = keys[bisect.bisect_left(cumulative, rank)]
+        return min(self.max, self.MIN_VALUE * self.BUCKET_GROWTH ** bucket)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class TraceAggregator:
+    """Folds finished job traces into per-span-name histograms and counters."""
+
+    def __init__(self):
+        self.jobs = 0
+        self.histograms = {}
+        # per span name sums of numeric annotations (bytes, retries)
+        self.totals = {}
+
+    def add(self, tracer):
+        self.jobs += 1
+        for s in tracer.spans:
+            if s.end_ns is None:
+                continue
+            self.histograms.setdefault(s.name, Histogram()).add(s.duration)
+            totals = self.totals.setdefault(s.name, {})
+            for key, value in s.args.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    totals[key] = totals.get(key, 0) + value
+
+    def to_dict(self):
+        return {
+            "jobs": self.jobs,
+            "spans": {
+                name: {
+                    "count": h.count,
+                    "mean_ms": h.mean * 1000,
+                    "p50_ms": h.percentile(50) * 1000,
+                    "p99_ms": h.percentile(99) * 1000,
+                    "max_ms": h.max * 1000,
+                    "total_ms": h.total * 1000,
+                    **self.totals.get(name, {}),
+                }
+                for name, h in self.histograms.items()
+            },
+        }
+
+    def report(self):
+        """Returns a table of span timings across all jobs, slowest total first."""
+        lines = [f"pipeline timings over {self.jobs} job(s) (ms):",
+                 f"{'span':<26} {'count':>6} {'p50':>9} {'p99':>9} {'max':>9} {'total':>10} {'bytes':>12} {'retries':>7}"]
+        for name, h in sorted(self.histograms.items(), key=lambda item: item[1].total, reverse=True):
+            totals = self.totals.get(name, {})
+            lines.append(f"{name:<26} {h.count:>6} {h.percentile(50) * 1000:>9.1f} {h.percentile(99) * 1000:>9.1f} "
+                         f"{h.max * 1000:>9.1f} {h.total * 1000:>10.1f} {totals.get('bytes', 0):>12} "
+                         f"{totals.get('retries', 0):>7}")
+        return "\n".join(lines)
+
+
+# process-wide aggregate of every finished job
+AGGREGATE = TraceAggregator()
@@ -0,0 +1,346 @@
+"""
+Watches the storage directory for audio files that are added, removed or
+modified by other processes (iOS Files sync, another app, a shell on Linux).
+
+On Linux the watcher uses inotify through ctypes. Everywhere else (and when
+inotify can't be initialised) it falls back to a cheap poller that only
+stats directories and re-lists a directory when its mtime changes.
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+from pathlib import Path
+
+from soundloader.log import get_logger
+
+logger = get_logger(__name__)
+
+# event kinds passed to the on_event callback
+ADDED = "added"
+REMOVED = "removed"
+MODIFIED = "modified"
+
+# inotify constants (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+
+
+def _load_inotify():
+    """Returns libc if it exposes inotify, otherwise None."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+        libc.inotify_rm_watch
+    except (OSError, AttributeError):
+        return None
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+class StorageWatcher:
+    """
+    Reports changes to matching files below a root directory.
+
+    :param root: Directory to watch (recursively).
+    :param on_event: Callable taking (kind, path) where kind is ADDED,
+        REMOVED or MODIFIED and path is a pathlib.Path. Always called on the
+        event loop thread.
+    :param suffixes: Only files with one of these suffixes are reported.
+    :param interval: Seconds between polls when inotify isn't available.
+    :param use_inotify: Force (True) or disable (False) inotify. None picks
+        inotify whenever the platform supports it.
+    :param loop: Event loop to run on. Defaults to the running loop.
+    """
+
+    def __init__(self, root, on_event, suffixes=('.m4a',), interval=2.0, use_inotify=None, loop=None):
+        self.root = Path(root)
+        self.on_event = on_event
+        self.suffixes = tuple(s.lower() for s in suffixes)
+        self.interval = interval
+        self.use_inotify = use_inotify
+        self.loop = loop
+        self.backend = None
+
+        # files we've reported as present, mapped to their (mtime_ns, size)
+        self._known = {}
+        # directory -> mtime_ns, directory -> its matching files, directory -> its subdirectories
+        self._dir_mtimes = {}
+        self._files = {}
+        self._subdirs = {}
+        # inotify state
+        self._libc = None
+        self._fd = -1
+        self._wd_to_dir = {}
+        self._dir_to_wd = {}
+        self._poll_task = None
+
+    def _matches(self, name):
+        return name.lower().endswith(self.suffixes)
+
+    def _emit(self, kind, path):
+        try:
+            self.on_event(kind, Path(path))
+        except Exception as e:
+            logger.error("StorageWatcher: error handling %s event for %s: %s", kind, path, e)
+
+    def start(self):
+        """Takes a snapshot of the tree and starts watching it."""
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+
+        libc = _load_inotify() if self.use_inotify is not False else None
+        if libc is not None:
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd >= 0:
+                self._libc = libc
+                self._fd = fd
+        if self.use_inotify and self._fd < 0:
+            logger.warning("StorageWatcher: inotify unavailable, falling back to polling")
+
+        if self._fd >= 0:
+            self.backend = "inotify"
+            for dir_path in self._walk_dirs(self.root):
+                self._add_watch(dir_path)
+                self._snapshot_dir(dir_path)
+            self.loop.add_reader(self._fd, self._read_events)
+        else:
+            self.backend = "poll"
+            for dir_path in self._walk_dirs(self.root):
+                self._snapshot_dir(dir_path)
+            self._poll_task = self.loop.create_task(self._poll_forever())
+        logger.info("StorageWatcher: watching %s via %s (%s files)", self.root, self.backend, len(self._known))
+
+    def stop(self):
+        """Stops watching and releases the inotify descriptor."""
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            self._poll_task = None
+        if self._fd >= 0:
+            self.loop.remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = -1
+            self._wd_to_dir.clear()
+            self._dir_to_wd.clear()
+
+    def known_paths(self):
+        """Returns the set of matching file paths (str) the watcher currently knows about."""
+        return set(self._known)
+
+    # ------------------- SNAPSHOTS -------------------
+    def _walk_dirs(self, top):
+        """Yields top and every directory below it."""
+        stack = [str(top)]
+        while stack:
+            dir_path = stack.pop()
+            yield dir_path
+            try:
+                with os.scandir(dir_path) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+            except OSError:
+                continue
+
+    def _list_dir(self, dir_path):
+        """Returns ({matching file path: (mtime_ns, size)}, {subdirectory paths})."""
+        files = {}
+        subdirs = set()
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.add(entry.path)
+                    elif self._matches(entry.name) and entry.is_file():
+                        st = entry.stat()
+                        files[entry.path] = (st.st_mtime_ns, st.st_size)
+                except OSError:
+                    continue
+        return files, subdirs
+
+    def _snapshot_dir(self, dir_path):
+        """Records a directory's current state without emitting events and returns its files."""
+        try:
+            self._dir_mtimes[dir_path] = os.stat(dir_path).st_mtime_ns
+            files, subdirs = self._list_dir(dir_path)
+        except OSError:
+            return {}
+        self._files[dir_path] = set(files)
+        self._subdirs[dir_path] = subdirs
+        self._known.update(files)
+        return files
+
+    # ------------------- POLLING -------------------
+    async def _poll_forever(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error("StorageWatcher: poll failed: %s", e)
+
+    def poll(self):
+        """Stats every known directory and re-lists only the ones whose mtime changed."""
+        for dir_path in list(self._dir_mtimes):
+            if dir_path not in self._dir_mtimes:
+                # removed while handling an earlier directory in this pass
+                continue
+            try:
+                mtime = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                self._drop_dir(dir_path)
+                continue
+            if mtime != self._dir_mtimes[dir_path]:
+                self._dir_mtimes[dir_path] = mtime
+                self._rescan_dir(dir_path)
+
+    def _rescan_dir(self, dir_path):
+        """Diffs one directory against the previous listing and emits the changes."""
+        try:
+            files, subdirs = self._list_dir(dir_path)
+        except OSError:
+            self._drop_dir(dir_path)
+            return
+
+        previous = {p: self._known[p] for p in self._files.get(dir_path, ()) if p in self._known}
+        self._files[dir_path] = set(files)
+        for path in previous.keys() - files.keys():
+            del self._known[path]
+            self._emit(REMOVED, path)
+        for path, stamp in files.items():
+            old = previous.get(path)
+            self._known[path] = stamp
+            if old is None:
+                self._emit(ADDED, path)
+            elif old != stamp:
+                self._emit(MODIFIED, path)
+
+        old_subdirs = self._subdirs.get(dir_path, set())
+        self._subdirs[dir_path] = subdirs
+        for sub in old_subdirs - subdirs:
+            self._drop_dir(sub)
+        for sub in subdirs - old_subdirs:
+            self._add_tree(sub)
+
+    def _add_tree(self, top):
+        """Starts tracking a new directory tree and reports the files already inside it."""
+        for dir_path in self._walk_dirs(top):
+            if self._fd >= 0:
+                self._add_watch(dir_path)
+            for path in self._snapshot_dir(dir_path):
+                self._emit(ADDED, path)
+
+    def _drop_dir(self, top):
+        """Forgets a directory tree that disappeared and reports its files as removed."""
+        stack = [top]
+        while stack:
+            dir_path = stack.pop()
+            self._dir_mtimes.pop(dir_path, None)
+            self._rm_watch(dir_path)
+            stack.extend(self._subdirs.pop(dir_path, ()))
+            for path in self._files.pop(dir_path, ()):
+                if self._known.pop(path, None) is not None:
+                    self._emit(REMOVED, path)
+
+    # ------------------- INOTIFY -------------------
+    def _add_watch(self, dir_path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dir_path), WATCH_MASK)
+        if wd < 0:
+            logger.warning("StorageWatcher: can't watch %s: %s", dir_path, os.strerror(ctypes.get_errno()))
+            return
+        self._wd_to_dir[wd] = dir_path
+        self._dir_to_wd[dir_path] = wd
+
+    def _rm_watch(self, dir_path):
+        wd = self._dir_to_wd.pop(dir_path, None)
+        if wd is not None and self._fd >= 0:
+            self._wd_to_dir.pop(wd, None)
+            # the kernel already dropped the watch if the directory is gone, so ignore errors
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def _read_events(self):
+        try:
+            data = os.read(self._fd, READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            logger.error("StorageWatcher: inotify read failed: %s", e)
+            return
+
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            self._handle_event(wd, mask, name)
+
+    def _handle_event(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            # the kernel dropped events; diff every directory against its last listing
+            logger.warning("StorageWatcher: inotify queue overflowed, resyncing")
+            for dir_path in list(self._dir_mtimes):
+                if dir_path in self._dir_mtimes:
+                    self._rescan_dir(dir_path)
+            return
+
+        dir_path = self._wd_to_dir.get(wd)
+        if dir_path is None:
+            return
+        if mask & IN_IGNORED:
+            self._wd_to_dir.pop(wd, None)
+            self._dir_to_wd.pop(dir_path, None)
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            if dir_path == str(self.root):
+                logger.warning("StorageWatcher: root %s went away", dir_path)
+            self._drop_dir(dir_path)
+            return
+
+        path = os.path.join(dir_path, name)
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                self._subdirs.setdefault(dir_path, set()).add(path)
+                self._add_tree(path)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self._subdirs.get(dir_path, set()).discard(path)
+                self._drop_dir(path)
+            return
+
+        if not self._matches(name):
+            return
+        if mask & (IN_DELETE | IN_MOVED_FROM):
+            self._files.get(dir_path, set()).discard(path)
+            if self._known.pop(path, None) is not None:
+                self._emit(REMOVED, path)
+        elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+            try:
+                st = os.stat(path)
+            except OSError:
+                return
+            old = self._known.get(path)
+            self._known[path] = (st.st_mtime_ns, st.st_size)
+            self._files.setdefault(dir_path, set()).add(path)
+            self._emit(ADDED if old is None else MODIFIED, path)
@@ -0,0 +1,101 @@
+"""
+Minimal well-formed fMP4 segments for tests that download through the
+pipeline, and a fake CDN that serves them.
+"""
+
+import struct
+from contextlib import asynccontextmanager
+
+import httpx
+
+from soundloader import net, pipeline
+
+ARTWORK = b"\xff\xd8\xff\xd9"
+
+
+def box(kind, payload=b""):
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+
+def init_segment(payload=b""):
+    return box(b"ftyp", b"M4A \x00\x00\x00\x00") + box(b"moov", payload)
+
+
+def media_segment(payload=b""):
+    return box(b"moof", box(b"mfhd", b"\x00" * 8)) + box(b"mdat", payload)
+
+
+def full_box(kind, version, flags, payload=b""):
+    return box(kind, struct.pack(">I", (version << 24) | flags) + payload)
+
+
+def fragmented_track(fragments, samples, sample_duration=1024, timescale=44100, per_sample=False):
+    """
+    A whole fragmented file with one track and no duration in its moov: the
+    init segment and one moof + mdat per fragment, with the decode time in
+    tfdt and the sample durations in trex (or in every trun entry with per_sample).
+    """
+    mvhd = full_box(b"mvhd", 0, 0, struct.pack(">IIII", 0, 0, 1000, 0) + b"\x00" * 80)
+    tkhd = full_box(b"tkhd", 0, 7, struct.pack(">IIIII", 0, 0, 1, 0, 0) + b"\x00" * 60)
+    mdhd = full_box(b"mdhd", 0, 0, struct.pack(">IIIIHH", 0, 0, timescale, 0, 0x55C4, 0))
+    hdlr = full_box(b"hdlr", 0, 0, struct.pack(">I4s12x", 0, b"soun") + b"\x00")
+    stbl = box(b"stbl", full_box(b"stsd", 0, 0, struct.pack(">I", 0)))
+    trak = box(b"trak", tkhd + box(b"mdia", mdhd + hdlr + box(b"minf", stbl)))
+    trex = full_box(b"trex", 0, 0, struct.pack(">IIIII", 1, 1, sample_duration, 0, 0))
+    data = box(b"ftyp", b"M4A \x00\x00\x00\x00") + box(b"moov", mvhd + trak + box(b"mvex", trex))
+    for i in range(fragments):
+        if per_sample:
+            trun = full_box(b"trun", 0, 0x000300, struct.pack(">I", samples)
+                            + struct.pack(">II", sample_duration, 4) * samples)
+        else:
+            trun = full_box(b"trun", 0, 0x000200, struct.pack(">I", samples) + struct.pack(">I", 4) * samples)
+        tfhd = full_box(b"tfhd", 0, 0x020000, struct.pack(">I", 1))
+        tfdt = full_box(b"tfdt", 1, 0, struct.pack(">Q", i * samples * sample_duration))
+        mfhd = full_box(b"mfhd", 0, 0, struct.pack(">I", i + 1))
+        data += box(b"moof", mfhd + box(b"traf", tfhd + tfdt + trun)) + box(b"mdat", b"\x00" * 4 * samples)
+    return data
+
+
+def track_segments(count, size=1000, base="https://cdn/"):
+    """The init segment and count media segments of a track, by URL."""
+    segments = {f"{base}{i}.m4s": media_segment(bytes([i]) * size) for i in range(1, count + 1)}
+    segments[f"{base}init.mp4"] = init_segment(b"init" * 100)
+    return segments
+
+
+def assembled(segments, count, base="https://cdn/"):
+    """The bytes the pipeline assembles from track_segments()."""
+    return segments[f"{base}init.mp4"] + b"".join(segments[f"{base}{i}.m4s"] for i in range(1, count + 1))
+
+
+def make_job(count, filename="b", base="https://cdn/", query="", stream_id="", artwork=ARTWORK,
+             input_url="https://soundcloud.com/a/b"):
+    """A resolved TrackJob whose playlist lists the segments of track_segments(count, base=base)."""
+    job = pipeline.TrackJob(input_url)
+    if stream_id:
+        job.stream_url = pipeline.STREAM_URL_BEGIN + stream_id + pipeline.STREAM_URL_END
+    job.filename = filename
+    job.thumbnail_filename = filename + ".jpg"
+    job.artwork = artwork
+    job.playlist_text = f'#EXTM3U\n#EXT-X-MAP:URI="{base}init.mp4{query}"\n' + "".join(
+        f"#EXTINF:10,\n{base}{i}.m4s{query}\n" for i in range(1, count + 1))
+    return job
+
+
+@asynccontextmanager
+async def fake_cdn(content, requests=None):
+    """
+    Serves content (URL without its query -> body) through the shared
+    client for the block, appending every requested URL to requests.
+    """
+    def handler(request):
+        if requests is not None:
+            requests.append(str(request.url))
+        return httpx.Response(200, content=content[str(request.url.copy_with(query=None))])
+
+    net.use_transport(httpx.MockTransport(handler))
+    try:
+        yield requests
+    finally:
+        await net.aclose_client()
+        net.use_transport(None)
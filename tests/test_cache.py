@@ -0,0 +1,118 @@
+import asyncio
+import os
+
+from soundloader import cache, pipeline
+from soundloader.cache import MediaCache
+from tests.segments import ARTWORK, fake_cdn, make_job, track_segments
+
+
+def test_lru_eviction_keeps_the_budget_and_dedups_content(tmp_path):
+    async def run():
+        media = MediaCache(tmp_path / "media", max_bytes=2500)
+        await media.put_bytes("a", b"a" * 1000)
+        await media.put_bytes("b", b"b" * 1000)
+        # same content under another key takes no extra space
+        await media.put_bytes("b2", b"b" * 1000)
+        assert media.total_bytes == 2000
+        # touch a, so b is the least recently used
+        assert await media.get_bytes("a") == b"a" * 1000
+        await media.put_bytes("c", b"c" * 1000)
+        await media.flush()
+        return media
+
+    media = asyncio.run(run())
+    assert set(media.entries) == {"a", "c"}
+    assert media.total_bytes <= 2500
+    objects = [name for _, _, names in os.walk(tmp_path / "media" / "objects") for name in names]
+    assert len(objects) == 2
+
+    # the index survives a restart
+    reopened = MediaCache(tmp_path / "media", max_bytes=2500)
+    asyncio.run(reopened.open())
+    assert set(reopened.entries) == {"a", "c"}
+
+
+def test_damaged_object_is_a_miss(tmp_path):
+    async def run():
+        media = MediaCache(tmp_path / "media")
+        await media.put_bytes("k", b"original")
+        sha = media.entries["k"]["sha"]
+        with open(media._object_path(sha), "wb") as f:
+            f.write(b"tampered")
+        return media, await media.get_file("k", tmp_path / "out")
+
+    media, size = asyncio.run(run())
+    assert size is None
+    assert "k" not in media.entries
+    assert not (tmp_path / "out").exists()
+
+
+def test_keys_ignore_signed_query_parameters():
+    assert cache.segment_key("42", "https://cdn/media/0/1.m4s?Policy=abc&Signature=x") == \
+        cache.segment_key("42", "https://cdn/media/0/1.m4s?Policy=def&Signature=y")
+
+
+def test_second_download_of_a_track_makes_no_requests(tmp_path):
+    requests = []
+    content = track_segments(4, size=2000, base="https://cdn/hls/")
+    content["https://i1.sndcdn.com/art.jpg"] = ARTWORK
+
+    def signed_job(signature):
+        job = make_job(4, "x", base="https://cdn/hls/", query=f"?sig={signature}", stream_id="42", artwork=None,
+                       input_url="https://on.soundcloud.com/x")
+        job.thumbnail_url = "https://i1.sndcdn.com/art.jpg"
+        return job
+
+    async def run():
+        cache.configure(tmp_path / "media")
+        try:
+            async with fake_cdn(content, requests):
+                first = await pipeline.download_track(signed_job("one"), tmp_path / "t1", tmp_path / "out1")
+                requests_before = len(requests)
+                second = await pipeline.download_track(signed_job("two"), tmp_path / "t2", tmp_path / "out2")
+                return first, second, requests_before
+        finally:
+            cache.configure(None)
+
+    (tmp_path / "out1").mkdir()
+    (tmp_path / "out2").mkdir()
+    first, second, requests_before = asyncio.run(run())
+    assert requests_before == 6
+    assert len(requests) == 6
+    with open(first, "rb") as a, open(second, "rb") as b:
+        assert a.read() == b.read()
+
+
+def test_discarding_keys_deletes_objects_once_unreferenced(tmp_path):
+    async def run():
+        media = MediaCache(tmp_path / "media")
+        for i in range(3):
+            await media.put_bytes(f"segment:1:/{i}.m4s", bytes([i]) * 100)
+        # the track shares its content with the last segment
+        await media.put_bytes("track:1", bytes([2]) * 100)
+        await media.discard_prefix("segment:1:")
+        assert set(media.entries) == {"track:1"} and media.total_bytes == 100
+        await media.discard("track:1")
+        return media
+
+    media = asyncio.run(run())
+    assert media.total_bytes == 0 and media.entries == {}
+    assert [name for _, _, names in os.walk(tmp_path / "media" / "objects") for name in names] == []
+
+
+def test_concurrent_flushes_write_the_whole_index(tmp_path):
+    async def run():
+        media = MediaCache(tmp_path / "media")
+
+        async def download(key):
+            # what download_track() does at the end of each parallel track
+            await media.put_bytes(key, key.encode())
+            await media.flush()
+
+        for round in range(30):
+            await asyncio.gather(*(download(f"track:{round}:{i}") for i in range(4)))
+        return media
+
+    media = asyncio.run(run())
+    assert len(media._load()) == 120
+    assert sorted(os.listdir(tmp_path / "media")) == ["index.json", "objects"]
@@ -0,0 +1,67 @@
+import asyncio
+import threading
+
+import pytest
+
+from soundloader import concat
+
+
+def test_future_bridge_completes_from_another_thread():
+    async def run():
+        bridge = concat.FutureBridge()
+        threading.Thread(target=bridge.set_result, args=("done",)).start()
+        result = await asyncio.wait_for(bridge.future, 2)
+
+        failing = concat.FutureBridge()
+        threading.Thread(target=failing.set_exception, args=(OSError("export failed"),)).start()
+        with pytest.raises(OSError):
+            await asyncio.wait_for(failing.future, 2)
+
+        # a late result for a cancelled future is dropped, not an InvalidStateError
+        cancelled = concat.FutureBridge()
+        cancelled.future.cancel()
+        cancelled.set_result("late")
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == "done"
+
+
+def test_streaming_backend_joins_files_in_order(tmp_path):
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"chunk{i}.m4s"
+        path.write_bytes(bytes([i]) * (1000 + i))
+        paths.append(path)
+
+    async def run():
+        return await concat.StreamingConcatenator().concatenate_audio_files(paths, tmp_path / "out.m4a")
+
+    assert asyncio.run(run()) == tmp_path / "out.m4a"
+    assert (tmp_path / "out.m4a").read_bytes() == b"".join(p.read_bytes() for p in paths)
+
+
+class FakeNative(concat.ConcatBackend):
+    name = "native"
+
+
+def test_selector_picks_the_fastest_measured_backend():
+    profile = {
+        "python": {"fixed_s": 0.0, "per_segment_s": 0.0001, "per_mb_s": 0.001},
+        "native": {"fixed_s": 0.05, "per_segment_s": 0.0, "per_mb_s": 0.0},
+    }
+    selector = concat.BackendSelector(profile, backends=[concat.StreamingConcatenator, FakeNative])
+    assert selector.select(10, 2_000_000).name == "python"
+    assert selector.select(2000, 300_000_000).name == "native"
+    # without a measurement the native backend is never picked
+    selector = concat.BackendSelector({"python": profile["python"]}, backends=[concat.StreamingConcatenator, FakeNative])
+    assert selector.select(2000, 300_000_000).name == "python"
+
+
+def test_fit_profile_recovers_the_cost_model():
+    samples = [(n, b, 0.002 + 0.0001 * n + 0.003 * b / 1e6)
+               for n in (10, 50, 200) for b in (1_000_000, 8_000_000)]
+    model = concat.fit_profile(samples)
+    assert model["fixed_s"] == pytest.approx(0.002, rel=1e-6)
+    assert model["per_segment_s"] == pytest.approx(0.0001, rel=1e-6)
+    assert model["per_mb_s"] == pytest.approx(0.003, rel=1e-6)
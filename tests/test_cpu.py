@@ -0,0 +1,46 @@
+import asyncio
+import math
+import os
+
+import pytest
+
+from soundloader import cpu
+from soundloader.cpu import CPUExecutor
+
+
+@pytest.mark.skipif(not cpu.processes_supported(), reason="no worker processes on this platform")
+def test_map_runs_batches_on_worker_processes_in_order():
+    executor = CPUExecutor(max_workers=2, batch_size=3)
+
+    async def run():
+        assert await executor.map(math.factorial, []) == []
+        results = await executor.map(math.factorial, [5, -1, 3, 0, 4, 1, 2], return_exceptions=True)
+        worker = await executor.run(os.getpid)
+        return results, worker
+
+    try:
+        results, worker = asyncio.run(run())
+    finally:
+        executor.shutdown()
+    assert results[0] == 120 and isinstance(results[1], ValueError) and results[2:] == [6, 1, 24, 1, 2]
+    assert worker != os.getpid() and executor.use_processes
+
+
+def test_falls_back_to_threads_when_processes_cannot_start(monkeypatch):
+    def no_processes(*args, **kwargs):
+        raise OSError("fork not permitted")
+
+    monkeypatch.setattr(cpu, "ProcessPoolExecutor", no_processes)
+    executor = CPUExecutor(max_workers=2, use_processes=True)
+
+    async def run():
+        with pytest.raises(ValueError):
+            await executor.map(math.factorial, [3, -1])
+        return await executor.map(math.factorial, range(6)), await executor.run(os.getpid)
+
+    try:
+        results, worker = asyncio.run(run())
+    finally:
+        executor.shutdown()
+    assert results == [1, 1, 2, 6, 24, 120]
+    assert worker == os.getpid() and not executor.use_processes
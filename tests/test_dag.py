@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+import pytest
+
+from soundloader.dag import Graph
+
+
+def test_independent_nodes_overlap_and_dependents_get_results():
+    order = []
+
+    async def fetch(name, delay, *args):
+        await asyncio.sleep(delay)
+        order.append(name)
+        return name + "".join(args)
+
+    graph = Graph("t")
+    graph.add("page", lambda: fetch("page", 0.1))
+    graph.add("client_id", lambda: fetch("client_id", 0.1))
+    graph.add("info", lambda page: page.upper(), deps=("page",))
+    graph.add("playlist", lambda info, cid: fetch("playlist", 0.05, info, cid), deps=("info", "client_id"))
+
+    start = time.perf_counter()
+    results = asyncio.run(graph.run())
+    elapsed = time.perf_counter() - start
+
+    assert results["playlist"] == "playlistPAGEclient_id"
+    assert order[-1] == "playlist"
+    # the two 0.1 s fetches overlap: about 0.15 s, not 0.25 s
+    assert elapsed < 0.22
+    path, _seconds = graph.critical_path()
+    assert path[-1] == "playlist" and path[0] in ("page", "client_id")
+
+
+def test_required_failure_cancels_the_rest_and_optional_failure_gives_none():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    def broken():
+        raise RuntimeError("boom")
+
+    graph = Graph("t")
+    graph.add("slow", slow)
+    graph.add("broken", broken)
+    with pytest.raises(RuntimeError, match="boom"):
+        asyncio.run(graph.run())
+    assert cancelled
+
+    graph = Graph("t")
+    graph.add("art", broken, optional=True)
+    graph.add("after", lambda art: art is None, deps=("art",))
+    assert asyncio.run(graph.run()) == {"art": None, "after": True}
+
+
+def test_unknown_dependency_is_rejected():
+    with pytest.raises(ValueError):
+        Graph().add("a", lambda b: b, deps=("b",))
@@ -0,0 +1,198 @@
+import asyncio
+import json
+import os
+import shutil
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+import pytest
+
+from soundloader import cache, cpu, expand, fingerprint, net, pipeline, preflight
+from tests.segments import init_segment, media_segment
+
+
+def api_track(track_id, complete=True):
+    if not complete:
+        return {"id": track_id}
+    return {
+        "id": track_id,
+        "title": f"Track {track_id}",
+        "permalink_url": f"https://soundcloud.com/artist/track-{track_id}",
+        "artwork_url": f"https://i1.sndcdn.com/artworks-{track_id}-large.jpg",
+        "user": {"username": "Artist"},
+        "media": {"transcodings": [
+            {"url": f"https://api-v2.soundcloud.com/media/soundcloud:tracks:{track_id}/x/stream/progressive",
+             "format": {"protocol": "progressive", "mime_type": "audio/mpeg"}},
+            {"url": f"https://api-v2.soundcloud.com/media/soundcloud:tracks:{track_id}/x/stream/hls",
+             "format": {"protocol": "hls", "mime_type": "audio/mp4; codecs=\"mp4a.40.2\""}},
+        ]},
+    }
+
+
+def fake_api(requests, set_size=0, user_pages=0, delay=0.0):
+    async def handler(request):
+        url = urlsplit(str(request.url))
+        query = parse_qs(url.query)
+        requests.append(url.path)
+        assert query["client_id"] == ["cid"]
+        await asyncio.sleep(delay)
+        if url.path == "/resolve":
+            if "/sets/" in query["url"][0]:
+                tracks = [api_track(i, complete=i < 5) for i in range(set_size)]
+                body = {"kind": "playlist", "tracks": tracks}
+            else:
+                body = {"kind": "user", "id": 7}
+        elif url.path == "/tracks":
+            ids = [int(i) for i in query["ids"][0].split(",")]
+            assert len(ids) <= expand.TRACK_BATCH
+            body = [api_track(i) for i in reversed(ids)]
+        elif url.path == "/users/7/tracks":
+            page = int(query.get("page", ["0"])[0])
+            body = {"collection": [api_track(page * 10 + i) for i in range(10)],
+                    "next_href": f"https://api-v2.soundcloud.com/users/7/tracks?page={page + 1}"
+                    if page + 1 < user_pages else None}
+        else:
+            return httpx.Response(404)
+        return httpx.Response(200, content=json.dumps(body).encode())
+    return handler
+
+
+def collect(url, handler):
+    async def run():
+        net.use_transport(httpx.MockTransport(handler))
+        try:
+            return [job async for job in expand.expand(url, "cid")]
+        finally:
+            await net.aclose_client()
+            net.use_transport(None)
+    return asyncio.run(run())
+
+
+def test_classify_url():
+    assert expand.classify_url("https://soundcloud.com/artist/a-track") == "track"
+    assert expand.classify_url("https://soundcloud.com/artist/sets/an-album") == "set"
+    assert expand.classify_url("https://soundcloud.com/artist") == "user"
+    assert expand.classify_url("https://soundcloud.com/artist/tracks") == "user"
+    assert expand.classify_url("https://on.soundcloud.com/AbC123") == "short"
+    assert expand.classify_url("https://example.com/artist/sets/x") == ""
+    for url in ("https://soundcloud.com/artist/likes", "https://soundcloud.com/artist/albums",
+                "https://soundcloud.com/artist/reposts", "https://soundcloud.com/artist/sets",
+                "https://soundcloud.com/you/library", "https://soundcloud.com/discover"):
+        assert expand.classify_url(url) == "", url
+
+
+def test_only_mp4_hls_streams_are_used():
+    track = api_track(1)
+    assert expand.hls_transcoding(track).endswith("/stream/hls")
+    track["media"]["transcodings"] = [
+        {"url": "https://api-v2.soundcloud.com/media/soundcloud:tracks:1/x/stream/hls",
+         "format": {"protocol": "hls", "mime_type": "audio/mpeg"}}]
+    assert expand.hls_transcoding(track) == ""
+    assert expand.job_from_api_track(track) is None
+
+
+def test_set_is_expanded_in_order_with_batched_lookups():
+    requests = []
+    jobs = collect("https://soundcloud.com/artist/sets/big", fake_api(requests, set_size=120))
+    assert [job.title for job in jobs] == [f"Track {i}" for i in range(120)]
+    assert jobs[7].stream_url.endswith("/soundcloud:tracks:7/x/stream/hls")
+    assert jobs[7].artist == "Artist" and jobs[7].filename == "Track_7"
+    # 115 ids in batches of 50
+    assert requests.count("/tracks") == 3
+
+
+def test_profile_yields_first_page_before_the_listing_is_done():
+    requests = []
+    seen = []
+
+    async def run():
+        net.use_transport(httpx.MockTransport(fake_api(requests, user_pages=3, delay=0.02)))
+        try:
+            async for job in expand.expand("https://soundcloud.com/artist/tracks", "cid"):
+                # the first job arrives before the last page has even been asked for
+                seen.append((job.title, requests.count("/users/7/tracks")))
+        finally:
+            await net.aclose_client()
+            net.use_transport(None)
+
+    asyncio.run(run())
+    assert len(seen) == 30
+    assert seen[0][1] < 3
+
+
+def collection_handler(api):
+    # the client id, the stream and playlist lookups and the CDN of a listed track; the rest goes to api
+    async def handler(request):
+        url = str(request.url)
+        if url.startswith(pipeline.CLIENT_ID_JS_URL):
+            return httpx.Response(200, content=b'x={u:"https://api/?client_id=cid"}')
+        if "/stream/hls" in url:
+            track_id = url.split("tracks:")[1].split("/")[0]
+            return httpx.Response(200, content=json.dumps({"url": f"https://cdn/{track_id}/playlist.m3u8"}).encode())
+        if url.endswith("playlist.m3u8"):
+            base = url.rsplit("/", 1)[0]
+            return httpx.Response(200, content=f'#EXTM3U\n#EXT-X-MAP:URI="{base}/init.mp4"\n#EXTINF:10,\n{base}/1.m4s\n'.encode())
+        if url.endswith("init.mp4"):
+            return httpx.Response(200, content=init_segment())
+        if url.startswith("https://cdn/"):
+            return httpx.Response(200, content=media_segment(b"data" * 50))
+        if url.startswith("https://i1.sndcdn.com/"):
+            return httpx.Response(200, content=b"\xff\xd8\xff\xd9")
+        return await api(request)
+    return handler
+
+
+def run_collection(handler, collection):
+    async def run():
+        # the app starts the CPU workers at startup; so does this, so that it only times the collection
+        await cpu.get_cpu_executor().start()
+        net.use_transport(httpx.MockTransport(handler))
+        try:
+            await collection.run()
+        finally:
+            await net.aclose_client()
+            net.use_transport(None)
+    asyncio.run(run())
+
+
+def test_collection_downloads_start_while_the_profile_is_still_listing(tmp_path):
+    requests = []
+    events = []
+
+    def on_track(job, path, error):
+        events.append((path is not None, requests.count("/users/7/tracks")))
+
+    collection = expand.CollectionDownload("https://soundcloud.com/artist", tmp_path / "temp", tmp_path,
+                                           concurrency=2, on_track=on_track)
+    run_collection(collection_handler(fake_api(requests, user_pages=3, delay=0.05)), collection)
+    assert collection.listed == 30 and len(collection.paths) == 30 and not collection.failed
+    assert all(ok for ok, _ in events)
+    # the first track was saved before the last page of the listing was requested
+    assert events[0][1] < 3
+
+
+@pytest.mark.parametrize("cache_bytes", [None, 2_000_000])
+def test_collection_stops_queueing_when_the_rest_wont_fit(tmp_path, monkeypatch, cache_bytes):
+    # every track is 1 MB, and 3.5 MB are free besides what the cache can still take
+    monkeypatch.setattr(preflight, "estimate_from_duration", lambda seconds: 1_000_000)
+    usage = shutil.disk_usage(tmp_path)
+    monkeypatch.setattr(preflight.shutil, "disk_usage",
+                        lambda path: usage._replace(free=preflight.HEADROOM_BYTES + 3_500_000 + (cache_bytes or 0)))
+    # on the same volume, as on iOS; it's counted once, not once per track
+    media_cache = cache.MediaCache(tmp_path / "cache", cache_bytes) if cache_bytes else None
+    monkeypatch.setattr(cache, "_cache", media_cache)
+    # track 0 is in the library already, so it doesn't count
+    index = fingerprint.FingerprintIndex()
+    existing = tmp_path / "saved.m4a"
+    existing.write_bytes(b"saved")
+    index.store(existing, (5, 0, "fp0"))
+    index.link_stream(expand.job_from_api_track(api_track(0)).stream_id, "fp0")
+    monkeypatch.setattr(fingerprint, "_index", index)
+
+    collection = expand.CollectionDownload("https://soundcloud.com/artist", tmp_path / "temp", tmp_path)
+    with pytest.raises(preflight.InsufficientSpaceError):
+        run_collection(collection_handler(fake_api([], user_pages=1)), collection)
+    # tracks 1-3 were downloaded to the end; track 4 and the rest weren't queued
+    assert [job.title for job in collection.skipped] == ["Track 0"]
+    assert sorted(os.path.basename(path) for path in collection.paths) == ["Track_1.m4a", "Track_2.m4a", "Track_3.m4a"]
+    assert collection.listed == 5 and not collection.listing_done and not collection.failed
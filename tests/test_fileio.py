@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from soundloader.fileio import IOExecutor
+
+
+def test_write_behind_coalesces_and_preserves_order(tmp_path):
+    executor = IOExecutor(max_workers=3)
+    path = tmp_path / "out.bin"
+    chunks = [bytes([i % 256]) * 1000 for i in range(500)]
+
+    async def run():
+        async with executor.open_writer(path, coalesce_size=16 * 1024) as writer:
+            for chunk in chunks:
+                await writer.write(chunk)
+        return writer
+
+    writer = asyncio.run(run())
+    assert path.read_bytes() == b"".join(chunks)
+    assert writer.bytes_written == 500 * 1000
+    assert executor.pending_bytes == 0
+    executor.shutdown()
+
+
+def test_producers_wait_when_write_behind_budget_is_full(tmp_path):
+    executor = IOExecutor(max_workers=1, max_pending_bytes=8 * 1024)
+    peak = 0
+
+    async def produce(name):
+        nonlocal peak
+        async with executor.open_writer(tmp_path / name, coalesce_size=4 * 1024) as writer:
+            for _ in range(50):
+                await writer.write(b"x" * 4096)
+                peak = max(peak, executor.pending_bytes)
+
+    async def run():
+        await asyncio.gather(produce("a"), produce("b"))
+
+    asyncio.run(run())
+    assert peak <= 8 * 1024
+    assert (tmp_path / "a").stat().st_size == (tmp_path / "b").stat().st_size == 50 * 4096
+    executor.shutdown()
+
+
+def test_write_errors_surface_on_close(tmp_path):
+    executor = IOExecutor(max_workers=1)
+
+    async def run():
+        writer = executor.open_writer(tmp_path / "out.bin", coalesce_size=1)
+        await writer.open()
+        writer._write_at = lambda data, offset: (_ for _ in ()).throw(OSError("disk full"))
+        await writer.write(b"abc")
+        await writer.close()
+
+    with pytest.raises(OSError, match="disk full"):
+        asyncio.run(run())
+    executor.shutdown()
+
+
+def test_run_executes_off_loop():
+    executor = IOExecutor(max_workers=1)
+    assert asyncio.run(executor.run(sum, [1, 2, 3])) == 6
+    executor.shutdown()
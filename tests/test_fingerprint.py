@@ -0,0 +1,99 @@
+import asyncio
+import os
+import threading
+
+import pytest
+from mutagen.mp4 import MP4
+
+from soundloader import fingerprint, pipeline
+from soundloader.fingerprint import FingerprintIndex, payload_fingerprint
+from soundloader.library import Library, Track
+from tests.segments import fake_cdn, fragmented_track, make_job, track_segments
+
+
+def test_fingerprint_ignores_tags_and_names(tmp_path):
+    first = tmp_path / "Title.m4a"
+    first.write_bytes(fragmented_track(3, 10))
+    second = tmp_path / "Title (new page name).m4a"
+    second.write_bytes(first.read_bytes())
+    tags = MP4(second)
+    tags["\xa9nam"] = ["Another title"]
+    tags.save()
+    assert first.read_bytes() != second.read_bytes()
+    assert payload_fingerprint(first) == payload_fingerprint(second)
+    (tmp_path / "other.m4a").write_bytes(fragmented_track(4, 10))
+    assert payload_fingerprint(tmp_path / "other.m4a") != payload_fingerprint(first)
+    (tmp_path / "notes.txt").write_bytes(b"not an mp4 at all")
+    assert payload_fingerprint(tmp_path / "notes.txt") is None
+
+    library = Library(Track(str(p), p.name, fingerprint=payload_fingerprint(p)) for p in tmp_path.glob("*.m4a"))
+    assert [sorted(t.filename for t in group) for group in library.duplicates()] == \
+        [["Title (new page name).m4a", "Title.m4a"]]
+
+
+def test_index_only_hashes_new_or_changed_files(tmp_path, monkeypatch):
+    hashed = []
+    real = fingerprint.payload_fingerprint
+    monkeypatch.setattr(fingerprint, "payload_fingerprint", lambda path: hashed.append(path) or real(path))
+    track = tmp_path / "a.m4a"
+    track.write_bytes(fragmented_track(2, 10))
+
+    index = FingerprintIndex(tmp_path / "data" / "fingerprints.json")
+    value = index.update(track)
+    index.link_stream("42", value)
+    index.save()
+
+    reloaded = FingerprintIndex(tmp_path / "data" / "fingerprints.json").load()
+    assert reloaded.cached(track) == value and reloaded.update(track) == value
+    assert reloaded.find_existing("42") == str(track)
+    assert len(hashed) == 1
+    tags = MP4(track)
+    tags["\xa9ART"] = ["Artist"]
+    tags.save()
+    assert reloaded.cached(track) is None
+    assert reloaded.update(track) == value and len(hashed) == 2
+
+    reloaded.retain([])
+    assert reloaded.find_existing("42") is None and reloaded.paths_with(value) == []
+
+
+def test_saves_from_several_threads_keep_every_stream(tmp_path):
+    index = FingerprintIndex(tmp_path / "data" / "fingerprints.json")
+
+    def download(worker):
+        # download_track() and the fingerprint loop save from the I/O pool
+        for i in range(50):
+            index.link_stream(f"{worker}:{i}", f"fp{worker}{i}")
+            index.save()
+
+    threads = [threading.Thread(target=download, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(FingerprintIndex(index.path).load().streams) == 200
+    assert os.listdir(tmp_path / "data") == ["fingerprints.json"]
+
+
+def test_duplicate_download_stops_before_any_segment(tmp_path):
+    requests = []
+
+    async def run():
+        fingerprint.configure(tmp_path / "fingerprints.json")
+        try:
+            async with fake_cdn(track_segments(3), requests):
+                first = make_job(3, "b", stream_id="42")
+                path = await pipeline.download_track(first, tmp_path / "temp", tmp_path)
+                fetched = len(requests)
+                with pytest.raises(pipeline.DuplicateTrackError) as caught:
+                    await pipeline.download_track(make_job(3, "b (renamed)", stream_id="42"), tmp_path / "temp2",
+                                                  tmp_path)
+                assert caught.value.existing == path and len(requests) == fetched
+                again = make_job(3, "b (copy)", stream_id="42")
+                await pipeline.download_track(again, tmp_path / "temp3", tmp_path, allow_duplicate=True)
+                return first, again
+        finally:
+            fingerprint.configure(None)
+
+    first, again = asyncio.run(run())
+    assert first.fingerprint and first.fingerprint == again.fingerprint
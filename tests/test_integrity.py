@@ -0,0 +1,67 @@
+import asyncio
+import hashlib
+import struct
+
+import httpx
+import pytest
+
+from soundloader import net, pipeline
+from soundloader.integrity import INIT, MEDIA, IntegrityError, SegmentVerifier, verify_bytes
+from tests.segments import box, media_segment
+
+
+def feed_in_pieces(verifier, data, size):
+    for i in range(0, len(data), size):
+        verifier.feed(data[i:i + size])
+    return verifier.finish()
+
+
+def test_verifier_walks_boxes_across_chunk_boundaries():
+    segment = media_segment(b"\x01" * 5000)
+    # 3-byte chunks split every box header
+    for size in (3, 7, 4096):
+        assert feed_in_pieces(SegmentVerifier(MEDIA, len(segment)), segment, size) == \
+            hashlib.sha256(segment).hexdigest()
+    # a 64-bit box size
+    large = box(b"ftyp") + struct.pack(">I4sQ", 1, b"moov", 36) + b"\x00" * 20
+    assert verify_bytes(large, INIT)
+
+
+def test_verifier_rejects_incomplete_segments():
+    segment = media_segment(b"\x01" * 5000)
+    with pytest.raises(IntegrityError, match="last box ends"):
+        # cut off without a Content-Length to compare with
+        feed_in_pieces(SegmentVerifier(MEDIA), segment[:-100], 1000)
+    with pytest.raises(IntegrityError, match="of 5024 bytes"):
+        feed_in_pieces(SegmentVerifier(MEDIA, 5024), segment, 1000)
+    with pytest.raises(IntegrityError, match="without moov"):
+        verify_bytes(box(b"ftyp"), INIT)
+    with pytest.raises(IntegrityError, match="bad box"):
+        verify_bytes(b"<html>not found</html>")
+
+
+def test_truncated_segment_is_fetched_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, "SEGMENT_RETRY_DELAY", 0.01)
+    segment = media_segment(b"\x02" * 3000)
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.path)
+        # the first response is cut short (and says so in its Content-Length)
+        return httpx.Response(200, content=segment[:1000] if len(requests) == 1 else segment)
+
+    async def run():
+        net.use_transport(httpx.MockTransport(handler))
+        try:
+            digests = {}
+            path = await pipeline.download_chunk("https://cdn/hls/7.m4s?sig=x", tmp_path, 7, digests)
+            return path, digests
+        finally:
+            await net.aclose_client()
+            net.use_transport(None)
+
+    path, digests = asyncio.run(run())
+    assert len(requests) == 2
+    with open(path, "rb") as f:
+        assert f.read() == segment
+    assert digests == {7: hashlib.sha256(segment).hexdigest()}
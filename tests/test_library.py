@@ -0,0 +1,46 @@
+from pathlib import Path
+
+from soundloader.library import Library, Track
+
+
+def make_track(name, artist=None, duration=None):
+    return Track(f"/docs/{name}", name, title=name.upper(), artist=artist, duration=duration)
+
+
+def test_upsert_replaces_by_path():
+    library = Library()
+    assert library.upsert(make_track("a.m4a", duration=1.0))
+    assert not library.upsert(make_track("a.m4a", duration=2.0))
+    assert len(library) == 1
+    assert library.get("/docs/a.m4a").duration == 2.0
+
+
+def test_remove_keeps_order():
+    library = Library(make_track(n) for n in ["a.m4a", "b.m4a", "c.m4a"])
+    assert library.remove(Path("/docs/b.m4a")).filename == "b.m4a"
+    assert library.remove("/docs/missing.m4a") is None
+    assert [t.filename for t in library] == ["a.m4a", "c.m4a"]
+
+
+def test_filter_and_sort():
+    library = Library([
+        make_track("Zed_Mix.m4a", artist="beta", duration=3.0),
+        make_track("alpha.m4a", artist=None),
+        make_track("other_mix.m4a", artist="Alpha", duration=1.0),
+    ])
+    assert [t.filename for t in library.filter("MIX")] == ["Zed_Mix.m4a", "other_mix.m4a"]
+    assert len(library.filter("")) == 3
+    assert [t.filename for t in library.sorted()] == ["alpha.m4a", "other_mix.m4a", "Zed_Mix.m4a"]
+    assert [t.artist for t in library.sorted('artist')] == [None, "Alpha", "beta"]
+    assert [t.duration for t in library.sorted('duration', reverse=True)] == [3.0, 1.0, None]
+
+
+def test_artists_are_interned():
+    first = make_track("a.m4a", artist="".join(["Same", " Artist"]))
+    second = make_track("b.m4a", artist="".join(["Same ", "Artist"]))
+    assert first.artist is second.artist
+
+
+def test_from_metadata_tolerates_missing_metadata():
+    track = Track.from_metadata(Path("/docs/x.m4a"), None)
+    assert (track.full_path, track.filename, track.title, track.has_art) == ("/docs/x.m4a", "x.m4a", None, False)
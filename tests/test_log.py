@@ -0,0 +1,62 @@
+import io
+import logging
+
+from soundloader import log
+
+
+class Payload:
+    """Counts how often it gets rendered."""
+
+    def __init__(self):
+        self.renders = 0
+
+    def __len__(self):
+        return 10_000
+
+    def __str__(self):
+        self.renders += 1
+        return "x" * 10_000
+
+
+def test_truncated_is_lazy_and_capped():
+    payload = Payload()
+    logger = log.get_logger("test.lazy")
+    logger.setLevel(logging.INFO)
+    logger.debug("html=%s", log.Truncated(payload))
+    assert payload.renders == 0
+
+    text = str(log.Truncated(payload, limit=20))
+    assert payload.renders == 1
+    assert text == repr("x" * 20) + "… (+9980 more)"
+    assert str(log.Truncated("short")) == "'short'"
+    assert str(log.Truncated(b"\x00abc", limit=2)) == "'\\x00a'… (+2 more)"
+
+
+def test_rate_limit_filter_drops_and_reports():
+    now = [0.0]
+    stream = io.StringIO()
+    logger = logging.getLogger("soundloader.test.rate")
+    logger.propagate = False
+    handler = logging.StreamHandler(stream)
+    handler.addFilter(log.RateLimitFilter(burst=2, interval=1.0, clock=lambda: now[0]))
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+
+    for i in range(5):
+        logger.debug("segment %s", i, extra={'rate_key': 'segment'})
+    logger.debug("not limited")
+    now[0] = 1.5
+    logger.debug("segment %s", 5, extra={'rate_key': 'segment'})
+
+    assert stream.getvalue().splitlines() == [
+        "segment 0",
+        "segment 1",
+        "not limited",
+        "segment 5 (3 similar messages suppressed)",
+    ]
+
+
+def test_get_logger_names_children():
+    assert log.get_logger("soundloader.app").name == "soundloader.app"
+    assert log.get_logger("bench").name == "soundloader.bench"
+    assert log.get_logger().name == "soundloader"
@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import httpx
+
+from soundloader.loopback import GrowingFile, LoopbackServer
+
+DATA = bytes(range(256)) * 400  # 100 KiB
+CHUNK = 10 * 1024
+
+
+async def slow_writer(growing, delay=0.02):
+    with open(growing.path, "wb") as f:
+        for offset in range(0, len(DATA), CHUNK):
+            await asyncio.sleep(delay)
+            f.write(DATA[offset:offset + CHUNK])
+            f.flush()
+            growing.commit(offset + len(DATA[offset:offset + CHUNK]))
+    growing.finish()
+
+
+def serve(tmp_path, client_fn):
+    async def run():
+        growing = GrowingFile(tmp_path / "track.m4a.part")
+        open(growing.path, "wb").close()
+        server = await LoopbackServer().start()
+        url = server.publish(growing)
+        writer = asyncio.ensure_future(slow_writer(growing))
+        try:
+            async with httpx.AsyncClient(timeout=5) as client:
+                return await client_fn(client, url, growing)
+        finally:
+            await writer
+            server.unpublish(url)
+            await server.stop()
+    return asyncio.run(run())
+
+
+def test_range_read_waits_for_the_bytes_and_returns_them_exactly(tmp_path):
+    async def client_fn(client, url, growing):
+        start = time.perf_counter()
+        response = await client.get(url, headers={"Range": "bytes=50000-60999"})
+        return response, time.perf_counter() - start, growing.done
+
+    response, elapsed, done = serve(tmp_path, client_fn)
+    assert response.status_code == 206
+    assert response.content == DATA[50000:61000]
+    assert response.headers["content-range"] == "bytes 50000-60999/*"
+    # byte 60999 is in the 6th chunk: it had to wait for the writer
+    assert elapsed >= 0.1 and not done
+
+
+def test_plain_get_streams_the_whole_file_as_it_grows(tmp_path):
+    async def client_fn(client, url, growing):
+        return await client.get(url)
+
+    response = serve(tmp_path, client_fn)
+    assert response.status_code == 200
+    assert response.content == DATA
+
+
+def test_suffix_and_unsatisfiable_ranges_after_the_download(tmp_path):
+    async def client_fn(client, url, growing):
+        tail = await client.get(url, headers={"Range": "bytes=-1000"})
+        beyond = await client.get(url, headers={"Range": f"bytes={len(DATA)}-"})
+        missing = await client.get(url + "x")
+        return tail, beyond, missing
+
+    tail, beyond, missing = serve(tmp_path, client_fn)
+    assert tail.status_code == 206
+    assert tail.content == DATA[-1000:]
+    assert tail.headers["content-range"] == f"bytes {len(DATA) - 1000}-{len(DATA) - 1}/{len(DATA)}"
+    assert beyond.status_code == 416
+    assert beyond.headers["content-range"] == f"bytes */{len(DATA)}"
+    assert missing.status_code == 404
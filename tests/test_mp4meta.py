@@ -0,0 +1,69 @@
+import struct
+
+import pytest
+from mutagen.mp4 import MP4, MP4Cover
+
+from soundloader import mp4meta
+from tests.segments import box, fragmented_track, full_box
+
+# 40 fragments of 43 AAC frames
+DURATION = 40 * 43 * 1024 / 44100
+
+
+def write_track(path, **kwargs):
+    path.write_bytes(fragmented_track(40, 43, **kwargs))
+    return path
+
+
+@pytest.mark.parametrize("per_sample", [False, True])
+def test_reads_mutagen_tags_and_fragment_duration(tmp_path, per_sample):
+    path = write_track(tmp_path / "track.m4a", per_sample=per_sample)
+    tags = MP4(path)
+    tags["\xa9nam"] = ["Tïtle"]
+    tags["\xa9ART"] = ["Artist"]
+    tags["\xa9alb"] = ["Album"]
+    tags["\xa9day"] = ["2024"]
+    tags["trkn"] = [(3, 12)]
+    tags["disk"] = [(1, 2)]
+    tags["covr"] = [MP4Cover(b"\xff\xd8jpeg", MP4Cover.FORMAT_JPEG)]
+    tags.save()
+
+    metadata = mp4meta.read_metadata(path)
+    assert metadata["title"] == "Tïtle" and metadata["artist"] == "Artist" and metadata["album"] == "Album"
+    assert metadata["year"] == "2024" and metadata["track"] == 3 and metadata["disc"] == 1
+    assert metadata["duration"] == pytest.approx(DURATION)
+    assert metadata["has_art"] and metadata["image"] is None
+    assert mp4meta.read_metadata(path, load_image=True)["image"] == b"\xff\xd8jpeg"
+
+
+def test_header_durations_win_over_the_fragments(tmp_path):
+    data = fragmented_track(2, 10)
+    # a top-level sidx of two 5 s subsegments, before the first moof
+    sidx = full_box(b"sidx", 0, 0, struct.pack(">IIIIHH", 1, 1000, 0, 0, 0, 2) + struct.pack(">III", 100, 5000, 0) * 2)
+    moof = data.index(b"moof") - 4
+    path = tmp_path / "sidx.m4a"
+    path.write_bytes(data[:moof] + sidx + data[moof:])
+    assert mp4meta.read_metadata(path)["duration"] == 10.0
+
+
+def test_every_top_level_sidx_adds_up(tmp_path):
+    data = fragmented_track(2, 10)
+    # segments concatenated as they came: a 5 s sidx before each moof
+    sidx = full_box(b"sidx", 0, 0, struct.pack(">IIIIHH", 1, 1000, 0, 0, 0, 1) + struct.pack(">III", 100, 5000, 0))
+    first = data.index(b"moof") - 4
+    second = data.index(b"moof", first + 8) - 4
+    data = data[:first] + sidx + data[first:second] + sidx + data[second:]
+    path = tmp_path / "segments.m4a"
+    path.write_bytes(data)
+    assert mp4meta.read_metadata(path)["duration"] == 10.0
+
+
+def test_anything_else_is_left_to_tinytag(tmp_path):
+    (tmp_path / "song.mp3").write_bytes(b"ID3\x03\x00" + b"\x00" * 100)
+    assert mp4meta.read_metadata(tmp_path / "song.mp3") is None
+    # cut off in the middle of a box
+    data = fragmented_track(2, 10)
+    (tmp_path / "short.m4a").write_bytes(data[:-10])
+    assert mp4meta.read_metadata(tmp_path / "short.m4a") is None
+    (tmp_path / "no_moov.m4a").write_bytes(box(b"ftyp", b"M4A \x00\x00\x00\x00") + box(b"mdat"))
+    assert mp4meta.read_metadata(tmp_path / "no_moov.m4a") is None
@@ -0,0 +1,106 @@
+import asyncio
+import os
+
+from soundloader import pipeline
+from soundloader.loopback import GrowingFile
+
+PAGE = """<html><head>
+<meta property="twitter:player" content="https://w.soundcloud.com/player/?url=tracks%2F42">
+<meta property="twitter:title" content="My Track: Remix!">
+</head><body>
+<img src="https://i1.sndcdn.com/artworks-42-large.jpg">
+<h1><a href="/a/t">My Track</a> by <a href="/a">Some Artist</a></h1><meta itemprop="x">
+<script>{"url": "https://api-v2.soundcloud.com/media/soundcloud:tracks:42/stream/hls"}</script>
+</body></html>"""
+
+
+def test_extracts_player_stream_and_info():
+    assert pipeline.extract_player_url(PAGE) == "https://w.soundcloud.com/player/?url=tracks%2F42"
+    assert pipeline.extract_stream_url(PAGE) == pipeline.STREAM_URL_BEGIN + "42" + pipeline.STREAM_URL_END
+    filename, thumbnail_url, title, artist = pipeline.extract_info(PAGE)
+    assert filename == "My Track: Remix!"
+    assert thumbnail_url == "https://i1.sndcdn.com/artworks-42-large.jpg"
+    assert "My Track" in title and "Some Artist" in artist
+    assert pipeline.extract_stream_url("<html></html>") == ""
+
+
+def test_thumbnail_target_names_the_artwork_after_the_track():
+    assert pipeline.thumbnail_target("https://x/a.jpg", "t") == ("https://x/a.jpg", "t.jpg")
+    assert pipeline.thumbnail_target("https://x/vi_webp/a.webp", "t") == ("https://x/vi/a.jpg", "t.jpg")
+    assert pipeline.thumbnail_target("https://x/a.gif", "t") == ("https://x/a.gif", "t.gif")
+
+
+def test_parse_m3u_puts_init_segment_first(tmp_path):
+    playlist = tmp_path / "list.m3u8"
+    playlist.write_text('#EXTM3U\n#EXT-X-MAP:URI="https://cdn/init.mp4"\n'
+                        '#EXTINF:10.0,\nhttps://cdn/1.m4s\n#EXTINF:10.0,\nhttps://cdn/2.m4s\n#EXT-X-ENDLIST\n')
+    urls = pipeline.parse_m3u_file(str(playlist))
+    assert urls == ["https://cdn/init.mp4", "https://cdn/1.m4s", "https://cdn/2.m4s"]
+    assert [pipeline.chunk_filename(i) for i in range(3)] == ["init.mp4", "chunk1.m4s", "chunk2.m4s"]
+
+
+def test_extract_client_id():
+    assert pipeline.extract_client_id('x={url:"https://api/?client_id=abc123",v:1}') == "abc123"
+    assert pipeline.extract_client_id("no id here") == ""
+
+
+def test_segment_assembler_appends_in_playlist_order(tmp_path):
+    growing = GrowingFile(tmp_path / "out.part")
+    segments = {}
+    for i in range(3):
+        segments[i] = tmp_path / f"s{i}"
+        segments[i].write_bytes(bytes([i]) * 10)
+
+    async def run():
+        assembler = pipeline.SegmentAssembler(growing.path, 3, growing)
+        await assembler.open()
+        await assembler.add(2, str(segments[2]))
+        await assembler.add(1, str(segments[1]))
+        # nothing can be appended before segment 0
+        assert growing.committed == 0
+        await assembler.add(0, str(segments[0]))
+        return assembler
+
+    assembler = asyncio.run(run())
+    assert assembler.complete and growing.committed == 30
+    assert (tmp_path / "out.part").read_bytes() == b"\x00" * 10 + b"\x01" * 10 + b"\x02" * 10
+
+
+def test_segment_assembler_preallocates_and_trims_to_what_was_written(tmp_path):
+    growing = GrowingFile(tmp_path / "out.part")
+    for i in range(2):
+        (tmp_path / f"s{i}").write_bytes(bytes([i + 1]) * 100)
+
+    async def run():
+        assembler = pipeline.SegmentAssembler(growing.path, 2, growing, expected_size=4096)
+        await assembler.open()
+        size_while_open = os.path.getsize(growing.path)
+        for i in range(2):
+            await assembler.add(i, str(tmp_path / f"s{i}"))
+        await assembler.finish()
+        return assembler, size_while_open
+
+    assembler, size_while_open = asyncio.run(run())
+    if assembler.preallocated:
+        assert size_while_open == 4096
+    assert (tmp_path / "out.part").read_bytes() == b"\x01" * 100 + b"\x02" * 100
+
+
+def test_batch_assembler_hands_all_segments_to_the_backend(tmp_path):
+    paths = []
+    for i in range(3):
+        paths.append(tmp_path / f"s{i}")
+        paths[i].write_bytes(bytes([i]) * 10)
+
+    async def run(segment_paths):
+        growing = GrowingFile(tmp_path / "out.part")
+        assembler = pipeline.BatchAssembler(growing.path, 3, growing)
+        for i, path in enumerate(segment_paths):
+            await assembler.add(i, path)
+        await assembler.finish()
+        return assembler, growing
+
+    assembler, growing = asyncio.run(run([str(p) for p in paths]))
+    assert assembler.complete and growing.committed == 30
+    assembler, growing = asyncio.run(run([str(paths[0]), "", str(paths[2])]))
+    assert not assembler.complete and assembler.failed_index == 1
@@ -0,0 +1,66 @@
+import asyncio
+import shutil
+
+import httpx
+import pytest
+
+from soundloader import net, preflight
+
+PLAYLIST = ('#EXTM3U\n#EXT-X-MAP:URI="https://cdn/init.mp4"\n'
+            + "".join(f"#EXTINF:10.0,\nhttps://cdn/{i}.m4s\n" for i in range(1, 10))
+            + "#EXTINF:4.0,\nhttps://cdn/10.m4s\n#EXT-X-ENDLIST\n")
+URLS = ["https://cdn/init.mp4"] + [f"https://cdn/{i}.m4s" for i in range(1, 11)]
+
+
+def test_estimates_from_byte_ranges_and_durations():
+    ranged = ('#EXTM3U\n#EXT-X-MAP:URI="https://cdn/a.mp4",BYTERANGE="600@0"\n'
+              '#EXTINF:10,\n#EXT-X-BYTERANGE:1000@600\nhttps://cdn/a.mp4\n'
+              '#EXTINF:5,\n#EXT-X-BYTERANGE:500\nhttps://cdn/a.mp4\n')
+    exact = asyncio.run(preflight.estimate_size(["https://cdn/a.mp4"] * 3, ranged.splitlines()))
+    assert exact.exact and exact.total_bytes == 2100 and exact.duration == 15
+
+    rough = asyncio.run(preflight.estimate_size(URLS, PLAYLIST.splitlines()))
+    assert rough.source == "duration" and rough.total_bytes == 94 * preflight.DEFAULT_BYTES_PER_SECOND
+
+
+def test_probes_segment_sizes_with_a_range_fallback():
+    requests = []
+
+    def handler(request):
+        requests.append((request.method, request.url.path))
+        size = 800 if request.url.path == "/init.mp4" else 40_000
+        if request.url.path == "/10.m4s":
+            size = 16_000
+        if request.method == "HEAD":
+            # signed urls that only allow GET
+            return httpx.Response(403)
+        assert request.headers["range"] == "bytes=0-0"
+        return httpx.Response(206, headers={"content-range": f"bytes 0-0/{size}"}, content=b"x")
+
+    async def run():
+        net.use_transport(httpx.MockTransport(handler))
+        try:
+            return await preflight.estimate_size(URLS, PLAYLIST.splitlines(), probe=True)
+        finally:
+            await net.aclose_client()
+            net.use_transport(None)
+
+    estimate = asyncio.run(run())
+    # init, first, middle and last segment; 40 kB per 10 s, 16 kB for the last 4 s
+    assert sorted({path for _, path in requests}) == ["/1.m4s", "/10.m4s", "/5.m4s", "/init.mp4"]
+    assert estimate.source == "probe"
+    assert abs(estimate.total_bytes - (800 + 9 * 40_000 + 16_000)) < 10_000
+
+
+def test_space_budget_counts_running_reservations(tmp_path):
+    budget = preflight.SpaceBudget(headroom=0)
+    free = shutil.disk_usage(tmp_path).free
+    first = budget.reserve([(tmp_path / "a.part", free // 2), (tmp_path / "not" / "yet", 1)])
+    assert budget.fits([(tmp_path, free // 4)]) and not budget.fits([(tmp_path, free // 4)], factor=4)
+    with pytest.raises(preflight.InsufficientSpaceError) as error:
+        # same volume: adds up with the first download's reservation
+        budget.reserve([(tmp_path, free // 2 + 4096)])
+    assert error.value.needed == free // 2 + 4096
+    first.release()
+    budget.reserve([(tmp_path, free // 2 + 4096)]).release()
+    assert budget.reserved == {}
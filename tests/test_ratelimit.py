@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+import httpx
+
+from soundloader import ratelimit
+from soundloader.limited_transport import LimitedTransport
+
+
+def test_bucket_holds_its_rate_after_the_burst():
+    async def run():
+        bucket = ratelimit.TokenBucket(rate=100, burst=5)
+        start = time.monotonic()
+        for _ in range(25):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    # 5 from the burst, 20 more at 100/s
+    elapsed = asyncio.run(run())
+    assert 0.15 < elapsed < 0.5
+
+
+def test_waiting_owners_are_served_round_robin():
+    order = []
+
+    async def job(bucket, owner):
+        await bucket.acquire(1, owner)
+        order.append(owner)
+
+    async def run():
+        bucket = ratelimit.TokenBucket(rate=200, burst=1)
+        await bucket.acquire()
+        # 'big' queues 10 requests before 'small' asks for its 3
+        big = [asyncio.ensure_future(job(bucket, "big")) for _ in range(10)]
+        await asyncio.sleep(0)
+        small = [asyncio.ensure_future(job(bucket, "small")) for _ in range(3)]
+        await asyncio.gather(*big, *small)
+
+    asyncio.run(run())
+    # small doesn't wait behind all of big
+    assert order.index("small") <= 1
+    assert order[:6].count("small") == 3
+
+
+def test_configure_changes_the_rate_of_waiting_requests():
+    async def run():
+        bucket = ratelimit.TokenBucket(rate=1, burst=1)
+        await bucket.acquire()
+        waiter = asyncio.ensure_future(bucket.acquire())
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        start = time.monotonic()
+        bucket.set_rate(None)
+        await waiter
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) < 0.1
+
+
+def test_429_blocks_the_host_and_retries():
+    seen = []
+
+    def handler(request):
+        seen.append(time.monotonic())
+        if len(seen) <= 2:
+            return httpx.Response(429, headers={"retry-after": "0.1"})
+        return httpx.Response(200, content=b"ok" * 10)
+
+    async def run():
+        # a host without a request limit of its own
+        limiter = ratelimit.Limiter(host_requests_per_second=None)
+        transport = LimitedTransport(httpx.MockTransport(handler), limiter)
+        async with httpx.AsyncClient(transport=transport) as client:
+            response = await client.get("https://cdn.example/1.m4s")
+        return response, limiter
+
+    response, limiter = asyncio.run(run())
+    assert response.status_code == 200 and response.content == b"ok" * 10
+    assert len(seen) == 3 and limiter.throttle_count == 2
+    # every retry waited for the Retry-After
+    assert seen[1] - seen[0] >= 0.09 and seen[2] - seen[1] >= 0.09
+    # and the host is held to a lower request rate for a while
+    assert limiter.hosts["cdn.example"].requests.rate == ratelimit.THROTTLED_REQUESTS_PER_SECOND / 2
+
+
+def test_settings_file_configures_the_limiter_when_it_changes(tmp_path):
+    limiter = ratelimit.Limiter()
+    assert limiter.host_requests_per_second == ratelimit.DEFAULT_HOST_REQUESTS_PER_SECOND
+    settings = ratelimit.SettingsFile(tmp_path / "network.json", limiter)
+    assert settings.reload() and not settings.reload()
+
+    (tmp_path / "network.json").write_text('{"host_requests_per_second": 5, "bytes_per_second": null, '
+                                           '"host_request_burst": "lots"}')
+    assert settings.reload()
+    assert limiter.host_requests_per_second == 5 and limiter.bytes_per_second is None
+    assert limiter.host_request_burst == ratelimit.DEFAULT_HOST_REQUEST_BURST
+
+    settings.save(host_requests_per_second=None)
+    assert limiter.host_requests_per_second is None
+    (tmp_path / "network.json").unlink()
+    assert settings.reload() and limiter.host_requests_per_second == ratelimit.DEFAULT_HOST_REQUESTS_PER_SECOND
@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import httpx
+
+from soundloader import net, scheduler
+from soundloader.scheduler import BULK, HEAD, INTERACTIVE, PriorityScheduler
+
+
+def test_most_urgent_waiter_gets_the_next_slot():
+    order = []
+
+    async def request(slots, name, priority):
+        await slots.acquire(priority)
+        order.append(name)
+
+    async def run():
+        slots = PriorityScheduler(slots=2, reserved=1)
+        await slots.acquire(BULK)
+        # the last slot is kept for interactive requests
+        waiting = [asyncio.ensure_future(request(slots, f"bulk{i}", BULK)) for i in range(2)]
+        waiting.append(asyncio.ensure_future(request(slots, "head", HEAD)))
+        await asyncio.sleep(0)
+        assert order == [] and slots.waiting == 3
+        await request(slots, "interactive", INTERACTIVE)
+        slots.release()
+        slots.release()
+        await asyncio.sleep(0)
+        slots.release()
+        await asyncio.sleep(0)
+        return slots.active, slots.waiting
+
+    assert asyncio.run(run()) == (1, 1)
+    assert order == ["interactive", "head", "bulk0"]
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def run():
+        slots = PriorityScheduler(slots=1, reserved=0)
+        await slots.acquire(BULK)
+        cancelled = asyncio.ensure_future(slots.acquire(INTERACTIVE))
+        waiter = asyncio.ensure_future(slots.acquire(BULK))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        slots.release()
+        await waiter
+        return slots.active
+
+    assert asyncio.run(run()) == 1
+
+
+def test_resolve_is_not_queued_behind_segments(monkeypatch):
+    monkeypatch.setattr(scheduler, "_scheduler", PriorityScheduler(slots=3, reserved=1))
+
+    async def handler(request):
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, content=b"x" * 100)
+
+    async def segment(i):
+        with scheduler.priority_scope(BULK):
+            await net.fetch_bytes(f"https://cdn/{i}.m4s")
+        return time.monotonic()
+
+    async def run():
+        net.use_transport(httpx.MockTransport(handler))
+        try:
+            segments = asyncio.ensure_future(asyncio.gather(*(segment(i) for i in range(20))))
+            await asyncio.sleep(0.01)
+            await net.fetch_text("https://soundcloud.com/artist/track")
+            page_done = time.monotonic()
+            return page_done, await segments
+        finally:
+            await net.aclose_client()
+            net.use_transport(None)
+
+    page_done, segments_done = asyncio.run(run())
+    # 20 segments over 2 slots take 0.5 s; the page only waited for its own request
+    assert page_done < min(segments_done) + 0.06
+    assert sum(1 for t in segments_done if t < page_done) <= 2
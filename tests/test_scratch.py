@@ -0,0 +1,93 @@
+import asyncio
+import os
+import time
+
+from soundloader import loopback, scratch
+from soundloader.cache import MediaCache
+from soundloader.scratch import ScratchCollector
+
+
+def test_discard_frees_the_path_at_once_and_deletes_in_the_background(tmp_path):
+    job_dir = tmp_path / "job1"
+    (job_dir / "sub").mkdir(parents=True)
+    (job_dir / "chunk1.m4s").write_bytes(b"x" * 100)
+    (job_dir / "sub" / "b.jpg").write_bytes(b"y" * 50)
+    collector = ScratchCollector()
+    collector.claim(job_dir)
+
+    async def run():
+        await collector.discard(job_dir)
+        # renamed aside: the job's path can be reused right away
+        assert not job_dir.exists() and str(job_dir) not in collector.live
+        await collector.discard(tmp_path / "missing")
+        await collector.drain()
+
+    asyncio.run(run())
+    assert os.listdir(tmp_path) == []
+    assert (collector.deleted, collector.freed_bytes) == (1, 150)
+
+
+def test_sweep_deletes_trash_and_old_unclaimed_leftovers(tmp_path):
+    old = time.time() - 2 * scratch.DEFAULT_ORPHAN_AGE
+    for name in ("crashed", "claimed"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "chunk1.m4s").write_bytes(b"x")
+        os.utime(tmp_path / name, (old, old))
+    (tmp_path / "crashed.m4a.part").write_bytes(b"p")
+    os.utime(tmp_path / "crashed.m4a.part", (old, old))
+    (tmp_path / "fresh.m4a.part").write_bytes(b"p")
+    (tmp_path / (scratch.TRASH_PREFIX + "abc")).mkdir()
+    collector = ScratchCollector()
+    collector.claim(tmp_path / "claimed")
+
+    assert asyncio.run(collector.sweep(tmp_path)) == 3
+    assert sorted(os.listdir(tmp_path)) == ["claimed", "fresh.m4a.part"]
+    assert asyncio.run(collector.sweep(tmp_path / "nothing")) == 0
+
+
+def test_prune_keeps_the_newest_entries_younger_than_max_age(tmp_path):
+    now = time.time()
+    for i in range(5):
+        path = tmp_path / f"job{i}.json"
+        path.write_text("{}")
+        # job4 is the newest; job0 is a month old
+        os.utime(path, (now - (4 - i) * 60 - (30 * 86400 if i == 0 else 0),) * 2)
+    collector = ScratchCollector()
+    assert asyncio.run(collector.prune(tmp_path, max_age=86400)) == 1
+    assert asyncio.run(collector.prune(tmp_path, keep=2)) == 2
+    assert sorted(os.listdir(tmp_path)) == ["job3.json", "job4.json"]
+
+
+def test_part_file_served_past_its_download_is_released_when_unpublished(tmp_path, monkeypatch):
+    collector = ScratchCollector()
+    monkeypatch.setattr(scratch, "_collector", collector)
+    part = tmp_path / "job.m4a.part"
+    part.write_bytes(b"audio")
+    server = loopback.LoopbackServer()
+
+    async def run():
+        growing = loopback.GrowingFile(part)
+        collector.claim(growing.path)
+        url = server.publish(growing)
+        # the download copied it out and left it to the server
+        growing.finish()
+        growing.delete_when_unpublished = True
+        server.unpublish(url)
+
+    asyncio.run(run())
+    assert collector.live == set() and not part.exists()
+
+
+def test_cache_opening_over_a_smaller_budget_evicts(tmp_path):
+    async def fill():
+        media = MediaCache(tmp_path / "media")
+        for key in "abc":
+            await media.put_bytes(key, key.encode() * 1000)
+        await media.get_bytes("a")
+        await media.flush()
+
+    asyncio.run(fill())
+    media = MediaCache(tmp_path / "media", max_bytes=2000)
+    asyncio.run(media.open())
+    assert set(media.entries) == {"a", "c"}
+    assert set(MediaCache(tmp_path / "media")._load()) == {"a", "c"}
@@ -0,0 +1,56 @@
+import asyncio
+import hashlib
+
+import pytest
+
+from soundloader import pipeline, segstore
+from soundloader.segstore import MemoryBudget, SegmentStore
+from tests.segments import assembled, fake_cdn, make_job, track_segments
+
+
+def test_store_spills_past_the_job_and_global_limits():
+    budget = MemoryBudget(limit=250)
+    first, second = SegmentStore(budget, limit=200), SegmentStore(budget, limit=200)
+    a = first.allocate(100)
+    a.write(b"x" * 60)
+    a.write(b"y" * 40)
+    assert bytes(a.view) == b"x" * 60 + b"y" * 40
+    assert first.allocate(150) is None  # over the job's limit
+    b = second.adopt(b"z" * 120)
+    assert second.allocate(100) is None  # over the global budget
+    assert (budget.used, first.spilled, second.spilled) == (220, 1, 1)
+    a.release()
+    a.release()
+    assert budget.used == 120 and first.used == 0
+    assert second.allocate(0) is None  # no Content-Length: nothing to size the buffer by
+    second.close()
+    assert budget.used == 0 and b.store is None and second.allocate(10) is None
+
+
+@pytest.mark.parametrize("job_limit", [segstore.DEFAULT_JOB_LIMIT, 2500])
+def test_segments_go_from_memory_to_the_part_file(tmp_path, monkeypatch, job_limit):
+    monkeypatch.setattr(segstore, "_job_limit", job_limit)
+    monkeypatch.setattr(segstore, "_budget", MemoryBudget())
+    copied_files = []
+    write_file_at = pipeline.write_file_at
+    monkeypatch.setattr(pipeline, "write_file_at",
+                        lambda output, offset, path, digest=None: copied_files.append(path)
+                        or write_file_at(output, offset, path, digest))
+    segments = track_segments(5)
+    job = make_job(5)
+
+    async def run():
+        async with fake_cdn(segments):
+            return await pipeline.download_track(job, tmp_path / "temp", tmp_path)
+
+    asyncio.run(run())
+    expected = assembled(segments, 5)
+    assert job.bytes_downloaded == len(expected)
+    assert job.sha256 == hashlib.sha256(expected).hexdigest()
+    assert segstore.get_budget().used == 0
+    if job_limit == segstore.DEFAULT_JOB_LIMIT:
+        # nothing went through the scratch directory
+        assert copied_files == []
+    else:
+        # only two segments fit at once; the rest spilled to their files
+        assert 0 < len(copied_files) < 6
@@ -0,0 +1,128 @@
+import asyncio
+
+import httpx
+import pytest
+
+from soundloader import net, pipeline
+from soundloader.singleflight import Group
+from tests.segments import media_segment
+
+
+def test_concurrent_calls_share_one_result_and_one_error():
+    calls = []
+
+    async def fetch(key, error=None):
+        calls.append(key)
+        await asyncio.sleep(0.02)
+        if error:
+            raise error
+        return key.upper()
+
+    async def run():
+        group = Group("t")
+        results = await asyncio.gather(*(group.do("a", fetch, "a") for _ in range(5)), group.do("b", fetch, "b"))
+        failing = [group.do("c", fetch, "c", OSError("down")) for _ in range(3)]
+        errors = await asyncio.gather(*failing, return_exceptions=True)
+        # a finished flight isn't reused
+        again = await group.do("a", fetch, "a")
+        return results, errors, again, group
+
+    results, errors, again, group = asyncio.run(run())
+    assert results == ["A"] * 5 + ["B"]
+    assert all(isinstance(e, OSError) for e in errors)
+    assert again == "A"
+    assert calls == ["a", "b", "c", "a"]
+    assert group.coalesced == 6
+
+
+def test_shared_call_survives_one_cancelled_caller_but_not_all():
+    started = []
+
+    async def slow():
+        started.append(True)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def run():
+        group = Group("t")
+        first = asyncio.ensure_future(group.do("k", slow))
+        second = asyncio.ensure_future(group.do("k", slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        result = await second
+
+        lone = asyncio.ensure_future(group.do("j", slow))
+        await asyncio.sleep(0.01)
+        flight = group.get("j")
+        lone.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await lone
+        await asyncio.sleep(0)
+        return result, flight.task.cancelled()
+
+    assert asyncio.run(run()) == ("done", True)
+
+
+def test_same_segment_for_two_jobs_is_fetched_once(tmp_path):
+    requests = []
+
+    async def handler(request):
+        requests.append(str(request.url))
+        await asyncio.sleep(0.02)
+        return httpx.Response(200, content=media_segment(b"segment" * 100))
+
+    async def run():
+        net.use_transport(httpx.MockTransport(handler))
+        try:
+            (tmp_path / "a").mkdir()
+            (tmp_path / "b").mkdir()
+            return await asyncio.gather(
+                pipeline.download_chunk("https://cdn/hls/3.m4s?sig=one", tmp_path / "a", 3),
+                pipeline.download_chunk("https://cdn/hls/3.m4s?sig=two", tmp_path / "b", 3))
+        finally:
+            await net.aclose_client()
+            net.use_transport(None)
+
+    paths = asyncio.run(run())
+    assert len(requests) == 1
+    for path in paths:
+        with open(path, "rb") as f:
+            assert f.read() == media_segment(b"segment" * 100)
+
+
+def test_failed_copy_for_a_follower_leaves_the_leader_alone(tmp_path):
+    requests = []
+
+    async def handler(request):
+        requests.append(str(request.url))
+        if len(requests) == 1:
+            # the follower's job is dropped and its temp dir moved aside meanwhile
+            (tmp_path / "b").rename(tmp_path / ".trash-b")
+        await asyncio.sleep(0.02)
+        return httpx.Response(200, content=media_segment(b"segment" * 100))
+
+    async def run():
+        net.use_transport(httpx.MockTransport(handler))
+        try:
+            for name in "abc":
+                (tmp_path / name).mkdir()
+            leader = asyncio.ensure_future(pipeline.download_chunk("https://cdn/hls/3.m4s?sig=one", tmp_path / "a", 3))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(pipeline.download_chunk("https://cdn/hls/3.m4s?sig=two", tmp_path / "b", 3))
+            cancelled = asyncio.ensure_future(pipeline.download_chunk("https://cdn/hls/3.m4s?sig=3", tmp_path / "c", 3))
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            await asyncio.sleep(0)
+            flight = pipeline.segment_flights.get("/hls/3.m4s")
+            assert flight.followers == [tmp_path / "b" / "chunk3.m4s"]
+            return await asyncio.gather(leader, follower)
+        finally:
+            await net.aclose_client()
+            net.use_transport(None)
+
+    leader_path, follower_path = asyncio.run(run())
+    with open(leader_path, "rb") as f:
+        assert f.read() == media_segment(b"segment" * 100)
+    # the follower found its copy missing and tried on its own (its dir is gone, so that fails too)
+    assert follower_path == "" and len(requests) == 2
+    assert not (tmp_path / "c" / "chunk3.m4s").exists()
@@ -0,0 +1,71 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+from soundloader import pipeline
+from soundloader.speculate import Speculator
+from tests.segments import assembled, fake_cdn, make_job, track_segments
+
+
+def fake_resolver(calls, delay=0.01, error=None):
+    async def resolve(url):
+        calls.append(url)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return pipeline.TrackJob(url)
+    return resolve
+
+
+def test_take_returns_the_speculated_job_and_changes_cancel_it():
+    calls = []
+    speculator = Speculator(resolve=fake_resolver(calls, delay=0.05))
+
+    async def run():
+        speculator.start("https://soundcloud.com/a/one")
+        await asyncio.sleep(0)
+        speculator.start("https://soundcloud.com/a/one")
+        first = speculator.task
+        speculator.start("https://soundcloud.com/a/two")
+        await asyncio.sleep(0)
+        assert first.cancelled()
+        assert await speculator.take("https://soundcloud.com/a/one") is None
+        return await speculator.take("https://soundcloud.com/a/two")
+
+    job = asyncio.run(run())
+    assert job.input_url == "https://soundcloud.com/a/two"
+    assert calls == ["https://soundcloud.com/a/one", "https://soundcloud.com/a/two"]
+
+
+def test_bad_page_surfaces_but_other_failures_fall_back():
+    async def run(error):
+        speculator = Speculator(resolve=fake_resolver([], error=error))
+        speculator.start("https://soundcloud.com/a/b")
+        return await speculator.take("https://soundcloud.com/a/b")
+
+    with pytest.raises(pipeline.PipelineError):
+        asyncio.run(run(pipeline.PipelineError("missing stream id")))
+    assert asyncio.run(run(OSError("network down"))) is None
+
+
+def test_prefetched_segments_are_used_by_the_download(tmp_path):
+    requests = []
+    segments = track_segments(5)
+    job = make_job(5)
+
+    async def run():
+        async with fake_cdn(segments, requests):
+            speculator = Speculator(prefetch_segments=3)
+            speculator.prefetch_segments(job)
+            await asyncio.gather(*job.segment_prefetch.values())
+            return await pipeline.download_track(job, tmp_path / "temp", tmp_path)
+
+    path = asyncio.run(run())
+    assert sorted(requests) == sorted(segments)
+    expected = assembled(segments, 5)
+    # the saved file is tagged now that the segments are real fMP4, so compare what was assembled
+    assert job.sha256 == hashlib.sha256(expected).hexdigest()
+    assert os.path.getsize(path) > len(expected)
+    assert not (tmp_path / "temp").exists()
@@ -0,0 +1,34 @@
+import asyncio
+
+from soundloader.timing import StageTimer
+
+
+def test_stages_and_marks_are_recorded():
+    timer = StageTimer("startup")
+
+    async def background():
+        with timer.stage("scan"):
+            await asyncio.sleep(0.01)
+
+    with timer.stage("ui_shell"):
+        pass
+    timer.mark("interactive")
+    asyncio.run(background())
+
+    assert [s[0] for s in timer.stages] == ["ui_shell", "interactive", "scan"]
+    start, duration = timer.get("scan")
+    assert duration >= 0.01
+    assert start >= timer.get("interactive")[0]
+    assert timer.get("missing") is None
+    report = timer.report()
+    assert report.splitlines()[-1].startswith("scan")
+
+
+def test_stage_is_recorded_when_body_raises():
+    timer = StageTimer("startup")
+    try:
+        with timer.stage("fonts"):
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+    assert timer.get("fonts") is not None
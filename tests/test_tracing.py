@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+import pytest
+
+from soundloader import tracing
+
+
+def test_spans_follow_the_job_into_tasks_and_export(tmp_path):
+    @tracing.traced()
+    async def fetch_segment(index):
+        await asyncio.sleep(0.001)
+        tracing.annotate(index=index, bytes=100)
+
+    async def job():
+        tracer = tracing.start_job("job1", "https://example.test/track")
+        with tracing.span("download_segments", segments=3):
+            await asyncio.gather(*(fetch_segment(i) for i in range(3)))
+        return tracer
+
+    tracer = asyncio.run(job())
+    assert [s.name for s in tracer.spans] == ["download_segments"] + ["fetch_segment"] * 3
+    assert sorted(s.args["index"] for s in tracer.spans[1:]) == [0, 1, 2]
+    # concurrent segments land on their own lanes
+    assert len({s.lane for s in tracer.spans[1:]}) == 3
+
+    path = tracer.export(tmp_path / "job1.json")
+    events = json.loads(open(path).read())["traceEvents"]
+    complete = [e for e in events if e["ph"] == "X"]
+    assert len(complete) == 4
+    assert all(e["dur"] >= 0 and "ts" in e for e in complete)
+
+
+def test_span_outside_a_job_is_a_no_op():
+    async def run():
+        with tracing.span("untraced") as s:
+            s.add("retries")
+            tracing.annotate(bytes=1)
+        return tracing.current_tracer()
+
+    # asyncio.run uses a fresh context, so no tracer leaks in from other tests
+    assert asyncio.run(run()) is None
+
+
+def test_errors_are_recorded_on_the_span():
+    tracer = tracing.Tracer("job2")
+    with pytest.raises(ValueError):
+        with tracer.span("get_html_from"):
+            raise ValueError("bad page")
+    assert tracer.spans[0].args["error"] == "ValueError: bad page"
+    assert tracer.spans[0].end_ns is not None
+
+
+def test_aggregator_histograms():
+    aggregate = tracing.TraceAggregator()
+    for job in range(100):
+        tracer = tracing.Tracer(job)
+        with tracer.span("download_chunk", bytes=10, retries=job % 2):
+            pass
+        tracer.spans[0].end_ns = tracer.spans[0].start_ns + (job + 1) * 1_000_000
+        aggregate.add(tracer)
+
+    summary = aggregate.to_dict()["spans"]["download_chunk"]
+    assert summary["count"] == 100
+    assert summary["bytes"] == 1000
+    assert summary["retries"] == 50
+    # log buckets are ~9% wide
+    assert summary["p50_ms"] == pytest.approx(50, rel=0.1)
+    assert summary["p99_ms"] == pytest.approx(99, rel=0.1)
+    assert "download_chunk" in aggregate.report()
@@ -0,0 +1,81 @@
+import asyncio
+import os
+
+import pytest
+
+from soundloader import watcher
+
+
+def make_watcher(root, events, use_inotify):
+    loop = asyncio.get_running_loop()
+    w = watcher.StorageWatcher(root, lambda kind, path: events.append((kind, path.name)),
+                               interval=3600, use_inotify=use_inotify, loop=loop)
+    w.start()
+    return w
+
+
+def bump_mtime(path):
+    # some filesystems have coarse mtimes; make sure the poller sees a change
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10_000_000))
+
+
+def test_poll_reports_add_modify_remove(tmp_path):
+    async def run():
+        (tmp_path / "old.m4a").write_bytes(b"a")
+        events = []
+        w = make_watcher(tmp_path, events, use_inotify=False)
+        assert w.backend == "poll"
+
+        (tmp_path / "new.m4a").write_bytes(b"b")
+        (tmp_path / "ignored.txt").write_bytes(b"c")
+        (tmp_path / "sub").mkdir()
+        (tmp_path / "sub" / "nested.m4a").write_bytes(b"d")
+        bump_mtime(tmp_path)
+        w.poll()
+        assert sorted(events) == [("added", "nested.m4a"), ("added", "new.m4a")]
+
+        events.clear()
+        (tmp_path / "old.m4a").unlink()
+        (tmp_path / "new.m4a").write_bytes(b"bigger")
+        bump_mtime(tmp_path)
+        w.poll()
+        assert sorted(events) == [("modified", "new.m4a"), ("removed", "old.m4a")]
+
+        events.clear()
+        (tmp_path / "sub" / "nested.m4a").unlink()
+        (tmp_path / "sub").rmdir()
+        bump_mtime(tmp_path)
+        w.poll()
+        assert events == [("removed", "nested.m4a")]
+        w.stop()
+
+    asyncio.run(run())
+
+
+@pytest.mark.skipif(watcher._load_inotify() is None, reason="inotify not available")
+def test_inotify_reports_add_modify_remove(tmp_path):
+    async def settle():
+        for _ in range(20):
+            await asyncio.sleep(0.01)
+
+    async def run():
+        events = []
+        w = make_watcher(tmp_path, events, use_inotify=True)
+        assert w.backend == "inotify"
+
+        (tmp_path / "a.m4a").write_bytes(b"a")
+        (tmp_path / "sub").mkdir()
+        await settle()
+        (tmp_path / "sub" / "b.m4a").write_bytes(b"b")
+        await settle()
+        assert events == [("added", "a.m4a"), ("added", "b.m4a")]
+
+        events.clear()
+        (tmp_path / "a.m4a").write_bytes(b"aa")
+        os.rename(tmp_path / "sub" / "b.m4a", tmp_path / "c.m4a")
+        await settle()
+        assert events == [("modified", "a.m4a"), ("removed", "b.m4a"), ("added", "c.m4a")]
+        w.stop()
+
+    asyncio.run(run())